@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Архив спотов: всё, что пришло с кластера (после dedup), дописывается
+в отдельный SQLite-файл config.ARCHIVE_PATH.
+
+Секции — сутки UTC, на каждые сутки две таблицы:
+    spots_ГГГГММДД(key, ts, callsign, freq, mode, band, rda, text, spotter, time)
+        key — Spot.key (INTEGER PRIMARY KEY), индексы (callsign, ts), (band, ts);
+    rda_ГГГГММДД(rda, ts, key) — строка на каждый RDA-код спота,
+        WITHOUT ROWID, ключ (rda, ts, key).
+Запрос идёт по секциям запрошенных дней от новых к старым, в каждой —
+поиск по индексу; срок хранения (ARCHIVE_DAYS) соблюдается удалением
+целых секций (DROP TABLE), а не DELETE по строкам.
+
+Запись — вне горячего пути: add() только кладёт спот в буфер, фоновая
+задача сбрасывает его пачкой одной транзакцией (ARCHIVE_FLUSH_BATCH
+спотов или раз в ARCHIVE_FLUSH_SEC), как dedup-кэш в storage.py.
+
+Файл не зависит от DB_BACKEND: это локальная лента кластера того
+процесса, который её принимает (хаб в fanout.py).
+"""
+
+import asyncio
+import logging
+import re
+import time
+from itertools import groupby
+from typing import Iterable
+
+import aiosqlite
+
+import spots
+
+log = logging.getLogger("RDA-bot.archive")
+
+PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-32000;
+PRAGMA temp_store=MEMORY;
+"""
+
+_PART_RE = re.compile(r"spots_(\d{8})")
+
+COLUMNS = "ts, callsign, freq, mode, band, rda, text, spotter, time"
+
+
+def day_of(ts: float) -> int:
+    """Сутки UTC как число ГГГГММДД — имя секции"""
+    return int(time.strftime("%Y%m%d", time.gmtime(ts)))
+
+
+def _schema(day: int) -> str:
+    return f"""
+CREATE TABLE IF NOT EXISTS spots_{day}(
+  key      INTEGER PRIMARY KEY,
+  ts       INTEGER NOT NULL,
+  callsign TEXT NOT NULL,
+  freq     REAL,
+  mode     TEXT,
+  band     TEXT,
+  rda      TEXT,
+  text     TEXT,
+  spotter  TEXT,
+  time     TEXT
+);
+CREATE INDEX IF NOT EXISTS spots_{day}_call ON spots_{day}(callsign, ts);
+CREATE INDEX IF NOT EXISTS spots_{day}_band ON spots_{day}(band, ts);
+CREATE TABLE IF NOT EXISTS rda_{day}(
+  rda TEXT NOT NULL,
+  ts  INTEGER NOT NULL,
+  key INTEGER NOT NULL,
+  PRIMARY KEY(rda, ts, key)
+) WITHOUT ROWID;
+"""
+
+
+class Archive:
+    def __init__(self, path: str, days: int = 30, flush_batch: int = 500,
+                 flush_sec: float = 5.0):
+        self.path = path
+        self.days = days
+        self.flush_batch = flush_batch
+        self.flush_sec = flush_sec
+        self._db: aiosqlite.Connection | None = None
+        self._lock = asyncio.Lock()
+        self._parts: set[int] = set()           # существующие секции
+        self._buf: list[spots.Spot] = []
+        self._task: asyncio.Task | None = None
+        self._full = asyncio.Event()            # буфер набрал flush_batch
+        self.written = 0
+        self.dropped = 0                        # удалённых по сроку секций
+
+    def __len__(self) -> int:
+        return len(self._buf)
+
+    async def _open(self) -> aiosqlite.Connection:
+        if self._db is None:
+            db = await aiosqlite.connect(self.path, timeout=30, isolation_level=None,
+                                         cached_statements=256)
+            await db.executescript(PRAGMAS)
+            cur = await db.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            self._parts = {int(m.group(1)) for (name,) in await cur.fetchall()
+                           if (m := _PART_RE.fullmatch(name))}
+            self._db = db
+        return self._db
+
+    async def close(self):
+        await self.flush()
+        async with self._lock:
+            if self._db is not None:
+                await self._db.close()
+                self._db = None
+
+    # ───── запись ─────
+    def add(self, s: spots.Spot):
+        self._buf.append(s)
+        if len(self._buf) >= self.flush_batch:
+            self._full.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._writer())
+
+    async def _writer(self):
+        # пачка по заполнению (add будит) или раз в flush_sec; пока есть что писать
+        while self._buf:
+            if len(self._buf) < self.flush_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_sec)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("archive flush")
+                return
+
+    async def flush(self):
+        """Буфер — одной транзакцией; заодно удаляет секции старше срока"""
+        batch, self._buf = self._buf, []
+        if batch:
+            await self.write(batch)
+
+    async def write(self, batch: Iterable[spots.Spot]):
+        async with self._lock:
+            db = await self._open()
+            await db.execute("BEGIN")
+            try:
+                n = 0
+                for day, group in groupby(batch, lambda s: day_of(s.ts)):
+                    group = list(group)
+                    if day not in self._parts:
+                        # по одному выражению: executescript закоммитил бы транзакцию
+                        for stmt in _schema(day).split(";"):
+                            if stmt.strip():
+                                await db.execute(stmt)
+                        self._parts.add(day)
+                    await db.executemany(
+                        f"INSERT OR IGNORE INTO spots_{day}(key, {COLUMNS}) "
+                        f"VALUES(?,?,?,?,?,?,?,?,?,?)",
+                        [(s.key, int(s.ts), s.callsign, s.freq, s.mode, s.band, s.rda,
+                          s.text, s.spotter, s.time) for s in group])
+                    await db.executemany(
+                        f"INSERT OR IGNORE INTO rda_{day}(rda, ts, key) VALUES(?,?,?)",
+                        [(c, int(s.ts), s.key) for s in group for c in set(s.codes)])
+                    n += len(group)
+                await self._retire(db)
+            except BaseException:
+                await db.execute("ROLLBACK")
+                raise
+            await db.execute("COMMIT")
+            self.written += n
+
+    async def _retire(self, db: aiosqlite.Connection):
+        cutoff = day_of(time.time() - self.days * 86400)
+        for day in sorted(d for d in self._parts if d < cutoff):
+            await db.execute(f"DROP TABLE IF EXISTS rda_{day}")
+            await db.execute(f"DROP TABLE IF EXISTS spots_{day}")
+            self._parts.discard(day)
+            self.dropped += 1
+            log.info("archive: partition %s dropped (older than %s days)", day, self.days)
+
+    # ───── чтение ─────
+    async def query(self, rda: str | None = None, callsign: str | None = None,
+                    band: str | None = None, days: int = 7, limit: int = 20,
+                    now: float | None = None) -> tuple[dict[int, int], list[tuple]]:
+        """За последние days суток: ({сутки: число спотов}, последние limit
+        спотов — кортежи (COLUMNS), новые первыми). Поиск по индексу
+        RDA, позывного или диапазона — что задано, в этом порядке."""
+        if not (rda or callsign or band):
+            raise ValueError("rda, callsign or band required")
+        await self.flush()                      # свежий хвост буфера — тоже в ответ
+        since = int((now or time.time()) - days * 86400)
+        per_day: dict[int, int] = {}
+        rows: list[tuple] = []
+        async with self._lock:
+            db = await self._open()
+            for day in sorted((d for d in self._parts if d >= day_of(since)), reverse=True):
+                if rda:
+                    src = f"rda_{day} r JOIN spots_{day} s ON s.key = r.key"
+                    where, args, order = ["r.rda = ?", "r.ts >= ?"], [rda, since], "r.ts"
+                else:
+                    idx = "call" if callsign else "band"
+                    src = f"spots_{day} s INDEXED BY spots_{day}_{idx}"
+                    where, args, order = ["s.ts >= ?"], [since], "s.ts"
+                for col, val in (("callsign", callsign), ("band", band)):
+                    if val:
+                        where.append(f"s.{col} = ?")
+                        args.append(val)
+                src += " WHERE " + " AND ".join(where)
+                cur = await db.execute(f"SELECT count(*) FROM {src}", args)
+                (n,) = await cur.fetchone()
+                if not n:
+                    continue
+                per_day[day] = n
+                if len(rows) < limit:
+                    cur = await db.execute(
+                        f"SELECT {', '.join('s.' + c for c in COLUMNS.split(', '))} "
+                        f"FROM {src} ORDER BY {order} DESC LIMIT ?", args + [limit - len(rows)])
+                    rows += await cur.fetchall()
+        return per_day, rows
+
+    def partitions(self) -> list[int]:
+        return sorted(self._parts)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Архив спотов (archive.py): запросы /history на миллионах записей.
+
+1) Сверка на небольшом архиве: случайные запросы (RDA, позывной, с
+   диапазоном и без, 1–30 суток) против перебора тех же спотов в
+   памяти — число по суткам и последние записи. Расхождение — код 1.
+2) Масштаб: архив из N спотов за --days суток (запись пачками через
+   Archive.write), затем мс на запрос /history за 7 и 30 суток (p50/p95)
+   по RDA и по позывному. Время должно расти с числом найденных
+   спотов, а не с размером архива.
+3) Срок хранения: удаление суточной секции DROP TABLE против DELETE
+   тех же строк (оба в откатываемой транзакции).
+
+    python bench/archive_bench.py --spots 100000,1000000,3000000
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+
+import archive
+import seed
+import spots
+from rda_catalog import catalog
+
+MODES = ("CW", "SSB", "DIGI", "FT8")
+NOW = time.time()
+
+
+def gen(n: int, days: int, codes: list[str], calls: list[str], rnd: random.Random):
+    """n спотов, от старых к новым, равномерно за days суток"""
+    step = days * 86400 / n
+    t0 = NOW - days * 86400
+    for i in range(n):
+        k = 1 if rnd.random() < 0.9 else 2
+        yield spots.Spot(
+            rnd.choice(calls), "0000Z", round(rnd.uniform(1800, 29700), 1),
+            rnd.choice(MODES), " ".join(rnd.sample(codes, k)), "", "UA0BENCH",
+            i, t0 + i * step + rnd.random() * step,
+        )
+
+
+async def build(path: str, n: int, days: int, codes, calls, rnd, keep: bool = False):
+    ar = archive.Archive(path, days=days + 1)
+    kept = []
+    batch = []
+    t0 = time.perf_counter()
+    for s in gen(n, days, codes, calls, rnd):
+        batch.append(s)
+        if len(batch) == 50000:
+            await ar.write(batch)
+            kept += batch if keep else []
+            batch = []
+    await ar.write(batch)
+    kept += batch if keep else []
+    return ar, kept, time.perf_counter() - t0
+
+
+def reference(kept, rda=None, callsign=None, band=None, days=7):
+    since = int(NOW - days * 86400)
+    hit = [s for s in kept if int(s.ts) >= since
+           and (not rda or rda in s.codes) and (not callsign or s.callsign == callsign)
+           and (not band or s.band == band)]
+    per_day: dict[int, int] = {}
+    for s in hit:
+        d = archive.day_of(s.ts)
+        per_day[d] = per_day.get(d, 0) + 1
+    last = sorted(hit, key=lambda s: -int(s.ts))
+    return per_day, last
+
+
+async def verify(path: str, codes, calls, rnd: random.Random, cases: int) -> int:
+    ar, kept, _ = await build(path, 20000, 30, codes[:200], calls[:300], rnd, keep=True)
+    bad = 0
+    for _ in range(cases):
+        q = {}
+        r = rnd.random()
+        if r < 0.45:
+            q["rda"] = rnd.choice(codes[:200])
+        elif r < 0.9:
+            q["callsign"] = rnd.choice(calls[:300])
+        else:
+            q["rda"], q["callsign"] = rnd.choice(codes[:200]), rnd.choice(calls[:300])
+        if rnd.random() < 0.3:
+            q["band"] = rnd.choice(spots.BANDS)[2]
+        days = rnd.choice((1, 3, 7, 30))
+        per_day, rows = await ar.query(**q, days=days, now=NOW)
+        ref_days, ref_rows = reference(kept, **q, days=days)
+        # при равных ts порядок внутри секунды не задан — сверяем по ts
+        ok = per_day == ref_days and [r[0] for r in rows] == [int(s.ts) for s in ref_rows[:20]]
+        if not ok:
+            bad += 1
+            if bad <= 3:
+                print(f"MISMATCH {q} days={days}: {per_day} vs {ref_days}")
+    await ar.close()
+    return bad
+
+
+def _pct(data, q):
+    s = sorted(data)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+async def scale(path: str, n: int, days: int, codes, calls, rnd, queries: int) -> dict:
+    ar, _, t_build = await build(path, n, days, codes, calls, rnd)
+    out = {"spots": n, "build_s": t_build, "mib": os.path.getsize(path) / 2 ** 20}
+    for kind in ("rda", "callsign"):
+        for d in (7, 30):
+            ms = []
+            for _ in range(queries):
+                q = {kind: rnd.choice(codes if kind == "rda" else calls)}
+                t0 = time.perf_counter()
+                await ar.query(**q, days=d, now=NOW)
+                ms.append((time.perf_counter() - t0) * 1000)
+            out[f"{kind}/{d}d p50"] = _pct(ms, 0.5)
+            out[f"{kind}/{d}d p95"] = _pct(ms, 0.95)
+    part = ar.partitions()[len(ar.partitions()) // 2]
+    await ar.close()
+    con = sqlite3.connect(path, isolation_level=None)
+    rows = con.execute(f"SELECT count(*) FROM spots_{part}").fetchone()[0]
+    for label, sql in (("drop_ms", f"DROP TABLE rda_{part}; DROP TABLE spots_{part}"),
+                       # WHERE отключает truncate-оптимизацию: удаление построчное
+                       ("delete_ms", f"DELETE FROM rda_{part} WHERE ts >= 0; "
+                                     f"DELETE FROM spots_{part} WHERE ts >= 0")):
+        con.execute("BEGIN")
+        t0 = time.perf_counter()
+        for stmt in sql.split("; "):
+            con.execute(stmt)
+        out[label] = (time.perf_counter() - t0) * 1000
+        con.execute("ROLLBACK")
+    con.close()
+    out["rows/day"] = rows
+    return out
+
+
+async def main_async(a) -> int:
+    rnd = random.Random(11)
+    catalog.load([str(ROOT / "RDA_list_2025.json")])
+    codes = seed.rda_codes()
+    calls = sorted({f"R{rnd.randrange(10)}{chr(65 + rnd.randrange(26))}"
+                    f"{chr(65 + rnd.randrange(26))}{chr(65 + rnd.randrange(26))}"
+                    for _ in range(a.calls)})
+    with tempfile.TemporaryDirectory() as tmp:
+        bad = await verify(os.path.join(tmp, "verify.db"), codes, calls, rnd, a.cases)
+        print(f"verify: {a.cases - bad}/{a.cases} queries equal to brute force")
+        cols = ["spots", "build_s", "mib", "rda/7d p50", "rda/7d p95", "rda/30d p95",
+                "callsign/7d p50", "callsign/30d p95", "rows/day", "drop_ms", "delete_ms"]
+        print("\n" + "".join(f"{c:>17}" for c in cols))
+        for n in (int(x) for x in a.spots.split(",")):
+            r = await scale(os.path.join(tmp, f"a{n}.db"), n, a.days, codes, calls, rnd,
+                            a.queries)
+            print("".join(f"{r[c]:>17.1f}" if isinstance(r[c], float) else f"{r[c]:>17}"
+                          for c in cols))
+    return 1 if bad else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--spots", default="100000,1000000", help="размеры архива через запятую")
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--calls", type=int, default=5000, help="разных позывных")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--cases", type=int, default=300)
+    return asyncio.run(main_async(ap.parse_args()))
+
+if __name__ == "__main__":
+    sys.exit(main())
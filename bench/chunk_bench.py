@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Разбиение сообщений: chunker.split_html против прежнего split_html из
+bot.py (по строкам, затем sanitize_html).
+
+1) Свойства на случайных текстах (эмодзи вне BMP, &<>", пары <b>/<i>,
+   длинные строки и слова, непарные теги): каждый кусок не длиннее
+   лимита в UTF-16, теги в куске парные и вложены правильно, сущности
+   целые, видимый текст сохраняется (теряются только пробелы/переводы
+   строк в местах разрыва), короткий текст — ровно как раньше.
+   Нарушение — код 1.
+2) Пропускная способность и число сообщений на анонсах из
+   bench/fixtures/ и на дайджестах; для прежнего способа — сколько
+   кусков Telegram бы отверг (длиннее 4096 UTF-16).
+
+    python bench/chunk_bench.py [--cases 3000] [--repeat 20]
+"""
+
+import argparse
+import html
+import pathlib
+import random
+import re
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import chunker
+import rda_parser
+from chunker import utf16_len
+
+TAG_RE = re.compile(r"</?[bi]>")
+ENTITY_RE = re.compile(r"&(?!(?:amp|lt|gt|quot|#x27);)")
+ALPHABET = "abcxyz АБВ ёж 0123 &<>\"' 😀🇷🇺 \n"
+
+
+def legacy(text: str, limit: int = 4096) -> list[str]:
+    """split_html из bot.py до chunker.py"""
+    def sanitize_html(t: str) -> str:
+        esc = html.escape(t)
+        for tag in ("b", "i"):
+            esc = esc.replace(f"&lt;{tag}&gt;", f"<{tag}>")
+            esc = esc.replace(f"&lt;/{tag}&gt;", f"</{tag}>")
+        return esc
+
+    chunks: list[str] = []
+    for line in text.split("\n"):
+        if not chunks or len(chunks[-1]) + len(line) + 1 > limit:
+            chunks.append(line)
+        else:
+            chunks[-1] += "\n" + line
+    return [sanitize_html(c) for c in chunks]
+
+
+# ───── свойства ─────
+def rand_text(rnd: random.Random) -> str:
+    out = []
+    for _ in range(rnd.choice((1, 5, 50, 400))):
+        r = rnd.random()
+        if r < 0.1:
+            word = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randrange(1, 40)))
+            tag = rnd.choice("bi")
+            out.append(f"<{tag}>{word}</{tag}>")
+        elif r < 0.12:
+            out.append(rnd.choice(("<b>", "</i>", "<x>", "&amp;", "<b><b>")))   # мусор
+        elif r < 0.14:
+            out.append(rnd.choice("aЖ😀&") * rnd.randrange(100, 3000))          # длинное слово
+        else:
+            out.append("".join(rnd.choice(ALPHABET) for _ in range(rnd.randrange(1, 30))))
+        out.append(rnd.choice((" ", " ", "\n", "")))
+    return "".join(out)
+
+
+def balanced(chunk: str) -> bool:
+    stack = []
+    for t in TAG_RE.findall(chunk):
+        if t[1] != "/":
+            if t[1] in stack:
+                return False
+            stack.append(t[1])
+        elif not stack or stack.pop() != t[2]:
+            return False
+    return not stack
+
+
+def visible(s: str) -> str:
+    return re.sub(r"[ \n]", "", html.unescape(TAG_RE.sub("", s)))
+
+
+def expected_visible(text: str) -> str:
+    """Видимый текст по правилам chunker: тег настоящий, если открывает
+    ещё не открытый или закрывает последний открытый; прочие — текст"""
+    out, stack, pos = [], [], 0
+    for m in TAG_RE.finditer(text):
+        t = m.group()
+        if t[1] != "/" and t[1] not in stack:
+            stack.append(t[1])
+        elif t[1] == "/" and stack and stack[-1] == t[2]:
+            stack.pop()
+        else:
+            continue
+        out.append(text[pos:m.start()])
+        pos = m.end()
+    out.append(text[pos:])
+    return re.sub(r"[ \n]", "", "".join(out))
+
+
+def check(text: str, limit: int) -> str | None:
+    chunks = chunker.split_html(text, limit)
+    for c in chunks:
+        if utf16_len(c) > limit:
+            return f"chunk of {utf16_len(c)} > {limit}"
+        if not balanced(c):
+            return "unbalanced tags"
+        if ENTITY_RE.search(TAG_RE.sub("", c)) or "<" in TAG_RE.sub("", c):
+            return "broken entity or raw <"
+    if visible("".join(chunks)) != expected_visible(text):
+        return "text changed"
+    old = legacy(text, 10 ** 9)
+    if (len(old) == 1 and utf16_len(old[0]) <= limit and balanced(old[0])
+            and not old[0].startswith(("\n", " ")) and chunks != old):
+        return "short text differs from legacy"
+    return None
+
+
+# ───── скорость ─────
+def corpus() -> dict[str, str]:
+    items = []
+    for f in sorted((ROOT / "bench" / "fixtures").glob("*.html")):
+        page = f.read_text(encoding="utf-8")
+        items += rda_parser._parse(rda_parser._extract_fragment(page))
+    ann = rda_parser.render(items)
+    spot = ("🆕 <b>R0BI</b> • CW • 14025.0kHz\n🏷 RDA: <b>AD-01</b>\n"
+            "✏️ tnx & 73 <QSL via R0BI>\n👤 UA0AAA • ⏰ 1200Z")
+    return {
+        "announcements": ann,
+        "digest x30": "🗞 <b>Дайджест</b>: 30 спот(ов)\n\n" + "\n\n".join([spot] * 30),
+        "one long line": "&<>😀 " * 3000,
+    }
+
+
+def bench(name: str, text: str, repeat: int):
+    res = {}
+    for fn in (legacy, chunker.split_html):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn(text)
+            best = min(best, time.perf_counter() - t0)
+        res[fn] = (best, out)
+    (t_old, old), (t_new, new) = res[legacy], res[chunker.split_html]
+    mb = len(text.encode()) / 1e6
+    bad = sum(utf16_len(c) > chunker.LIMIT for c in old)
+    print(f"{name:<16}{utf16_len(text):>9}{mb / t_old:>10.1f}{mb / t_new:>10.1f}"
+          f"{len(old):>7}{bad:>6}{len(new):>7}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=3000)
+    ap.add_argument("--repeat", type=int, default=20)
+    a = ap.parse_args()
+    rnd = random.Random(5)
+    failed = 0
+    for n in range(a.cases):
+        text = rand_text(rnd)
+        limit = rnd.choice((64, 200, 1000, chunker.LIMIT))
+        err = check(text, limit)
+        if err:
+            failed += 1
+            if failed <= 5:
+                print(f"case {n} (limit {limit}): {err}: {text[:80]!r}…")
+    print(f"properties: {a.cases - failed}/{a.cases} ok")
+
+    print(f"\n{'text':<16}{'UTF-16':>9}{'old MB/s':>10}{'new MB/s':>10}"
+          f"{'old':>7}{'rej':>6}{'new':>7}")
+    for name, text in corpus().items():
+        bench(name, text, a.repeat)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Рассылка при «плохих» чатах: delivery.Scheduler с учётом исходов по
+чату против того же планировщика без него.
+
+--chats чатов, --rounds рассылок всем (как спот или анонс). Bot API —
+заглушка в процессе, ответ за --send-ms:
+  • blocked — с раунда 2 бот заблокирован (Forbidden) или чат удалён
+    (chat not found);
+  • flaky   — раунды 3–8 (не дальше последнего) запрос висит --hang-ms и
+    падает сетевой ошибкой, дальше чат снова в порядке.
+После последнего раунда — дождаться, пока пауза предохранителей истечёт,
+и разослать контрольный раунд всем.
+Итог: запросов к API впустую (мёртвым и зависшим чатам), время раунда
+до последнего здорового чата (среднее, p50, max). Проверки — код 1:
+  • здоровые чаты получили все раунды, «мёртвые» — не больше одного
+    запроса после блокировки, on_dead — ровно по разу на чат;
+  • flaky-чаты получают контрольный раунд (итог не зависит от
+    --chats/--rounds).
+
+    python bench/delivery_bench.py [--chats 2000] [--rounds 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import pathlib
+import random
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError
+
+import delivery
+
+
+class StubBot:
+    """send_message по ролям чатов; текст — номер раунда"""
+
+    def __init__(self, roles: dict[int, str], send: float, hang: float, rounds: int):
+        self.roles = roles
+        self.flaky_until = min(8, rounds)
+        self.send = send
+        self.hang = hang
+        self.calls: dict[str, int] = {}
+        self.wasted = 0                         # запросы, которые не могли дойти
+        self.got: dict[int, set[int]] = {}
+        self.done_at: dict[int, float] = {}     # раунд → последний здоровый чат
+
+    async def send_message(self, cid: int, text: str, **kw):
+        role, rnd = self.roles[cid], int(text)
+        self.calls[role] = self.calls.get(role, 0) + 1
+        if role in ("forbidden", "not_found") and rnd >= 2:
+            self.wasted += 1
+            await asyncio.sleep(self.send)
+            if role == "forbidden":
+                raise TelegramForbiddenError(None, "Forbidden: bot was blocked by the user")
+            raise TelegramBadRequest(None, "Bad Request: chat not found")
+        if role == "flaky" and 3 <= rnd <= self.flaky_until:
+            self.wasted += 1
+            await asyncio.sleep(self.hang)
+            raise TelegramNetworkError(None, "Request timeout error")
+        await asyncio.sleep(self.send)
+        self.got.setdefault(cid, set()).add(rnd)
+        if role == "ok":
+            self.done_at[rnd] = time.perf_counter()
+        return True
+
+
+async def run(a, tracking: bool) -> dict:
+    rnd = random.Random(7)
+    roles = {}
+    for cid in range(1, a.chats + 1):
+        r = rnd.random()
+        roles[cid] = ("forbidden" if r < 0.04 else "not_found" if r < 0.05
+                      else "flaky" if r < 0.07 else "ok")
+    bot = StubBot(roles, a.send_ms / 1000, a.hang_ms / 1000, a.rounds)
+    dead: list[int] = []
+    sched = delivery.Scheduler(bot, workers=a.workers, rate=1e9, chat_rate=1e9, chat_burst=1e9,
+                               report_sec=0, trip_after=3 if tracking else 10 ** 9,
+                               backoff_base=a.backoff, backoff_cap=a.backoff * 8,
+                               on_dead=lambda cid, why: dead.append(cid))
+    if not tracking:
+        delivery.gone_reason = lambda e: None   # как до учёта исходов
+    sched.start()
+    spans = []
+    for r in range(1, a.rounds + 1):
+        t0 = time.perf_counter()
+        for cid in roles:
+            sched.submit(cid, [str(r)], delivery.Lane.SPOT, wait=False)
+        await sched.join()
+        spans.append(bot.done_at.get(r, t0) - t0)
+        await asyncio.sleep(a.pause_ms / 1000)  # между рассылками
+    # контрольный раунд — когда ни один предохранитель уже не держит паузу
+    while sched.health()["tripped"]:
+        await asyncio.sleep(0.05)
+    last = a.rounds + 1
+    for cid in roles:
+        sched.submit(cid, [str(last)], delivery.Lane.SPOT, wait=False)
+    await sched.join()
+    await sched.stop()
+
+    gone = [c for c, role in roles.items() if role in ("forbidden", "not_found")]
+    ok = [c for c, role in roles.items() if role == "ok"]
+    flaky = [c for c, role in roles.items() if role == "flaky"]
+    s = sorted(spans)
+    return {
+        "wasted": bot.wasted,
+        "calls": sum(bot.calls.values()),
+        "mean": sum(s) / len(s) * 1000,
+        "p50": s[len(s) // 2] * 1000,
+        "max": s[-1] * 1000,
+        "ok_all": all(bot.got.get(c) == set(range(1, last + 1)) for c in ok),
+        "gone_once": (sorted(dead) == sorted(gone)) if tracking else True,
+        "gone_calls": bot.calls.get("forbidden", 0) + bot.calls.get("not_found", 0)
+                      - len(gone),              # раунд 1 доходит
+        "flaky_back": sum(last in bot.got.get(c, ()) for c in flaky),
+        "flaky": len(flaky),
+        "health": sched.health(),
+        "skipped": sched.skipped,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chats", type=int, default=2000)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--send-ms", type=float, default=2)
+    ap.add_argument("--hang-ms", type=float, default=300, help="зависший запрос до сетевой ошибки")
+    ap.add_argument("--pause-ms", type=float, default=200, help="между рассылками")
+    ap.add_argument("--backoff", type=float, default=0.5, help="первая пауза предохранителя, с")
+    a = ap.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    res = {}
+    for name, tracking in (("tracking", True), ("none", False)):
+        res[name] = asyncio.run(run(a, tracking))
+    print(f"{'mode':<10}{'calls':>8}{'wasted':>8}{'skipped':>9}{'round ms':>10}{'p50':>7}"
+          f"{'max':>7}{'flaky back':>12}")
+    for name, r in res.items():
+        print(f"{name:<10}{r['calls']:>8}{r['wasted']:>8}{r['skipped']:>9}{r['mean']:>10.0f}"
+              f"{r['p50']:>7.0f}{r['max']:>7.0f}{r['flaky_back']:>7}/{r['flaky']}")
+    t = res["tracking"]
+    print(f"tracking: {t['health']}, calls to gone chats after blocking: {t['gone_calls']}")
+    ok = t["ok_all"] and res["none"]["ok_all"] and t["gone_once"]
+    ok &= t["gone_calls"] <= t["health"]["dead"]   # один запрос, который и выяснил
+    ok &= t["flaky_back"] == t["flaky"]
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная замена Telegram Bot API для нагрузочных прогонов.
+Принимает любые методы по /bot<token>/<method>, sendMessage записывает
+и отвечает правдоподобным Message. Если в тексте есть метки lb<ns>
+(их ставит fake_cluster.py — время отправки спота, time.time_ns()),
+считает задержку спот → доставка.
+
+    python bench/fake_botapi.py --port 9200 [--delay-ms 40]
+
+    GET  /stats  — счётчики, sends/s, перцентили задержки (JSON)
+    POST /reset  — обнулить статистику
+    POST /push   — апдейт (JSON без update_id) в очередь getUpdates:
+                   long polling отдаёт его сразу, как Telegram
+"""
+
+import argparse
+import asyncio
+import itertools
+import re
+import time
+from array import array
+
+from aiohttp import web
+
+MARK_RE = re.compile(r"lb(\d{19})")
+
+_ME = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+def _pct(data, q: float) -> float:
+    if not data:
+        return 0.0
+    s = sorted(data)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sends = 0
+        self.spots = 0                 # меток (спот может прийти в дайджесте)
+        self.chats: set[int] = set()
+        self.bytes = 0
+        self.first = 0.0
+        self.last = 0.0
+        self.lat = array("d")          # секунды
+        self.other: dict[str, int] = {}
+        self.on_send = None            # on_send(chat_id) — для замеров в том же процессе
+
+    def record(self, cid: int, text: str):
+        now = time.time_ns()
+        if not self.sends:
+            self.first = now / 1e9
+        self.last = now / 1e9
+        self.sends += 1
+        self.chats.add(cid)
+        self.bytes += len(text.encode())
+        for ns in MARK_RE.findall(text):
+            self.spots += 1
+            self.lat.append((now - int(ns)) / 1e9)
+        if self.on_send is not None:
+            self.on_send(cid)
+
+    def stats(self) -> dict:
+        span = self.last - self.first
+        return {
+            "sends": self.sends,
+            "spots": self.spots,
+            "chats": len(self.chats),
+            "bytes": self.bytes,
+            "span_sec": span,
+            "sends_per_sec": self.sends / span if span > 0 else 0.0,
+            "lat_p50": _pct(self.lat, 0.5),
+            "lat_p95": _pct(self.lat, 0.95),
+            "lat_p99": _pct(self.lat, 0.99),
+            "lat_max": max(self.lat, default=0.0),
+            "other": self.other,
+        }
+
+
+class Updates:
+    """Очередь апдейтов для getUpdates: offset подтверждает полученные"""
+
+    def __init__(self):
+        self.items: list[dict] = []
+        self.ids = itertools.count(1)
+        self.arrived = asyncio.Event()
+
+    def push(self, update: dict):
+        self.items.append({"update_id": next(self.ids), **update})
+        self.arrived.set()
+
+    async def get(self, offset: int, timeout: float) -> list[dict]:
+        self.items = [u for u in self.items if u["update_id"] >= offset]
+        if not self.items:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.items)
+
+
+def make_app(delay: float = 0.0) -> web.Application:
+    rec = Recorder()
+    updates = Updates()
+    ids = itertools.count(1)
+
+    async def method(request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        data = await request.post() if request.can_read_body else {}
+        if name.lower() == "getupdates":
+            rec.other[name] = rec.other.get(name, 0) + 1
+            # long polling — как у Telegram: ответ с первым апдейтом или по timeout
+            got = await updates.get(int(data.get("offset", 0)), min(float(data.get("timeout", 0)), 30))
+            if delay:
+                await asyncio.sleep(delay)      # ответ ещё идёт по сети
+            return web.json_response({"ok": True, "result": got})
+        if delay:
+            await asyncio.sleep(delay)
+        if name.lower() == "sendmessage":
+            cid, text = int(data["chat_id"]), data.get("text", "")
+            rec.record(cid, text)
+            result = {
+                "message_id": next(ids), "date": int(time.time()),
+                "chat": {"id": cid, "type": "private"}, "text": text,
+            }
+        else:
+            rec.other[name] = rec.other.get(name, 0) + 1
+            result = _ME if name.lower() == "getme" else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(rec.stats())
+
+    async def reset(request: web.Request) -> web.Response:
+        rec.reset()
+        return web.json_response({"ok": True})
+
+    async def push(request: web.Request) -> web.Response:
+        updates.push(await request.json())
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app["recorder"] = rec
+    app["updates"] = updates
+    app.router.add_post("/push", push)
+    app.router.add_get("/stats", stats)
+    app.router.add_post("/reset", reset)
+    app.router.add_route("*", "/bot{token}/{method}", method)
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9200)
+    ap.add_argument("--delay-ms", type=float, default=0.0,
+                    help="искусственная задержка ответа (сеть до Telegram)")
+    a = ap.parse_args()
+    web.run_app(make_app(a.delay_ms / 1000), host=a.host, port=a.port,
+                print=None, access_log=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный Socket.IO-сервер вместо DX-кластера для нагрузочных прогонов.
+Шлёт события new_spot в том же формате, что разбирает cluster_loop:
+
+    callsign|time|freq|mode|?|rda|?|text|spotter
+
+В поле text ставится метка lb<ns> (time.time_ns() в момент отправки) —
+по ней fake_botapi.py считает задержку спот → доставка. Отправка
+начинается, когда подключится первый клиент.
+
+    python bench/fake_cluster.py --port 9100 --rate 50 --duration 30
+    python bench/fake_cluster.py --port 9100 --replay spots.tsv --speed 10
+    python bench/fake_cluster.py --record spots.tsv --url <кластер> --duration 600
+    python bench/fake_cluster.py --port 9100 --telnet 7300
+
+--telnet — ещё и telnet-узел (sources.TelnetSource): приглашение
+«login:», затем тот же поток строками «DX de СПОТТЕР: частота позывной
+мода RDA коды текст ЧЧММZ».
+
+Запись (--record) — строки «смещение_сек<TAB>сообщение» с настоящего
+кластера; --replay проигрывает их с ускорением --speed.
+GET /stats — {"emitted", "done", "clients"}.
+"""
+
+import argparse
+import asyncio
+import json
+import pathlib
+import random
+import sys
+import time
+
+import socketio
+from aiohttp import web
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+MODES = ("CW", "CW", "SSB", "SSB", "DIGI", "FT8")
+
+
+def _mark(text: str = "") -> str:
+    return f"lb{time.time_ns()} {text}".rstrip()
+
+
+def synthetic(rate: float, duration: float, rnd: random.Random):
+    """(смещение, сообщение без метки) — равномерный поток rate спотов/с"""
+    codes = sorted(json.loads((ROOT / "RDA_list_2025.json").read_text(encoding="utf-8")))
+    for seq in range(int(rate * duration)):
+        freq = 1800 + (seq * 7919) % 280000 / 10        # уникальные частоты → без dedup
+        parts = [
+            f"R{rnd.randrange(10)}{chr(65 + rnd.randrange(26))}{chr(65 + rnd.randrange(26))}",
+            time.strftime("%H%MZ", time.gmtime()),
+            f"{freq:.1f}", rnd.choice(MODES), "?", rnd.choice(codes), "?",
+            "", f"UA{rnd.randrange(10)}BENCH",
+        ]
+        yield seq / rate, parts
+
+
+def dx_line(parts: list[str]) -> str:
+    """Поля строки Socket.IO → строка telnet-узла «DX de …»"""
+    call, hhmm, freq, mode, _, rda, _, text, spotter = parts[:9]
+    comment = f"{mode} RDA {rda} {text}".rstrip()
+    return f"DX de {spotter + ':':<10}{freq:>9}  {call:<12} {comment:<30} {hhmm[:4]}Z"
+
+
+def recorded(path: pathlib.Path, speed: float):
+    with path.open(encoding="utf-8") as fh:
+        for ln in fh:
+            off, _, msg = ln.rstrip("\n").partition("\t")
+            parts = msg.split("|")
+            if len(parts) >= 9:
+                yield float(off) / speed, parts
+
+
+class Cluster:
+    def __init__(self, source):
+        self.source = source
+        self.sio = socketio.AsyncServer(async_mode="aiohttp", cors_allowed_origins="*")
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.app.router.add_get("/stats", self.stats)
+        self.clients = 0
+        self.telnet: set[asyncio.StreamWriter] = set()
+        self.emitted = 0
+        self.done = False
+        self._connected = asyncio.Event()
+        self.sio.on("connect", self._on_connect)
+        self.sio.on("disconnect", self._on_disconnect)
+
+    async def _on_connect(self, sid, environ, auth=None):
+        self.clients += 1
+        self._connected.set()
+
+    async def _on_disconnect(self, sid, *args):
+        self.clients -= 1
+
+    async def telnet_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"Welcome to the bench DX cluster\r\nlogin: ")
+        call = await reader.readline()
+        if not call:
+            writer.close()
+            return
+        writer.write(b"Hello " + call.strip() + b"\r\n")
+        self.telnet.add(writer)
+        self._connected.set()
+        try:
+            await reader.read()                 # до отключения клиента
+        except (ConnectionError, asyncio.CancelledError):
+            pass                                # остановка сервера
+        finally:
+            self.telnet.discard(writer)
+            writer.close()
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"emitted": self.emitted, "done": self.done,
+             "clients": self.clients + len(self.telnet)}
+        )
+
+    async def run(self):
+        await self._connected.wait()
+        await asyncio.sleep(0.5)            # клиент успевает подписаться на события
+        t0 = time.monotonic()
+        for off, parts in self.source:
+            delay = t0 + off - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            parts[7] = _mark(parts[7])
+            await self.sio.emit("new_spot", "|".join(parts))
+            if self.telnet:
+                data = (dx_line(parts) + "\r\n").encode()
+                for w in list(self.telnet):
+                    w.write(data)
+            self.emitted += 1
+        self.done = True
+
+
+async def record(url: str, out: pathlib.Path, duration: float):
+    sio = socketio.AsyncClient(logger=False, engineio_logger=False)
+    t0 = time.monotonic()
+    n = 0
+    with out.open("w", encoding="utf-8") as fh:
+        @sio.on("new_spot")
+        async def on_spot(msg: str):
+            nonlocal n
+            fh.write(f"{time.monotonic() - t0:.3f}\t{msg}\n")
+            n += 1
+
+        await sio.connect(url, transports=["websocket"])
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await sio.disconnect()
+    print(f"{out}: {n} spots in {duration:.0f} s")
+
+
+async def serve(a):
+    source = (recorded(a.replay, a.speed) if a.replay
+              else synthetic(a.rate, a.duration, random.Random(a.seed)))
+    cl = Cluster(source)
+    runner = web.AppRunner(cl.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, a.host, a.port).start()
+    if a.telnet:
+        await asyncio.start_server(cl.telnet_client, a.host, a.telnet)
+    await cl.run()
+    await asyncio.Event().wait()            # после потока — держим соединение
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--rate", type=float, default=50, help="спотов/с (синтетика)")
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--replay", type=pathlib.Path)
+    ap.add_argument("--speed", type=float, default=1.0, help="ускорение для --replay")
+    ap.add_argument("--telnet", type=int, default=0, help="порт telnet-узла (0 — нет)")
+    ap.add_argument("--record", type=pathlib.Path)
+    ap.add_argument("--url", help="кластер для --record")
+    a = ap.parse_args()
+    try:
+        if a.record:
+            if not a.url:
+                ap.error("--record требует --url")
+            asyncio.run(record(a.url, a.record, a.duration))
+        else:
+            asyncio.run(serve(a))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
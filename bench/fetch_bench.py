@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Условные GET ленты анонсов (rda_parser.Fetcher) против локальной
+заглушки rdaward.ru на aiohttp: страницы — bench/fixtures/, у ответа
+ETag и Last-Modified, совпали If-None-Match/If-Modified-Since — 304.
+
+1) Сценарий, каждый шаг сверяется — заголовки запроса, код ответа,
+   число разборов (Fetcher.parsed) и выдача:
+     первая загрузка      — без условных заголовков, 200, разбор;
+     ничего не менялось   — оба условных заголовка, 304, без разбора,
+                            тот же список;
+     страница изменилась  — 200, но фрагмент с карточками прежний
+     вне фрагмента          (хэш) — без разбора, тот же список;
+     изменился фрагмент   — 200, разбор, выдача как у _parse страницы;
+     снова без изменений  — заголовки уже новой версии, 304.
+   Расхождение — код 1.
+2) Скорость: мс на загрузку по каждому исходу, --repeat раз.
+
+    python bench/fetch_bench.py [--repeat 50]
+"""
+
+import argparse
+import asyncio
+import pathlib
+import socket
+import sys
+import time
+from email.utils import formatdate
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiohttp import web
+
+import rda_parser
+
+FIXTURES = ROOT / "bench" / "fixtures"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Site:
+    """Заглушка: текущая страница, её версия и журнал запросов"""
+
+    def __init__(self, page: str):
+        self.version = 0
+        self.log: list[tuple[str | None, str | None, int]] = []
+        self.publish(page)
+
+    def publish(self, page: str):
+        self.version += 1
+        self.page = page
+        self.etag = f'"v{self.version}"'
+        self.modified = formatdate(1_700_000_000 + self.version * 60, usegmt=True)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        inm = request.headers.get("If-None-Match")
+        ims = request.headers.get("If-Modified-Since")
+        if inm == self.etag or (inm is None and ims == self.modified):
+            status = 304
+            resp = web.Response(status=304, headers={"ETag": self.etag})
+        else:
+            status = 200
+            resp = web.Response(text=self.page, content_type="text/html",
+                                headers={"ETag": self.etag, "Last-Modified": self.modified})
+        self.log.append((inm, ims, status))
+        return resp
+
+
+async def run(a) -> bool:
+    small = (FIXTURES / "rdaward_small.html").read_text(encoding="utf-8")
+    large = (FIXTURES / "rdaward_large.html").read_text(encoding="utf-8")
+    site = Site(small)
+    app = web.Application()
+    app.router.add_get("/", site.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = _free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    f = rda_parser.Fetcher(f"http://127.0.0.1:{port}/")
+
+    ok = True
+    prev: list[dict] | None = None
+
+    async def step(name: str, headers: tuple, status: int, parsed: int, same: bool,
+                   page: str) -> bool:
+        nonlocal prev
+        items = await f.items()
+        inm, ims, got = site.log[-1]
+        want = rda_parser._parse(rda_parser._extract_fragment(page))
+        good = ((inm, ims) == headers and got == status and f.parsed == parsed
+                and (items is prev) == same and items == want)
+        print(f"{name:<24}{inm or '-':>8}{ims[5:16] if ims else '-':>14}{got:>6}"
+              f"{f.parsed:>8}{len(items):>7}  {'ok' if good else 'MISMATCH'}")
+        prev = items
+        return good
+
+    print(f"{'step':<24}{'INM':>8}{'IMS':>14}{'code':>6}{'parsed':>8}{'cards':>7}")
+    ok &= await step("first load", (None, None), 200, 1, False, small)
+    v1 = (site.etag, site.modified)
+    ok &= await step("unchanged", v1, 304, 1, True, small)
+    site.publish(small + f"\n<!-- rendered {time.time()} -->\n")
+    ok &= await step("outside the fragment", v1, 200, 1, True, small)
+    v2 = (site.etag, site.modified)
+    site.publish(large)
+    ok &= await step("fragment changed", v2, 200, 2, False, large)
+    ok &= await step("unchanged again", (site.etag, site.modified), 304, 2, True, large)
+
+    # скорость по исходам
+    async def timed(prepare) -> float:
+        spans = []
+        for _ in range(a.repeat):
+            prepare()
+            t0 = time.perf_counter()
+            await f.items()
+            spans.append(time.perf_counter() - t0)
+        spans.sort()
+        return spans[len(spans) // 2] * 1000
+
+    pages = [large, small]
+
+    def flip_fragment():
+        pages.reverse()
+        site.publish(pages[0])
+
+    def touch():
+        site.publish(site.page.rsplit("\n<!--", 1)[0] + f"\n<!-- {site.version} -->")
+
+    res = {
+        "304": await timed(lambda: None),
+        "same fragment": await timed(touch),
+        "new fragment": await timed(flip_fragment),
+    }
+    print("median ms: " + ", ".join(f"{k} {v:.2f}" for k, v in res.items()))
+    await f.close()
+    await runner.cleanup()
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=50, help="загрузок на каждый исход")
+    a = ap.parse_args()
+    return 0 if asyncio.run(run(a)) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сквозной нагрузочный прогон бота без продакшена:
+fake_cluster.py (Socket.IO, споты) → bot.py (cluster_loop → spot_queue →
+фильтры → delivery) → fake_botapi.py (запись sendMessage).
+
+Для каждого масштаба --users: свежая база (seed.py), отдельные процессы
+кластера, Bot API и бота; бот работает, пока поток не кончится и очереди
+не опустеют (не дольше --drain). Итог — задержка спот → доставка
+(p50/p95/p99), sends/s, пиковая память процесса бота, потери.
+
+    python bench/load_bench.py --users 1000,10000 --rate 50 --duration 30
+    python bench/load_bench.py --users 10000 --replay spots.tsv --speed 10
+    python bench/load_bench.py --users 10000 --unlimited   # без лимитов Telegram
+
+Анонсы (ann_loop) в прогоне не участвуют.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+HERE = pathlib.Path(__file__).resolve().parent
+ROOT = HERE.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(HERE))
+
+import config
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _get_json(url: str) -> dict:
+    async with aiohttp.ClientSession() as s:
+        async with s.get(url) as r:
+            return await r.json()
+
+
+async def _wait_up(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await _get_json(url)
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def _rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ───── процесс бота ─────
+async def run_bot(a) -> dict:
+    config.DB_PATH = a.db
+    config.CLUSTER_SOURCES = [a.cluster]
+    config.BOT_TOKEN = "123456:bench"
+    if a.unlimited:
+        config.SEND_RATE = config.SEND_CHAT_RATE = config.SEND_CHAT_BURST = 1e9
+    rss0 = _rss_mib()
+
+    import bot as app
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    async def no_announcements():
+        pass
+
+    app.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(a.api))
+    app.ann_loop = no_announcements
+    t0 = time.perf_counter()
+    await app.on_startup()
+    startup = time.perf_counter() - t0
+    rss_idle = _rss_mib()
+
+    deadline = None
+    while True:
+        await asyncio.sleep(0.2)
+        st = await _get_json(a.cluster + "/stats")
+        if not st["done"]:
+            continue
+        deadline = deadline or time.monotonic() + a.drain
+        idle = (not len(app.spot_queue) and not app.spot_queue._busy
+                and not len(app.outbox))
+        if idle or time.monotonic() > deadline:
+            break
+    backlog = len(app.spot_queue) + len(app.outbox)
+    out = {
+        "startup_sec": startup,
+        "rss_start_mib": rss0,
+        "rss_idle_mib": rss_idle,
+        "rss_peak_mib": _rss_mib(),
+        "backlog": backlog,
+        "ingest": app.spot_queue.stats(),
+        "delivery": app.outbox.stats(),
+    }
+    await app.on_shutdown()
+    await app.bot.session.close()
+    rest = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for t in rest:                         # cluster_loop, digests.run
+        t.cancel()
+    await asyncio.gather(*rest, return_exceptions=True)
+    return out
+
+
+# ───── оркестрация ─────
+async def one_scale(a, users: int) -> dict:
+    import seed
+    import storage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        config.DB_PATH = db_path
+        seeded = await seed.seed(users, rdas=a.rdas, no_rda=a.no_rda, digest=a.digest)
+        await storage.close_db()
+
+        api_port, cl_port = _free_port(), _free_port()
+        api = f"http://127.0.0.1:{api_port}"
+        cluster = f"http://127.0.0.1:{cl_port}"
+        cl_args = (["--replay", str(a.replay), "--speed", str(a.speed)] if a.replay
+                   else ["--rate", str(a.rate), "--duration", str(a.duration)])
+        procs = [
+            subprocess.Popen([sys.executable, str(HERE / "fake_botapi.py"),
+                              "--port", str(api_port), "--delay-ms", str(a.delay_ms)]),
+            subprocess.Popen([sys.executable, str(HERE / "fake_cluster.py"),
+                              "--port", str(cl_port), *cl_args]),
+        ]
+        try:
+            await _wait_up(api + "/stats")
+            await _wait_up(cluster + "/stats")
+            bot_args = [sys.executable, __file__, "--bot", "--db", db_path,
+                        "--api", api, "--cluster", cluster, "--drain", str(a.drain)]
+            if a.unlimited:
+                bot_args.append("--unlimited")
+            proc = await asyncio.create_subprocess_exec(
+                *bot_args, stdout=asyncio.subprocess.PIPE)
+            stdout, _ = await proc.communicate()
+            if proc.returncode:
+                raise RuntimeError(f"bot process exited with {proc.returncode}")
+            res = json.loads(stdout.decode().strip().splitlines()[-1])
+            res["api"] = await _get_json(api + "/stats")
+            res["cluster"] = await _get_json(cluster + "/stats")
+        finally:
+            for p in procs:
+                p.terminate()
+                p.wait()
+    res["seed"] = seeded
+    return res
+
+
+def _row(users: int, r: dict) -> str:
+    api, ing = r["api"], r["ingest"]
+    return (f"{users:>7}{r['cluster']['emitted']:>8}{api['spots']:>9}{api['sends']:>9}"
+            f"{api['sends_per_sec']:>9.0f}{api['lat_p50'] * 1e3:>9.0f}"
+            f"{api['lat_p95'] * 1e3:>9.0f}{api['lat_p99'] * 1e3:>9.0f}"
+            f"{r['rss_idle_mib']:>9.0f}{r['rss_peak_mib']:>9.0f}"
+            f"{ing['dropped'] + ing['coalesced']:>8}{r['backlog']:>8}")
+
+
+async def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", default="1000,10000", help="масштабы через запятую")
+    ap.add_argument("--rate", type=float, default=50, help="спотов/с")
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--replay", type=pathlib.Path, help="запись fake_cluster.py --record")
+    ap.add_argument("--speed", type=float, default=1.0)
+    ap.add_argument("--rdas", type=int, default=3)
+    ap.add_argument("--no-rda", type=float, default=0.01)
+    ap.add_argument("--digest", type=float, default=0.0)
+    ap.add_argument("--delay-ms", type=float, default=0.0, help="RTT Bot API")
+    ap.add_argument("--unlimited", action="store_true", help="снять лимиты отправки")
+    ap.add_argument("--drain", type=float, default=60, help="ждать очереди после потока, с")
+    ap.add_argument("--json", action="store_true", help="полный отчёт в JSON")
+    # внутренний режим: процесс бота
+    ap.add_argument("--bot", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    ap.add_argument("--api", help=argparse.SUPPRESS)
+    ap.add_argument("--cluster", help=argparse.SUPPRESS)
+    a = ap.parse_args()
+
+    if a.bot:
+        print(json.dumps(await run_bot(a)))
+        return 0
+
+    results = {}
+    print(f"{'users':>7}{'spots':>8}{'deliv':>9}{'sends':>9}{'send/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MiB':>9}{'peak':>9}"
+          f"{'lost':>8}{'left':>8}")
+    for users in map(int, a.users.split(",")):
+        results[users] = r = await one_scale(a, users)
+        print(_row(users, r), flush=True)
+    if a.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
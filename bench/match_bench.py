@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Подбор подписчиков на спот: allowed() по каждому чату (2 запроса на чат)
+против одного set-based запроса match_spot — storage.py (aiosqlite) и
+db.py (SQLAlchemy, если установлен; та же база через sqlite+aiosqlite
+или --db-url на Postgres) — и резидентных индексов filters.py и
+vecmatch.py (векторный, если установлен NumPy).
+Результаты всех способов сверяются: при расхождении выходит с кодом 1.
+
+    python bench/match_bench.py --users 2000 --spots 200
+    python bench/match_bench.py --db-url postgresql+asyncpg://bot@localhost/bench
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE))
+
+import config
+import filters
+import seed
+import storage
+
+
+def _spots(n: int, rnd: random.Random) -> list[tuple[str, str, float]]:
+    codes = seed.rda_codes()
+    return [(rnd.choice(codes), rnd.choice(("CW", "SSB", "DIGI", "FT8")),
+             rnd.uniform(1800, 29700)) for _ in range(n)]
+
+
+async def _allowed_loop(allowed, cids: list[int], spot) -> set[int]:
+    return {cid for cid in cids if await allowed(cid, *spot)}
+
+
+async def _time(name: str, fn, spots) -> tuple[float, list[set[int]]]:
+    t0 = time.perf_counter()
+    out = [await fn(s) for s in spots]
+    dt = time.perf_counter() - t0
+    print(f"{name:<28}{len(spots) / dt:>10.1f} spots/s {dt / len(spots) * 1e3:>9.2f} ms/spot")
+    return dt, out
+
+
+async def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--spots", type=int, default=200)
+    ap.add_argument("--loop-spots", type=int, default=20,
+                    help="спотов для allowed()-цикла (он медленный)")
+    ap.add_argument("--db-url", help="база для db.py (по умолчанию — та же SQLite)")
+    a = ap.parse_args()
+    rnd = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DB_PATH = os.path.join(tmp, "bench.db")
+        config.DB_URL = a.db_url or f"sqlite+aiosqlite:///{config.DB_PATH}"
+        await seed.seed(a.users)
+        async with storage.transaction():       # часть чатов — с диапазоном
+            for cid in range(1, a.users + 1, 5):
+                lo = rnd.uniform(1800, 28000)
+                await storage.set_band(cid, lo, lo + rnd.uniform(100, 5000))
+        spots = _spots(a.spots, rnd)
+
+        from bot import allowed                 # эталон: по чату, два запроса
+        cids = await storage.subscribers("spot")
+        idx = filters.SubscriberIndex()
+        idx.load(cids, {c: filters.Filter(*r) for c, r in (await storage.load_filters()).items()})
+
+        async def index(s):
+            return set(idx.match(*s))
+
+        async def sqlite_query(s):
+            return {cid for cid, _ in await storage.match_spot(*s)}
+
+        print(f"{a.users} users, {a.spots} spots")
+        ref_dt, ref = await _time(
+            "allowed() per chat", lambda s: _allowed_loop(allowed, cids, s),
+            spots[:a.loop_spots])
+        ref_rate = len(ref) / ref_dt
+        results = {"index": await _time("index (filters.py)", index, spots),
+                   "storage.match_spot": await _time("storage.match_spot", sqlite_query, spots)}
+        try:
+            import vecmatch
+        except ImportError:
+            print("vecmatch: NumPy не установлен — пропуск")
+        else:
+            vec = vecmatch.VectorIndex()
+            vec.load(cids, {c: filters.Filter(*r) for c, r in (await storage.load_filters()).items()})
+            batched = None
+
+            async def vector(s):
+                nonlocal batched
+                if batched is None:                 # одна пачка на все споты, в замере
+                    batched = iter(vec.match_batch(spots))
+                return set(next(batched))
+
+            results["vector"] = await _time("vector (vecmatch.py)", vector, spots)
+        try:
+            import db
+        except ImportError:
+            print("db.py: SQLAlchemy не установлен — пропуск")
+        else:
+            if a.db_url:                        # своя база — засеять той же выборкой
+                await db.init_db()
+                async with db.transaction():
+                    for cid in cids:
+                        await db.change_sub(cid, "spot", True)
+                        await db.add_rda(cid, *await storage.get_rda(cid))
+                        mode, lo, hi = await storage.misc(cid)
+                        await db.set_mode(cid, mode)
+                        await db.set_band(cid, lo, hi)
+
+            async def sa_query(s):
+                return {cid for cid, _ in await db.match_spot(*s)}
+
+            results["db.match_spot"] = await _time("db.match_spot (SQLAlchemy)", sa_query, spots)
+            await db.close_db()
+
+        failed = False
+        for name, (dt, out) in results.items():
+            ok = out[:len(ref)] == ref and out == results["index"][1]
+            failed |= not ok
+            print(f"{name:<28} ×{len(spots) / dt / ref_rate:>8.0f} vs allowed()  "
+                  f"{'equal' if ok else 'MISMATCH'}")
+        await storage.close_db()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк движков разбора анонсов на сохранённых страницах bench/fixtures/.
+Сравнивает время и пиковую память старого (BeautifulSoup) и нового
+(регэксп + потоковый html.parser) движков и сверяет их выдачу:
+при расхождении выходит с кодом 1.
+
+    python bench/parser_bench.py [--repeat 20] [fixture.html …]
+"""
+
+import argparse
+import pathlib
+import sys
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import rda_parser
+
+ENGINES = {
+    "bs4":  (rda_parser._extract_fragment_bs4, rda_parser._parse_bs4),
+    "fast": (rda_parser._extract_fragment, rda_parser._parse),
+}
+
+
+def _run(engine: str, page: str) -> list[dict]:
+    extract, parse = ENGINES[engine]
+    return parse(extract(page))
+
+
+def _time(engine: str, page: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        _run(engine, page)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _peak(engine: str, page: str) -> int:
+    tracemalloc.start()
+    _run(engine, page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("fixtures", nargs="*", type=pathlib.Path)
+    a = ap.parse_args()
+    files = a.fixtures or sorted((ROOT / "bench" / "fixtures").glob("*.html"))
+
+    failed = False
+    print(f"{'fixture':<22}{'cards':>6}{'bs4 ms':>10}{'fast ms':>10}{'×':>6}"
+          f"{'bs4 KiB':>10}{'fast KiB':>10}  equal")
+    for f in files:
+        page = f.read_text(encoding="utf-8")
+        ref, new = _run("bs4", page), _run("fast", page)
+        equal = ref == new
+        failed |= not equal
+        t_old, t_new = _time("bs4", page, a.repeat), _time("fast", page, a.repeat)
+        m_old, m_new = _peak("bs4", page), _peak("fast", page)
+        print(f"{f.name:<22}{len(ref):>6}{t_old * 1e3:>10.1f}{t_new * 1e3:>10.1f}"
+              f"{t_old / t_new:>6.1f}{m_old / 1024:>10.0f}{m_new / 1024:>10.0f}  "
+              f"{'yes' if equal else 'NO'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
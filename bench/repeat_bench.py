@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Подавление повторов (repeat.Repeats) на потоке спотов с частыми повторами.
+
+1) Сверка: решение «слать/не слать» по каждой паре (спот, чат) против
+   перебора — время последней доставки (позывной, RDA, диапазон, мода)
+   в чат. Окна чатов разные (общее, своё, выкл). Расхождение — код 1.
+2) Память: тот же поток с потолком записей --cap — записей в памяти
+   никогда не больше потолка, а каждый подавленный спот подкреплён
+   настоящей доставкой в этот чат внутри окна (вытеснение даёт только
+   лишние отправки).
+3) Скорость: мкс на спот при --subs подписчиках на спот и доля
+   сэкономленных отправок.
+
+    python bench/repeat_bench.py [--spots 50000] [--subs 50]
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import repeat
+
+BANDS = ("40m", "30m", "20m", "17m", "15m")
+MODES = ("CW", "SSB", "FT8")
+
+
+def stream(n: int, rnd: random.Random):
+    """n спотов за ~n/10 секунд: немногие активные станции спотят снова и снова"""
+    calls = [(f"R{i}A", f"AD-{i % 40:02d}", BANDS[i % 5], MODES[i % 3]) for i in range(300)]
+    t = 1_700_000_000.0
+    for _ in range(n):
+        t += rnd.expovariate(10)
+        call, rda, band, mode = rnd.choice(calls[:60]) if rnd.random() < 0.8 else rnd.choice(calls)
+        band = band if rnd.random() < 0.9 else rnd.choice(BANDS)
+        mode = mode if rnd.random() < 0.95 else rnd.choice(MODES)
+        yield call, rda, band, mode, t
+
+
+def windows(chats: int, rnd: random.Random) -> dict[int, int]:
+    return {cid: rnd.choice((0, 1, 5, 30)) for cid in range(chats) if rnd.random() < 0.3}
+
+
+def reference(spots, subs, win, default):
+    last: dict[tuple, tuple] = {}
+    out = []
+    for (call, rda, band, mode, t), cids in zip(spots, subs):
+        sent = []
+        for cid in cids:
+            w = win.get(cid, default)
+            exp = last.get((cid, call, rda, band, mode))
+            if w and exp and t < exp:
+                continue
+            if w:
+                last[(cid, call, rda, band, mode)] = t + w * 60
+            sent.append(cid)
+        out.append(sent)
+    return out
+
+
+def unbacked(spots, subs, out, win, default) -> int:
+    """Подавления без доставки того же (позывной, RDA, диапазон, мода) в чат внутри окна"""
+    last: dict[tuple, tuple] = {}
+    n = 0
+    for (call, rda, band, mode, t), cids, sent in zip(spots, subs, out):
+        sent = set(sent)
+        for cid in cids:
+            if cid in sent:
+                last[(cid, call, rda, band, mode)] = t + win.get(cid, default) * 60
+                continue
+            exp = last.get((cid, call, rda, band, mode))
+            n += not (exp and t < exp)
+    return n
+
+
+def run(spots, subs, win, default, cap):
+    r = repeat.Repeats(default, max_entries=cap)
+    r.load(win)
+    peak = 0
+    out = []
+    for (call, rda, band, mode, t), cids in zip(spots, subs):
+        out.append(r.filter(cids, call, rda, band, mode, now=t))
+        peak = max(peak, len(r))
+    return r, out, peak
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--spots", type=int, default=50000)
+    ap.add_argument("--chats", type=int, default=2000)
+    ap.add_argument("--subs", type=int, default=50, help="подписчиков на спот")
+    ap.add_argument("--default", type=int, default=15, help="общее окно, мин")
+    ap.add_argument("--cap", type=int, default=10000)
+    a = ap.parse_args()
+    rnd = random.Random(5)
+    spots = list(stream(a.spots, rnd))
+    subs = [rnd.sample(range(a.chats), a.subs) for _ in spots]
+    win = windows(a.chats, rnd)
+
+    ref = reference(spots, subs, win, a.default)
+    t0 = time.perf_counter()
+    r, got, peak = run(spots, subs, win, a.default, 10 ** 9)
+    dt = time.perf_counter() - t0
+    bad = sum(x != y for x, y in zip(got, ref))
+    total = a.spots * a.subs
+    print(f"verify: {a.spots - bad}/{a.spots} spots decided as brute force")
+    print(f"{dt / a.spots * 1e6:.1f} us/spot at {a.subs} subs, "
+          f"suppressed {r.suppressed}/{total} sends ({r.suppressed / total:.0%}), "
+          f"peak entries {peak}")
+
+    rc, capped, peak_c = run(spots, subs, win, a.default, a.cap)
+    lost = unbacked(spots, subs, capped, win, a.default)
+    print(f"cap {a.cap}: peak entries {peak_c}, evicted {rc.evicted}, "
+          f"extra sends {rc.passed - r.passed}, wrongly suppressed {lost}")
+    return 1 if bad or lost or peak_c > a.cap else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Заполняет базу storage.py синтетическими подписчиками для нагрузочных
+прогонов: пользователи, подписки, RDA-фильтры, мода, дайджест.
+Коды RDA берутся из RDA_list_2025.json, распределение — воспроизводимое
+(--seed).
+
+    python bench/seed.py --db bench.db --users 10000 [--rdas 3] [--no-rda 0.01]
+"""
+
+import argparse
+import asyncio
+import json
+import pathlib
+import random
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import config
+import storage
+
+MODES = (None, None, None, "CW", "SSB", "DIGI")   # чаще всего — любая мода
+
+
+def rda_codes() -> list[str]:
+    return sorted(json.loads((ROOT / "RDA_list_2025.json").read_text(encoding="utf-8")))
+
+
+async def seed(users: int, *, rdas: int = 3, no_rda: float = 0.01,
+               ann: float = 0.5, digest: float = 0.0, digest_sec: int = 300,
+               rnd: random.Random | None = None) -> dict:
+    """Пишет users подписчиков на споты в текущую config.DB_PATH.
+    no_rda — доля без RDA-фильтра (получают всё), ann — доля подписанных
+    ещё и на анонсы, digest — доля в режиме дайджеста."""
+    rnd = rnd or random.Random(0)
+    codes = rda_codes()
+    stats = {"users": users, "no_rda": 0, "ann": 0, "digest": 0, "rda_rows": 0}
+    await storage.init_db()
+    async with storage.transaction():
+        for cid in range(1, users + 1):
+            await storage.upsert_user(cid, f"bench{cid}", None)
+            await storage.change_sub(cid, "spot", True)
+            if rnd.random() < ann:
+                await storage.change_sub(cid, "ann", True)
+                stats["ann"] += 1
+            if rnd.random() < no_rda:
+                stats["no_rda"] += 1
+            else:
+                picked = rnd.sample(codes, rnd.randint(1, max(1, rdas * 2 - 1)))
+                await storage.add_rda(cid, *picked)
+                stats["rda_rows"] += len(picked)
+            await storage.set_mode(cid, rnd.choice(MODES))
+            if rnd.random() < digest:
+                await storage.set_digest(cid, digest_sec)
+                stats["digest"] += 1
+    return stats
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=config.DB_PATH)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--rdas", type=int, default=3, help="среднее число RDA в фильтре")
+    ap.add_argument("--no-rda", type=float, default=0.01)
+    ap.add_argument("--ann", type=float, default=0.5)
+    ap.add_argument("--digest", type=float, default=0.0)
+    ap.add_argument("--digest-sec", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+
+    config.DB_PATH = a.db
+    t0 = time.perf_counter()
+    stats = await seed(a.users, rdas=a.rdas, no_rda=a.no_rda, ann=a.ann,
+                       digest=a.digest, digest_sec=a.digest_sec,
+                       rnd=random.Random(a.seed))
+    await storage.close_db()
+    print(f"{a.db}: {stats} in {time.perf_counter() - t0:.1f} s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
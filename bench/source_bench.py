@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Несколько источников спотов (sources.py) против локальных заменителей.
+
+1) Разбор «DX de …»: случайные споты fake_cluster.synthetic переводятся
+   в строку telnet-узла (fake_cluster.dx_line) и обратно (dx_to_wire);
+   спот должен совпасть с разбором исходной строки Socket.IO — позывной,
+   частота, мода, RDA и ключ дедупликации.
+2) Живой прогон: fake_cluster.Cluster шлёт поток в Socket.IO и telnet
+   одновременно, к нему подключены
+     sio    — Socket.IO;
+     telnet — telnet тем же потоком;
+     late   — telnet-узел, который поднимается только через --late сек
+              (переподключения с Backoff);
+     stall  — узел, который принимает логин и молчит (переподключение
+              по молчанию).
+   Каждый спот должен пройти дальше ровно один раз, копии — посчитаны
+   у источника. Нарушение — код 1.
+
+    python bench/source_bench.py [--rate 200] [--duration 3] [--late 1.5]
+"""
+
+import argparse
+import asyncio
+import logging
+import pathlib
+import random
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+
+from aiohttp import web
+
+import sources
+import spots
+from fake_cluster import Cluster, dx_line, synthetic
+
+
+def check_dx(n: int) -> int:
+    wire = spots.WireParser()
+    bad = 0
+    for _, parts in synthetic(1000, n / 1000, random.Random(3)):
+        parts[7] = random.choice(("", "tnx 73", "QSL via R0BI | up 2"))
+        a = wire.parse("|".join(parts))
+        b = wire.parse(sources.dx_to_wire(dx_line(parts)) or "")
+        if b is None or (a.callsign, a.freq, a.mode, a.rda, a.key) != \
+                (b.callsign, b.freq, b.mode, b.rda, b.key):
+            bad += 1
+            if bad <= 3:
+                print("DX MISMATCH", parts, dx_line(parts))
+    return bad
+
+
+async def silent_node(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    writer.write(b"login: ")
+    await reader.read()
+
+
+async def live(a) -> bool:
+    cl = Cluster(synthetic(a.rate, a.duration, random.Random(1)))
+    runner = web.AppRunner(cl.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", a.port).start()
+    await asyncio.start_server(cl.telnet_client, "127.0.0.1", a.port + 1)
+    await asyncio.start_server(silent_node, "127.0.0.1", a.port + 3)
+
+    async def late_node():
+        await asyncio.sleep(a.late)
+        await asyncio.start_server(cl.telnet_client, "127.0.0.1", a.port + 2)
+    asyncio.create_task(late_node())
+
+    fast = dict(backoff=sources.Backoff(base=0.1, cap=1.0))
+    srcs = [
+        sources.SocketIOSource(f"http://127.0.0.1:{a.port}", **fast),
+        sources.TelnetSource(f"telnet://127.0.0.1:{a.port + 1}", "BENCH", **fast),
+        sources.TelnetSource(f"telnet://127.0.0.1:{a.port + 2}", "BENCH", **fast),
+        sources.TelnetSource(f"telnet://127.0.0.1:{a.port + 3}", "BENCH", idle=0.5,
+                             login_timeout=1.0, **fast),
+    ]
+    names = dict(zip((s.name for s in srcs), ("sio", "telnet", "late", "stall")))
+    got: list[int] = []
+    first_by: dict[str, int] = {}
+    ing = sources.Ingest(srcs, spots.WireParser(), lambda s: got.append(s.key))
+    task = asyncio.create_task(ing.run())
+    t0 = time.perf_counter()
+    await cl.run()
+    await asyncio.sleep(1.0)                    # хвост потока
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    for s in srcs:
+        if s.kind == "socketio":
+            await s._sio.disconnect()
+    await runner.cleanup()
+
+    st = ing.stats()
+    print(f"{cl.emitted} spots in {time.perf_counter() - t0:.1f} s, "
+          f"passed on {len(got)}, unique {len(set(got))}")
+    cols = ("up", "lines", "spots", "first", "copies", "rejected", "reconnects", "lag_p50")
+    print(f"{'source':<8}" + "".join(f"{c:>11}" for c in cols))
+    for name, v in st.items():
+        first_by[names[name]] = v["first"]
+        print(f"{names[name]:<8}" + "".join(f"{v[c]:>11.0f}" for c in cols))
+    ok = len(got) == len(set(got)) == cl.emitted
+    ok &= all(v["spots"] == v["first"] + v["copies"] for v in st.values())
+    v = {names[n]: x for n, x in st.items()}
+    ok &= v["telnet"]["spots"] == cl.emitted and v["sio"]["spots"] == cl.emitted
+    ok &= v["late"]["reconnects"] > 0 and v["late"]["spots"] > 0
+    ok &= v["stall"]["reconnects"] > 0 and v["stall"]["spots"] == 0
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, default=200)
+    ap.add_argument("--duration", type=float, default=3)
+    ap.add_argument("--late", type=float, default=1.5, help="через сколько поднимается узел late")
+    ap.add_argument("--port", type=int, default=9150)
+    ap.add_argument("--cases", type=int, default=2000)
+    a = ap.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    bad = check_dx(a.cases)
+    print(f"DX de round trip: {a.cases - bad}/{a.cases} equal")
+    ok = asyncio.run(live(a))
+    print("live: " + ("every spot once" if ok else "FAILED"))
+    return 0 if ok and not bad else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
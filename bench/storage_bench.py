@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк storage.py: соединение на каждый вызов (как было)
+против общего долгоживущего соединения и транзакционной пачки.
+
+    python bench/storage_bench.py --ops 2000 --users 500
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import aiosqlite
+import config
+import storage
+
+
+# ───── старая модель: новое соединение на каждый запрос ─────
+def _legacy_conn():
+    return aiosqlite.connect(config.DB_PATH, timeout=30, isolation_level=None)
+
+async def legacy_read(cid: int):
+    async with _legacy_conn() as db:
+        cur = await db.execute("SELECT rda FROM filters_rda WHERE chat_id=?", (cid,))
+        await cur.fetchall()
+    async with _legacy_conn() as db:
+        cur = await db.execute(
+            "SELECT mode,f_min,f_max FROM filters_misc WHERE chat_id=?", (cid,)
+        )
+        await cur.fetchone()
+    async with _legacy_conn() as db:
+        cur = await db.execute("SELECT fmt FROM users WHERE chat_id=?", (cid,))
+        await cur.fetchone()
+
+async def legacy_save(cid: int, codes: list[str]):
+    # cb_done до транзакций: set_mode + set_band + clear_rda + add_rda
+    for sql, args in (
+        ("INSERT OR IGNORE INTO filters_misc(chat_id) VALUES(?)", (cid,)),
+        ("UPDATE filters_misc SET mode=? WHERE chat_id=?", ("CW", cid)),
+        ("UPDATE filters_misc SET f_min=?, f_max=? WHERE chat_id=?", (1.8, 29.0, cid)),
+        ("DELETE FROM filters_rda WHERE chat_id=?", (cid,)),
+    ):
+        async with _legacy_conn() as db:
+            await db.execute(sql, args)
+    async with _legacy_conn() as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO filters_rda(chat_id,rda) VALUES(?,?)",
+            [(cid, c) for c in codes]
+        )
+
+
+# ───── новая модель ─────
+async def pooled_read(cid: int):
+    await storage.get_rda(cid)
+    await storage.misc(cid)
+    await storage.get_template(cid)
+
+async def pooled_save(cid: int, codes: list[str]):
+    async with storage.transaction():
+        await storage.set_mode(cid, "CW")
+        await storage.set_band(cid, 1.8, 29.0)
+        await storage.clear_rda(cid)
+        await storage.add_rda(cid, *codes)
+
+
+async def _seed(users: int):
+    await storage.init_db()
+    async with storage.transaction():
+        for cid in range(users):
+            await storage.upsert_user(cid, f"u{cid}", None)
+            await storage.set_mode(cid, "ANY")
+            await storage.add_rda(cid, f"AD-{cid % 10:02d}", f"BR-{cid % 30:02d}")
+
+async def _run(name: str, fn, ops: int, users: int, conc: int) -> float:
+    sem = asyncio.Semaphore(conc)
+
+    async def one(i: int):
+        async with sem:
+            cid = random.randrange(users)
+            if fn in (legacy_save, pooled_save):
+                await fn(cid, [f"AD-{i % 10:02d}", f"NS-{i % 50:02d}"])
+            else:
+                await fn(cid)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(ops)))
+    dt = time.perf_counter() - t0
+    print(f"{name:<24} {ops / dt:>10.0f} ops/s  ({dt:.2f} s)")
+    return ops / dt
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ops", type=int, default=2000)
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=16)
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DB_PATH = os.path.join(tmp, "bench.db")
+        await _seed(a.users)
+        lr = await _run("read  per-call conn", legacy_read, a.ops, a.users, a.concurrency)
+        pr = await _run("read  shared conn", pooled_read, a.ops, a.users, a.concurrency)
+        lw = await _run("save  per-call conn", legacy_save, a.ops // 4, a.users, a.concurrency)
+        pw = await _run("save  transaction", pooled_save, a.ops // 4, a.users, a.concurrency)
+        await storage.close_db()
+    print(f"speedup: read ×{pr / lr:.1f}, save ×{pw / lw:.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
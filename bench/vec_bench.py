@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Векторный подбор (vecmatch.VectorIndex) против скалярного.
+
+1) Сверка: случайные фильтры (пустые/частичные диапазоны, граничные
+   частоты, моды в разном регистре, коды не из списка) и случайные
+   правки вперемешку с пачками спотов; эталон — тело allowed() над
+   теми же строками filters_rda/filters_misc. Расхождение — код 1.
+2) Точка перелома на фильтрах, похожих на живые (bench_row): мкс на спот для
+     scalar — Filter.match на каждую пару (спот, подписчик), как allowed();
+     index  — filters.SubscriberIndex.match;
+     vector — match_batch пачками разного размера.
+
+    python bench/vec_bench.py --users 100,1000,10000,50000 --batches 1,4,16,64
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+
+import filters
+import seed
+import vecmatch
+from spots import BANDS, norm_mode
+from rda_catalog import catalog
+
+MODES = (None, "ANY", "CW", "SSB", "DIGI", "cw", "FT8")
+SPOT_MODES = ("CW", "cw", "SSB", "DIGI", "FT8", "RTTY")
+EDGES = (1800.0, 2000.0, 7000.0, 14000.0, 14350.0, 21000.0)
+
+
+def allowed(row, rda: str, mode: str, freq: float) -> bool:
+    """allowed() из bot.py без БД: row — (RDA-коды, мода, lo, hi)"""
+    rda_list, m, lo, hi = row
+    if rda_list and not any(x in rda.split() for x in rda_list):
+        return False
+    if m and m != "ANY" and m != norm_mode(mode):
+        return False
+    return (lo is None or lo <= freq) and (hi is None or freq <= hi)
+
+
+def rand_row(rnd: random.Random, codes: list[str]):
+    n = rnd.choice((0, 0, 1, 2, 3, 5))
+    rdas = rnd.sample(codes, n)
+    if rnd.random() < 0.05:
+        rdas.append("ZZ-%02d" % rnd.randrange(100))       # кода нет в списке
+    band = rnd.random()
+    if band < 0.3:
+        lo = hi = None
+    elif band < 0.4:
+        lo, hi = rnd.choice(EDGES), None
+    else:
+        lo = rnd.choice(EDGES + (rnd.uniform(1800, 29000),))
+        hi = lo + rnd.choice((0.0, 350.0, rnd.uniform(1, 8000)))
+    return rdas, rnd.choice(MODES), lo, hi
+
+
+def bench_row(rnd: random.Random, codes: list[str]):
+    """Как у живых подписчиков: 1–3 кода, диапазон чаще пресетом"""
+    rdas = rnd.sample(codes, rnd.choice((1, 2, 3))) if rnd.random() > 0.02 else []
+    band = rnd.random()
+    if band < 0.5:
+        lo = hi = None
+    elif band < 0.9:
+        lo, hi, _ = rnd.choice(BANDS)
+    else:
+        lo = rnd.uniform(1800, 28000)
+        hi = lo + rnd.uniform(100, 5000)
+    return rdas, rnd.choice((None, None, None, "CW", "SSB", "DIGI")), lo, hi
+
+
+def rand_spot(rnd: random.Random, codes: list[str]) -> tuple[str, str, float]:
+    k = rnd.choice((1, 1, 1, 2))
+    rda = " ".join(rnd.sample(codes, k))
+    if rnd.random() < 0.05:
+        rda += " YY-%02d" % rnd.randrange(100)
+    freq = rnd.choice(EDGES) if rnd.random() < 0.2 else rnd.uniform(1800, 29700)
+    return rda, rnd.choice(SPOT_MODES), freq
+
+
+def verify(rnd: random.Random, codes: list[str], users: int, rounds: int) -> bool:
+    rows = {cid: rand_row(rnd, codes) for cid in range(1, users + 1)}
+    subs = {cid for cid in rows if rnd.random() < 0.8}
+    idx = vecmatch.VectorIndex()
+    idx.load(subs, {cid: filters.Filter(*r) for cid, r in rows.items()})
+    for _ in range(rounds):
+        for _ in range(rnd.randrange(50)):                 # правки, как хендлеры бота
+            cid = rnd.randrange(1, users + 20)
+            new = rand_row(rnd, codes)
+            op = rnd.randrange(5)
+            old = rows.get(cid, ([], None, 0.0, 99999.0))
+            if op == 0:
+                on = rnd.random() < 0.6
+                idx.subscribe(cid, on)
+                (subs.add if on else subs.discard)(cid)
+                rows.setdefault(cid, old)
+            elif op == 1:
+                idx.set_rda(cid, new[0])
+                rows[cid] = (new[0],) + old[1:]
+            elif op == 2:
+                idx.set_mode(cid, new[1])
+                rows[cid] = (old[0], new[1]) + old[2:]
+            elif op == 3:
+                idx.set_band(cid, new[2], new[3])
+                rows[cid] = old[:2] + new[2:]
+            else:
+                idx.set_rda(cid, ())
+                rows[cid] = ([],) + old[1:]
+        spots = [rand_spot(rnd, codes) for _ in range(rnd.choice((1, 7, 64)))]
+        got = idx.match_batch(spots)
+        for s, res in zip(spots, got):
+            ref = {cid for cid in subs if allowed(rows[cid], *s)}
+            if set(res) != ref or len(res) != len(ref) or set(idx.match(*s)) != ref:
+                print(f"MISMATCH spot={s}: vector {len(res)} vs allowed {len(ref)}")
+                return False
+    return True
+
+
+def _per_spot(fn, spots, reps: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn(spots)
+    return (time.perf_counter() - t0) / (reps * len(spots)) * 1e6
+
+
+def bench(rnd: random.Random, codes: list[str], users: int, batches: list[int]) -> dict:
+    rows = {cid: bench_row(rnd, codes) for cid in range(1, users + 1)}
+    flt = {cid: filters.Filter(*r) for cid, r in rows.items()}
+    idx = filters.SubscriberIndex()
+    idx.load(rows, flt)
+    vec = vecmatch.VectorIndex()
+    vec.load(rows, flt)
+    n_spots = max(batches) * 4
+    spots = [rand_spot(rnd, codes) for _ in range(n_spots)]
+    masks = [(catalog.mask(r.split()), m, f) for r, m, f in spots]
+    items = list(flt.items())
+
+    def scalar(batch):
+        for mask, mode, freq in batch:
+            [cid for cid, f in items if f.match(mask, mode, freq)]
+
+    def index(batch):
+        for s in batch:
+            idx.match(*s)
+
+    scalar_n = masks[:max(4, 20000 // users)]
+    out = {"scalar": _per_spot(scalar, scalar_n), "index": _per_spot(index, spots)}
+    for b in batches:
+        def vector(all_spots, b=b):
+            for i in range(0, len(all_spots), b):
+                vec.match_batch(all_spots[i:i + b])
+        out[f"vector/{b}"] = _per_spot(vector, spots, reps=max(1, 2000 // users))
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", default="100,1000,10000,50000", help="масштабы через запятую")
+    ap.add_argument("--batches", default="1,4,16,64", help="размеры пачки")
+    ap.add_argument("--verify-users", type=int, default=1500)
+    ap.add_argument("--verify-rounds", type=int, default=200)
+    a = ap.parse_args()
+    rnd = random.Random(7)
+    codes = seed.rda_codes()
+    catalog.load([str(ROOT / "RDA_list_2025.json")])
+
+    ok = verify(rnd, codes, a.verify_users, a.verify_rounds)
+    print(f"verify ({a.verify_users} users, {a.verify_rounds} rounds): "
+          f"{'equal to allowed()' if ok else 'MISMATCH'}")
+
+    batches = [int(x) for x in a.batches.split(",")]
+    cols = ["scalar", "index"] + [f"vector/{b}" for b in batches]
+    print("\nµs per spot")
+    print(f"{'users':>8}" + "".join(f"{c:>12}" for c in cols))
+    for users in (int(x) for x in a.users.split(",")):
+        r = bench(rnd, codes, users, batches)
+        print(f"{users:>8}" + "".join(f"{r[c]:>12.1f}" for c in cols))
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Время ответа на команду: long polling против webhook (webhook.py).
+
+Для каждого режима — отдельный процесс бота (bot.main(), как в
+продакшене) с fake_botapi.py в том же процессе; задержка сети
+--delay-ms — на каждом ответе Bot API и на доставке апдейта (ответ
+getUpdates или POST на webhook). Команда /help от нового чата, время —
+от отправки апдейта до sendMessage с ответом:
+  • подряд — --commands команд по одной;
+  • залпом — --burst команд от разных чатов одновременно.
+Webhook ещё проверяется на чужой секрет (401) и не-апдейт (400).
+Ответ потерян или проверка не прошла — код 1.
+
+    python bench/webhook_bench.py [--commands 200] [--burst 500] [--delay-ms 40]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+HERE = pathlib.Path(__file__).resolve().parent
+ROOT = HERE.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(HERE))
+
+import config
+import fake_botapi
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pct(data, q: float) -> float:
+    return fake_botapi._pct(data, q)
+
+
+def update(cid: int) -> dict:
+    return {"message": {
+        "message_id": 1, "date": int(time.time()), "text": "/help",
+        "chat": {"id": cid, "type": "private"},
+        "from": {"id": cid, "is_bot": False, "first_name": "bench"},
+    }}
+
+
+# ───── процесс бота ─────
+async def run_mode(a) -> dict:
+    api_port = _free_port()
+    config.BOT_TOKEN = "123456:bench"
+    config.DB_PATH = a.db
+    config.CLUSTER_SOURCES = []
+    config.ARCHIVE_PATH = ""
+    config.METRICS_PORT = 0
+    config.SEND_RATE = config.SEND_CHAT_RATE = config.SEND_CHAT_BURST = 1e9
+    if a.mode == "webhook":
+        config.WEBHOOK_URL = f"http://127.0.0.1:{_free_port()}"
+        config.WEBHOOK_HOST = "127.0.0.1"
+        config.WEBHOOK_PORT = int(config.WEBHOOK_URL.rsplit(":", 1)[1])
+        config.WEBHOOK_SECRET = "bench-secret"
+    else:
+        config.WEBHOOK_URL = ""
+
+    api = fake_botapi.make_app(a.delay_ms / 1000)
+    runner = web.AppRunner(api, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+    rec, queue = api["recorder"], api["updates"]
+
+    import bot as app
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    async def no_announcements():
+        pass
+
+    app.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}"))
+    app.ann_loop = no_announcements
+
+    waiting: dict[int, asyncio.Future] = {}
+
+    def on_send(cid: int):
+        fut = waiting.get(cid)
+        if fut is not None and not fut.done():
+            fut.set_result(time.perf_counter())
+    rec.on_send = on_send
+
+    task = asyncio.create_task(app.main())
+    ready = "setWebhook" if a.mode == "webhook" else "getUpdates"
+    while not rec.other.get(ready):
+        await asyncio.sleep(0.05)
+
+    url = config.WEBHOOK_URL + config.WEBHOOK_PATH
+    headers = {"X-Telegram-Bot-Api-Secret-Token": config.WEBHOOK_SECRET}
+    ids = iter(range(1, 10 ** 9))
+    out: dict = {"mode": a.mode}
+    # Telegram держит к webhook не больше max_connections соединений
+    conn = aiohttp.TCPConnector(limit=min(config.WEBHOOK_CONCURRENCY, 100))
+    async with aiohttp.ClientSession(connector=conn) as http:
+
+        async def command(cid: int) -> float | None:
+            fut = waiting[cid] = asyncio.get_running_loop().create_future()
+            t0 = time.perf_counter()
+            if a.mode == "webhook":
+                await asyncio.sleep(a.delay_ms / 1000)   # Telegram → бот
+                async with http.post(url, json={"update_id": next(ids), **update(cid)},
+                                     headers=headers) as r:
+                    if r.status != 200:
+                        return None
+            else:
+                queue.push(update(cid))
+            try:
+                return await asyncio.wait_for(fut, a.timeout) - t0
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                waiting.pop(cid, None)
+
+        seq = [await command(1_000_000 + i) for i in range(a.commands)]
+        t0 = time.perf_counter()
+        burst = await asyncio.gather(*(command(2_000_000 + i) for i in range(a.burst)))
+        wall = time.perf_counter() - t0
+        for name, lat in (("seq", seq), ("burst", burst)):
+            ok = [x * 1000 for x in lat if x is not None]
+            out[name] = {"sent": len(lat), "answered": len(ok),
+                         "p50": _pct(ok, 0.5), "p95": _pct(ok, 0.95), "max": max(ok, default=0)}
+        out["burst"]["wall_s"] = wall
+
+        if a.mode == "webhook":
+            async with http.post(url, json={"update_id": 0, **update(1)},
+                                 headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as r:
+                out["bad_secret"] = r.status
+            async with http.post(url, data=b"{not json", headers=headers) as r:
+                out["bad_body"] = r.status
+            out["hook"] = app.hook.stats()
+            app.hook.close()
+        else:
+            await app.dp.stop_polling()
+    await task
+
+    rest = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for t in rest:                         # digests.run и прочие фоновые
+        t.cancel()
+    await asyncio.gather(*rest, return_exceptions=True)
+    await runner.cleanup()
+    return out
+
+
+# ───── оркестрация ─────
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--commands", type=int, default=200, help="команд подряд")
+    ap.add_argument("--burst", type=int, default=500, help="команд одновременно")
+    ap.add_argument("--delay-ms", type=float, default=40, help="задержка сети до Telegram")
+    ap.add_argument("--timeout", type=float, default=30, help="ждать ответа, с")
+    ap.add_argument("--mode", choices=("polling", "webhook"), help=argparse.SUPPRESS)
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    a = ap.parse_args()
+
+    if a.mode:
+        print(json.dumps(asyncio.run(run_mode(a))))
+        return 0
+
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("polling", "webhook"):
+            args = [sys.executable, __file__, "--mode", mode, "--db", os.path.join(tmp, f"{mode}.db"),
+                    "--commands", str(a.commands), "--burst", str(a.burst),
+                    "--delay-ms", str(a.delay_ms), "--timeout", str(a.timeout)]
+            p = subprocess.run(args, stdout=subprocess.PIPE, text=True)
+            if p.returncode:
+                print(f"{mode}: bot process exited with {p.returncode}")
+                return 1
+            res[mode] = json.loads(p.stdout.strip().splitlines()[-1])
+
+    print(f"{'mode':<9}{'seq p50':>9}{'seq p95':>9}{'burst p50':>11}{'burst p95':>11}"
+          f"{'burst max':>11}{'burst s':>9}{'answered':>10}")
+    ok = True
+    for mode, r in res.items():
+        s, b = r["seq"], r["burst"]
+        print(f"{mode:<9}{s['p50']:>9.1f}{s['p95']:>9.1f}{b['p50']:>11.1f}{b['p95']:>11.1f}"
+              f"{b['max']:>11.1f}{b['wall_s']:>9.2f}"
+              f"{s['answered'] + b['answered']:>6}/{s['sent'] + b['sent']}")
+        ok &= s["answered"] == s["sent"] and b["answered"] == b["sent"]
+    w = res["webhook"]
+    print(f"webhook: wrong secret → {w['bad_secret']}, not an update → {w['bad_body']}, {w['hook']}")
+    ok &= w["bad_secret"] == 401 and w["bad_body"] == 400
+    ok &= w["hook"]["accepted"] == w["hook"]["handled"] == a.commands + a.burst
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
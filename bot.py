@@ -7,26 +7,42 @@ Telegram-бот RDA Cluster (Python 3.13, aiogram 3.20).
 """
 
 import asyncio
-import hashlib
-import json
 import logging
-import pathlib
 import re
-import socketio
-import html
+import time
+from time import perf_counter
+from typing import Awaitable, Callable
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.filters import StateFilter
 from aiogram.filters.command import Command, CommandObject
-from aiogram.types import Message, CallbackQuery, BotCommand
+from aiogram.types import Message, CallbackQuery, BotCommand, ReplyParameters
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
+import archive
+import chunker
 import config
-import storage as db
+import delivery
+import digest
+import filters
+import ingest
 import keyboards
+import metrics
+import rda_catalog
 import rda_parser
+import repeat
+import sources
+import spots
+import templates
+import webhook
+
+if config.DB_BACKEND == "sqlalchemy":
+    import db
+else:
+    import storage as db
 
 # ───── Логирование ─────
 logging.basicConfig(
@@ -35,30 +51,21 @@ logging.basicConfig(
 )
 log = logging.getLogger("RDA-bot")
 
-# ───── Загрузка RDA-кодов ─────
-def load_rda() -> set[str]:
-    for p in ("RDA_list_2025.json", "RDA_list_2025.csv"):
-        f = pathlib.Path(p)
-        if not f.exists():
-            continue
-        if f.suffix == ".json":
-            return set(json.loads(f.read_text(encoding="utf-8")))
-        codes = set()
-        for enc in ("utf-8-sig","utf-8","cp1251","koi8-r","latin1"):
-            try:
-                with f.open(encoding=enc) as fh:
-                    for ln in fh:
-                        code = re.split(r"[;\t ,]+", ln.strip())[0]
-                        if re.fullmatch(r"[A-Z]{2}-\d{2}", code):
-                            codes.add(code)
-                break
-            except UnicodeDecodeError:
-                continue
-        return codes
-    return set()
-
-RDA_SET = load_rda()
-log.info("RDA codes loaded: %s", len(RDA_SET) or "none")
+# ───── Каталог RDA-кодов (двоичный кэш рядом со списком) ─────
+RDA = rda_catalog.catalog.load()
+log.info("RDA codes loaded: %s", len(RDA) or "none")
+
+def expand_rda(tokens) -> tuple[set[str], set[str]]:
+    """Коды и шаблоны «AD-*» → (коды, неизвестные)"""
+    codes: set[str] = set()
+    wrong: set[str] = set()
+    for t in tokens:
+        got = RDA.expand(t)
+        if got:
+            codes.update(got)
+        else:
+            wrong.add(t.upper())
+    return codes, wrong
 
 # ───── Инициализация бота ─────
 bot = Bot(
@@ -68,29 +75,119 @@ bot = Bot(
 dp = Dispatcher()
 MAX_LEN = 4096
 
+# все исходящие сообщения идут через планировщик с лимитами Telegram
+outbox = delivery.Scheduler(
+    bot,
+    workers=config.SEND_WORKERS,
+    rate=config.SEND_RATE,
+    chat_rate=config.SEND_CHAT_RATE,
+    chat_burst=config.SEND_CHAT_BURST,
+    trip_after=config.SEND_TRIP_AFTER,
+    backoff_base=config.SEND_BACKOFF_BASE,
+    backoff_cap=config.SEND_BACKOFF_MAX,
+    on_dead=lambda cid, reason: chat_gone(cid, reason),
+    on_alive=lambda cid: asyncio.create_task(revive_chat(cid)),
+    on_migrate=lambda old, new: chat_migrated(old, new),
+)
+Lane = delivery.Lane
+
+# резидентный индекс фильтров подписчиков на споты (грузится в on_startup)
+if config.SPOT_MATCH == "vector":
+    import vecmatch
+    subs = vecmatch.VectorIndex()
+    # споты из разных воркеров spot_queue за окно — одной матрицей
+    matcher = vecmatch.MicroBatcher(subs.match_batch, window=config.VECTOR_WINDOW_MS / 1000,
+                                    max_batch=config.VECTOR_MAX_BATCH)
+else:
+    subs = filters.SubscriberIndex()
+
+# Режим fanout.py: процесс-доставщик владеет шардом чатов (chat_id % N == k),
+# хаб при смене настроек чата шлёт их снимок владельцу (on_chat_change).
+SHARD: tuple[int, int] | None = None
+on_chat_change: Callable[[int], None] | None = None
+on_chat_migrate: Callable[[int, int], None] | None = None   # доставщик → хаб
+
+def own(cid: int) -> bool:
+    return SHARD is None or cid % SHARD[1] == SHARD[0]
+
+def chat_changed(cid: int):
+    """Вызывается хендлерами после правки фильтров/шаблона/дайджеста чата"""
+    if on_chat_change is not None:
+        on_chat_change(cid)
+
+def chat_gone(cid: int, reason: str):
+    """Бот заблокирован / чат удалён: рассылки прекращаются, подписки
+    снимаются в БД и запоминаются до /start (db.set_dormant)"""
+    subs.subscribe(cid, False)
+
+    async def prune():
+        try:
+            kinds = await db.set_dormant(cid, reason)
+            log.info("Chat %s pruned (%s), subscriptions kept for /start: %s",
+                     cid, reason, " ".join(kinds) or "none")
+        except Exception:
+            log.exception("prune chat %s", cid)
+    asyncio.create_task(prune())
+
+def chat_migrated(old: int, new: int):
+    """Группа стала супергруппой: фильтры, подписка, шаблон, окна дайджеста
+    и повторов — на новый id (в БД — db.migrate_chat); очередь отправки
+    планировщик переносит сам. Повторный вызов для той же пары безвреден.
+    Хаб fanout.py шлёт снимки обоих чатов их владельцам; доставщик сам
+    ничего не переносит — только отписывает old и сообщает хабу"""
+    if on_chat_migrate is not None:
+        subs.subscribe(old, False)
+        on_chat_migrate(old, new)
+        return
+    changed = subs.move(old, new)
+    if digests.window(old):
+        digests.set_window(new, digests.window(old))
+        digests.set_window(old, 0)              # накопленное уйдёт и переедет следом
+        changed = True
+    if repeats.window(old) is not None:
+        repeats.set_window(new, repeats.window(old))
+        repeats.set_window(old, None)
+        changed = True
+    if changed:
+        chat_changed(old)
+        chat_changed(new)
+
+    async def move():
+        try:
+            await db.migrate_chat(old, new)
+            log.info("Chat %s migrated to %s", old, new)
+        except Exception:
+            log.exception("migrate chat %s → %s", old, new)
+    asyncio.create_task(move())
+
+async def revive_chat(cid: int) -> list[str]:
+    """Чат вернулся: подписки спящего чата — обратно"""
+    outbox.revive(cid)
+    kinds = await db.revive(cid)
+    if kinds:
+        subs.subscribe(cid, "spot" in kinds)
+        chat_changed(cid)
+        log.info("Chat %s revived: %s", cid, " ".join(kinds))
+    return kinds
+
 # ───── Вспомогательные функции ─────
-def sha(*parts: str) -> str:
-    return hashlib.sha1("|".join(parts).encode()).hexdigest()
-
-def sanitize_html(text: str) -> str:
-    esc = html.escape(text)
-    for tag in ("b", "i"):
-        esc = esc.replace(f"&lt;{tag}&gt;", f"<{tag}>")
-        esc = esc.replace(f"&lt;/{tag}&gt;", f"</{tag}>")
-    return esc
-
-async def send_big(cid: int, text: str):
-    # разбиваем по строкам, аккуратно набирая куски до MAX_LEN
-    chunks: list[str] = []
-    for line in text.split("\n"):
-        if not chunks or len(chunks[-1]) + len(line) + 1 > MAX_LEN:
-            chunks.append(line)
-        else:
-            chunks[-1] += "\n" + line
-    # отправляем уже «целые» куски с корректными HTML-тегами
-    for chunk in chunks:
-        safe = sanitize_html(chunk)
-        await bot.send_message(cid, safe, parse_mode=ParseMode.HTML)
+def split_html(text: str) -> list[str]:
+    """Куски с корректными тегами, каждый до MAX_LEN единиц UTF-16 (chunker.py)"""
+    return chunker.split_html(text, MAX_LEN)
+
+def send_chunks(cid: int, chunks: list[str], lane: Lane = Lane.REPLY, *,
+                wait: bool = True, **kw) -> asyncio.Future | None:
+    """Готовые куски (split_html) — в очередь; один рендер на много чатов"""
+    metrics.SEND_CHUNKS.observe(len(chunks))
+    return outbox.submit(cid, chunks, lane, wait=wait, parse_mode=ParseMode.HTML, **kw)
+
+def send_big(cid: int, text: str, lane: Lane = Lane.REPLY, *,
+             wait: bool = True, **kw) -> asyncio.Future | None:
+    return send_chunks(cid, split_html(text), lane, wait=wait, **kw)
+
+async def answer(m: Message, text: str, **kw):
+    """Ответ на команду — через приоритетную полосу планировщика"""
+    return await send_big(m.chat.id, text, **kw)
 
 def split_args(m: Message, cmd: CommandObject | None) -> str:
     if cmd and cmd.args:
@@ -105,10 +202,16 @@ async def allowed(cid: int, rda: str, mode: str, freq: float) -> bool:
     if rda_list and not any(x in rda.split() for x in rda_list):
         return False
     m, lo, hi = await db.misc(cid)
-    if m and m != "ANY" and m != mode.upper():
+    if m and m != "ANY" and m != spots.norm_mode(mode):
         return False
     return (lo is None or lo <= freq) and (hi is None or freq <= hi)
 
+# Служебное сообщение в старой группе — раньше хендлеров FSM: ввод в мастере
+# настроек иначе примет его за ответ. В fanout.py его получает хаб.
+@dp.message(F.migrate_to_chat_id)
+async def on_chat_migrated(m: Message):
+    chat_migrated(m.chat.id, m.migrate_to_chat_id)
+
 # ─────────────────── FSM: мастер настроек ────────────────────
 class SettingsSG(StatesGroup):
     choosing  = State()  # главное меню
@@ -116,6 +219,8 @@ class SettingsSG(StatesGroup):
     band_from = State()  # выбор предустановки или ручного ввода
     band_to   = State()  # ввод вручную
     rda       = State()  # ввод списка RDA
+    digest    = State()  # окно дайджеста
+    repeat    = State()  # окно подавления повторов
 
 @dp.message(Command("settings"))
 async def cmd_settings(m: Message, state: FSMContext):
@@ -124,14 +229,21 @@ async def cmd_settings(m: Message, state: FSMContext):
     await state.update_data(
         mode=mode or "ANY",
         band=(lo if lo is not None else 0.1, hi if hi is not None else 30.0),
-        rda=rda_lst
+        rda=rda_lst,
+        digest=await db.get_digest(m.chat.id),
+        repeat=await db.get_repeat(m.chat.id)
     )
-    await m.answer("🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
+    await answer(m, "🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
     await state.set_state(SettingsSG.choosing)
 
-@dp.callback_query(F.data == "settings_back", SettingsSG.choosing)
-async def cb_settings_back(cq: CallbackQuery):
+@dp.callback_query(
+    F.data == "settings_back",
+    StateFilter(SettingsSG.choosing, SettingsSG.band_from, SettingsSG.digest,
+                SettingsSG.repeat)
+)
+async def cb_settings_back(cq: CallbackQuery, state: FSMContext):
     await cq.message.edit_text("🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
+    await state.set_state(SettingsSG.choosing)
 
 # 1) Режим
 @dp.callback_query(F.data == "set_mode", SettingsSG.choosing)
@@ -176,40 +288,93 @@ async def msg_band_to(m: Message, state: FSMContext):
     if len(parts) == 2 and all(re.fullmatch(r"\d+(\.\d+)?", p) for p in parts):
         lo, hi = sorted(map(float, parts))
         await state.update_data(band=(lo, hi))
-        await m.answer(f"Диапазон {lo}–{hi} МГц установлен!")
-        await m.answer("🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
+        await answer(m, f"Диапазон {lo}–{hi} МГц установлен!")
+        await answer(m, "🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
         await state.set_state(SettingsSG.choosing)
     else:
-        await m.reply("Неверный формат. Напишите: два числа через пробел, например: `1.8 29.0`.")
+        await answer(
+            m,
+            "Неверный формат. Напишите: два числа через пробел, например: `1.8 29.0`.",
+            reply_parameters=ReplyParameters(message_id=m.message_id)
+        )
 
 # 3) RDA-зоны
 @dp.callback_query(F.data == "set_rda", SettingsSG.choosing)
 async def cb_set_rda(cq: CallbackQuery, state: FSMContext):
     current = (await state.get_data())["rda"]
     await cq.message.edit_text(
-        f"Текущий RDA: {', '.join(current) or '—'}\nВведите новые через запятую:"
+        f"Текущий RDA: {', '.join(RDA.compact(current)) or '—'}\n"
+        "Введите новые через запятую (область целиком — AD-*):"
     )
     await state.set_state(SettingsSG.rda)
 
 @dp.message(SettingsSG.rda)
 async def msg_rda(m: Message, state: FSMContext):
-    items = [x.strip().upper() for x in m.text.split(",") if x.strip()]
-    await state.update_data(rda=items)
-    await m.answer("Список RDA обновлён!")
-    await m.answer("🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
+    codes, wrong = expand_rda(x.strip() for x in m.text.split(",") if x.strip())
+    if wrong:
+        await answer(m, "⚠ Неизвестные: " + " ".join(sorted(wrong)))
+    await state.update_data(rda=sorted(codes))
+    await answer(m, "Список RDA обновлён!")
+    await answer(m, "🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
+    await state.set_state(SettingsSG.choosing)
+
+# 4) Дайджест
+@dp.callback_query(F.data == "set_digest", SettingsSG.choosing)
+async def cb_set_digest(cq: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await cq.message.edit_text(
+        "Споты одним сообщением раз в…",
+        reply_markup=keyboards.digest_menu(data.get("digest", 0))
+    )
+    await state.set_state(SettingsSG.digest)
+
+@dp.callback_query(F.data.startswith("digest|"), SettingsSG.digest)
+async def cb_digest_selected(cq: CallbackQuery, state: FSMContext):
+    sec = int(cq.data.split("|", 1)[1])
+    await state.update_data(digest=sec)
+    await cq.answer(f"Дайджест → {digest.label(sec)}")
+    await cq.message.edit_text("🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
     await state.set_state(SettingsSG.choosing)
 
-# 4) Сохранение настроек
+# 5) Повторы
+@dp.callback_query(F.data == "set_repeat", SettingsSG.choosing)
+async def cb_set_repeat(cq: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await cq.message.edit_text(
+        "Тот же позывной с тем же RDA — не чаще раза в… (смена диапазона или моды — сразу)",
+        reply_markup=keyboards.repeat_menu(data.get("repeat"), config.REPEAT_MIN)
+    )
+    await state.set_state(SettingsSG.repeat)
+
+@dp.callback_query(F.data.startswith("repeat|"), SettingsSG.repeat)
+async def cb_repeat_selected(cq: CallbackQuery, state: FSMContext):
+    v = cq.data.split("|", 1)[1]
+    minutes = None if v == "default" else int(v)
+    await state.update_data(repeat=minutes)
+    await cq.answer(f"Повторы → {repeat.label(minutes, config.REPEAT_MIN)}")
+    await cq.message.edit_text("🔧 Мастер настроек:", reply_markup=keyboards.settings_menu())
+    await state.set_state(SettingsSG.choosing)
+
+# 6) Сохранение настроек
 @dp.callback_query(F.data == "set_done", SettingsSG.choosing)
 async def cb_done(cq: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     mode_v = data["mode"] if data["mode"] != "ANY" else None
-    await db.set_mode(cq.from_user.id, mode_v)
     lo, hi = data["band"]
-    await db.set_band(cq.from_user.id, lo, hi)
-    await db.clear_rda(cq.from_user.id)
-    if data["rda"]:
-        await db.add_rda(cq.from_user.id, *data["rda"])
+    async with db.transaction():
+        await db.set_mode(cq.from_user.id, mode_v)
+        await db.set_band(cq.from_user.id, lo, hi)
+        await db.clear_rda(cq.from_user.id)
+        if data["rda"]:
+            await db.add_rda(cq.from_user.id, *data["rda"])
+        await db.set_digest(cq.from_user.id, data.get("digest", 0))
+        await db.set_repeat(cq.from_user.id, data.get("repeat"))
+    subs.set_mode(cq.from_user.id, mode_v)
+    subs.set_band(cq.from_user.id, lo, hi)
+    subs.set_rda(cq.from_user.id, data["rda"])
+    digests.set_window(cq.from_user.id, data.get("digest", 0))
+    repeats.set_window(cq.from_user.id, data.get("repeat"))
+    chat_changed(cq.from_user.id)
     await cq.message.edit_text("Все настройки сохранены ✅")
     await state.clear()
 
@@ -217,8 +382,11 @@ async def cb_done(cq: CallbackQuery, state: FSMContext):
 @dp.message(Command("start"))
 async def cmd_start(m: Message, command: CommandObject | None = None):
     await db.upsert_user(m.chat.id, m.from_user.first_name, m.from_user.username)
-    await m.answer(
-        "👋 Бот рассылает анонсы и live-споты RDA.\nСправка — /help",
+    back = await revive_chat(m.chat.id)
+    await answer(
+        m,
+        "👋 Бот рассылает анонсы и live-споты RDA.\nСправка — /help"
+        + ("\n\n🔔 С возвращением! Подписки восстановлены." if back else ""),
         reply_markup=keyboards.main_kb()
     )
 
@@ -227,17 +395,23 @@ async def cmd_help(m: Message, command: CommandObject | None = None):
     await send_big(m.chat.id,
         "/sub_ann /unsub_ann — подписка/отписка от анонсов\n"
         "/sub_spots /unsub_spots — подписка/отписка от спотов\n"
-        "/add_rda AD-01 … — добавить RDA-фильтр\n"
+        "/add_rda AD-01 AD-* … — добавить RDA-фильтр (AD-* — вся область)\n"
         "/set_mode DIGI|CW|SSB|ANY — фильтр по моде\n"
         "/set_band 1.8 29.0 | OFF — диапазон МГц\n"
         "/my_filters — текущие фильтры\n"
         "/clear_rda — убрать все RDA-фильтры\n"
+        "/set_template … | OFF — свой шаблон спота\n"
+        "/recent [RDA|позывной|20m] [минут] — последние споты\n"
+        "/history RDA|позывной [20m] [дней] — архив спотов\n"
         "/settings — открыть мастер настроек"
     )
 
 async def _sub(m: Message, kind: str, on: bool):
     await db.change_sub(m.chat.id, kind, on)
-    await m.answer("✅ Ок." if on else "❌ Больше не присылаю.")
+    if kind == "spot":
+        subs.subscribe(m.chat.id, on)
+        chat_changed(m.chat.id)
+    await answer(m, "✅ Ок." if on else "❌ Больше не присылаю.")
 
 @dp.message(Command("sub_ann"))
 async def sub_ann(m: Message): await _sub(m, "ann", True)
@@ -248,45 +422,225 @@ async def sub_spots(m: Message): await _sub(m, "spot", True)
 @dp.message(Command("unsub_spots"))
 async def unsub_spots(m: Message): await _sub(m, "spot", False)
 
+# общий снимок анонсов (его же обновляет ann_loop) и куски его текста:
+# (версия снимка, wrap) → split_html
+rda_parser.snapshot.ttl = config.ANN_TTL_SEC
+ann_chunks: dict[tuple[int, int], list[str]] = {}
+
 @dp.message(Command("announcements"))
+@dp.message(F.text == "📋 Анонсы")
 async def cmd_ann(m: Message, command: CommandObject | None = None):
-    txt = rda_parser.build_announcements_message()
-    await send_big(m.chat.id, txt or "Сейчас анонсов нет.")
+    snap, wrap = rda_parser.snapshot, config.ANN_WRAP
+    try:
+        await snap.get()
+    except Exception as e:
+        log.warning("announcements: site unavailable, no snapshot yet: %s", e)
+        return await answer(m, "⚠ Сайт анонсов недоступен, попробуйте позже.")
+    txt = snap.text(wrap) or "Сейчас анонсов нет."
+    if snap.error is not None:
+        # сайт не ответил — прошлый снимок с его возрастом (редко, без кэша)
+        when = time.strftime("%H:%M", time.gmtime(snap.stamp))
+        return await send_big(m.chat.id, f"⚠ Сайт анонсов недоступен — данные на {when}Z "
+                                         f"({int(snap.age() // 60)} мин назад).\n\n{txt}")
+    key = (snap.version, wrap)
+    chunks = ann_chunks.get(key)
+    if chunks is None:
+        ann_chunks.clear()                  # прошлые версии снимка больше не нужны
+        chunks = ann_chunks[key] = split_html(txt)
+    await send_chunks(m.chat.id, chunks)
 
 @dp.message(Command("add_rda"))
 async def cmd_add_rda(m: Message, command: CommandObject | None):
-    codes = {c.upper() for c in re.split(r"[ ,;]+", split_args(m, command)) if c}
-    if not codes:
-        return await m.answer("Передайте коды (пример: /add_rda AD-01 BR-10).")
-    if RDA_SET:
-        wrong = codes - RDA_SET
-        if wrong:
-            await m.answer("⚠ Неизвестные: " + " ".join(sorted(wrong)))
-            codes -= wrong
+    tokens = [c for c in re.split(r"[ ,;]+", split_args(m, command)) if c]
+    if not tokens:
+        return await answer(m, "Передайте коды (пример: /add_rda AD-01 BR-10 или AD-*).")
+    codes, wrong = expand_rda(tokens)
+    if wrong:
+        await answer(m, "⚠ Неизвестные: " + " ".join(sorted(wrong)))
     added = await db.add_rda(m.chat.id, *codes)
-    await m.answer(
-        "🎯 Добавлено: " + ", ".join(sorted(added))
+    subs.set_rda(m.chat.id, added)
+    chat_changed(m.chat.id)
+    await answer(
+        m,
+        "🎯 Добавлено: " + ", ".join(RDA.compact(added))
         if added else "Уже было."
     )
 
 @dp.message(Command("clear_rda"))
 async def cmd_clear_rda(m: Message):
     await db.clear_rda(m.chat.id)
-    await m.answer("✅ Все RDA-фильтры удалены.")
+    subs.set_rda(m.chat.id, ())
+    chat_changed(m.chat.id)
+    await answer(m, "✅ Все RDA-фильтры удалены.")
+
+@dp.message(Command("set_mode"))
+async def cmd_set_mode(m: Message, command: CommandObject | None):
+    mode = split_args(m, command).strip().upper()
+    if mode not in ("ANY", "CW", "SSB", "DIGI"):
+        return await answer(m, "Пример: /set_mode CW (DIGI|CW|SSB|ANY).")
+    mode_v = mode if mode != "ANY" else None
+    await db.set_mode(m.chat.id, mode_v)
+    subs.set_mode(m.chat.id, mode_v)
+    chat_changed(m.chat.id)
+    await answer(m, f"✅ Мода: {mode}")
+
+@dp.message(Command("set_band"))
+async def cmd_set_band(m: Message, command: CommandObject | None):
+    parts = re.split(r"[ ,]+", split_args(m, command).strip())
+    if len(parts) == 1 and parts[0].upper() == "OFF":
+        lo = hi = None
+    elif len(parts) == 2 and all(re.fullmatch(r"\d+(\.\d+)?", p) for p in parts):
+        lo, hi = sorted(map(float, parts))
+    else:
+        return await answer(m, "Пример: /set_band 1.8 29.0 или /set_band OFF.")
+    await db.set_band(m.chat.id, lo, hi)
+    subs.set_band(m.chat.id, lo, hi)
+    chat_changed(m.chat.id)
+    await answer(
+        m,
+        f"✅ Диапазон {lo}–{hi} МГц" if lo is not None else "✅ Фильтр диапазона снят."
+    )
+
+@dp.message(Command("set_template"))
+async def cmd_set_template(m: Message, command: CommandObject | None):
+    fmt = split_args(m, command).strip()
+    if not fmt:
+        return await answer(
+            m,
+            "Пример: /set_template {callsign} • {mode} • {freq:.1f}kHz • {rda}\n"
+            "Поля: " + ", ".join(f"{{{f}}}" for f in templates.FIELDS) + "\n"
+            "/set_template OFF — вернуть стандартный."
+        )
+    if fmt.upper() == "OFF":
+        fmt = config.DEFAULT_FMT
+    try:
+        await db.set_template(m.chat.id, fmt)
+    except ValueError as e:
+        return await answer(m, f"⚠ Шаблон не принят: {e}")
+    subs.set_template(m.chat.id, fmt)
+    chat_changed(m.chat.id)
+    await answer(m, "✅ Шаблон сохранён.")
 
 @dp.message(Command("my_filters"))
 async def cmd_my_filters(m: Message, command: CommandObject | None = None):
     mode, lo, hi = await db.misc(m.chat.id)
     rda = await db.get_rda(m.chat.id)
-    await m.answer(
+    await answer(
+        m,
         f"Mode: {mode or 'ANY'}\n"
         f"Band: {lo or 0.0}–{hi or 0.0} МГц\n"
-        f"RDA: {'; '.join(sorted(rda)) if rda else 'все'}"
+        f"RDA: {'; '.join(RDA.compact(rda)) if rda else 'все'}\n"
+        f"Дайджест: {digest.label(digests.window(m.chat.id))}\n"
+        f"Повторы: {repeat.label(repeats.window(m.chat.id), config.REPEAT_MIN)}"
     )
 
+@dp.message(Command("recent"))
+async def cmd_recent(m: Message, command: CommandObject | None = None):
+    """Последние споты из памяти (кольцо recent) с фильтрами чата"""
+    q: dict = {}
+    minutes = None
+    for tok in split_args(m, command).upper().split():
+        band = tok.lower().replace("м", "m")
+        if tok.isdigit():
+            minutes = int(tok)
+        elif band in spots.BAND_NAMES:
+            q["band"] = band
+        elif spots.RDA_RE.fullmatch(tok):
+            q["rda"] = tok
+        elif spots.CALL_RE.fullmatch(tok):
+            q["callsign"] = tok
+        else:
+            return await answer(
+                m, "Пример: /recent 20m 60 — споты на 20 м за час; "
+                   "/recent AD-01, /recent R0BI."
+            )
+    f = subs.get(m.chat.id)
+    now = time.time()
+    found = recent.query(
+        **q, since=now - minutes * 60 if minutes else 0.0, limit=config.RECENT_LIMIT,
+        where=lambda s: f.match(s.mask, s.mode, s.freq)
+    )
+    if not found:
+        return await answer(m, "Подходящих спотов не было.")
+    lines = [
+        f"⏰ {s.time} <b>{s.callsign}</b> {s.freq:.1f} {s.mode} {s.rda}"
+        f"{' — ' + s.text if s.text else ''} ({int(now - s.ts) // 60} мин назад)"
+        for s in found
+    ]
+    await answer(m, f"🕑 Последние споты ({len(found)}):\n" + "\n".join(lines))
+
+@dp.message(Command("history"))
+async def cmd_history(m: Message, command: CommandObject | None = None):
+    """Споты из архива (archive.py) по RDA или позывному за N суток"""
+    q: dict = {}
+    days = config.HISTORY_DAYS
+    for tok in split_args(m, command).upper().split():
+        band = tok.lower().replace("м", "m")
+        if tok.isdigit():
+            days = max(1, min(int(tok), config.ARCHIVE_DAYS))
+        elif band in spots.BAND_NAMES:
+            q["band"] = band
+        elif spots.RDA_RE.fullmatch(tok):
+            q["rda"] = tok
+        elif spots.CALL_RE.fullmatch(tok):
+            q["callsign"] = tok
+        else:
+            q = {}
+            break
+    if history is None:
+        return await answer(m, "Архив спотов выключен.")
+    if not (q.get("rda") or q.get("callsign")):
+        return await answer(
+            m, "Пример: /history AD-01 — был ли район в эфире за неделю; "
+               "/history R0BI 30, /history AD-01 20m 3."
+        )
+    per_day, rows = await history.query(**q, days=days, limit=config.HISTORY_LIMIT)
+    what = " ".join(v for v in (q.get("rda"), q.get("callsign"), q.get("band")) if v)
+    if not per_day:
+        return await answer(m, f"📚 {what}: за {days} сут. спотов нет.")
+    by_day = " · ".join(f"{d % 100:02d}.{d // 100 % 100:02d}: {n}" for d, n in per_day.items())
+    lines = [
+        f"⏰ {time.strftime('%d.%m %H:%M', time.gmtime(ts))}Z <b>{call}</b> {freq:.1f} {mode} {rda}"
+        f"{' — ' + text if text else ''}"
+        for ts, call, freq, mode, band, rda, text, spotter, t in rows
+    ]
+    await answer(
+        m, f"📚 {what} за {days} сут.: {sum(per_day.values())} спот(ов), "
+           f"дней в эфире: {len(per_day)}\n{by_day}\n\n" + "\n".join(lines)
+    )
+
+@dp.message(Command("delivery"), F.from_user.id.in_(set(config.ADMIN_IDS)))
+async def cmd_delivery(m: Message, command: CommandObject | None = None):
+    """Статистика доставки этого процесса и спящие чаты из БД (ADMIN_IDS)"""
+    st, h = outbox.stats(), outbox.health()
+    dormant = await db.count_dormant()
+    await answer(
+        m,
+        f"📬 Отправлено {st['sent']}, сбоев {st['failed']}, пропущено {st['skipped']}, "
+        f"RetryAfter {st['retries']}\n"
+        f"Чаты: здоровых {h['healthy']}, на паузе {h['tripped']} "
+        f"(со сбоями {h['failing']}, срабатываний {st['trips']}), "
+        f"недоступных {h['dead']}\n"
+        f"Спящие в БД: {sum(dormant.values())}"
+        + "".join(f"\n  • {why}: {n}" for why, n in sorted(dormant.items()))
+    )
+
+async def load_state():
+    """Индекс фильтров, окна дайджеста и повторов из БД (только свой шард, если задан)"""
+    loaded = await db.load_filters()
+    subs.load(
+        [cid for cid in await db.subscribers("spot") if own(cid)],
+        {cid: filters.Filter(*row) for cid, row in loaded.items() if own(cid)},
+        {cid: fmt for cid, fmt in (await db.load_templates()).items() if own(cid)}
+    )
+    log.info("Spot index: %s subscribers", len(subs))
+    digests.load({cid: sec for cid, sec in (await db.load_digests()).items() if own(cid)})
+    repeats.load({cid: mins for cid, mins in (await db.load_repeats()).items() if own(cid)})
+
 @dp.startup()
 async def on_startup():
     await db.init_db()
+    await load_state()
     await bot.set_my_commands([
         BotCommand(command="announcements", description="Текущие анонсы"),
         BotCommand(command="sub_ann",       description="Подписаться на анонсы"),
@@ -295,57 +649,293 @@ async def on_startup():
         BotCommand(command="unsub_spots",   description="Отписаться от спотов"),
         BotCommand(command="add_rda",       description="Добавить фильтр RDA"),
         BotCommand(command="clear_rda",     description="Очистить RDA-фильтры"),
+        BotCommand(command="set_mode",      description="Фильтр по моде"),
+        BotCommand(command="set_band",      description="Фильтр по диапазону"),
+        BotCommand(command="set_template",  description="Шаблон спота"),
         BotCommand(command="my_filters",    description="Мои фильтры"),
+        BotCommand(command="recent",        description="Последние споты"),
+        BotCommand(command="history",       description="Архив спотов"),
         BotCommand(command="settings",      description="Мастер настроек"),
     ])
+    if config.METRICS_PORT:
+        await metrics.serve(config.METRICS_HOST, config.METRICS_PORT)
+        log.info("Metrics on http://%s:%s/metrics", config.METRICS_HOST, config.METRICS_PORT)
+    outbox.start()
+    spot_queue.start()
+    asyncio.create_task(digests.run())
     asyncio.create_task(ann_loop())
-    asyncio.create_task(ws_loop())
+    asyncio.create_task(cluster_loop())
     log.info("🚀 Bot started")
 
+@dp.shutdown()
+async def on_shutdown():
+    await spot_queue.stop()
+    digests.flush_all()
+    if history is not None:
+        await history.close()
+    await outbox.stop()
+    await rda_parser.close()
+    await metrics.stop()
+    await db.close_db()
+
+# ─── Споты: очередь приёма и рассылка ───
+async def query_groups(rda: str, mode: str, freq: float) -> dict[templates.Template, list[int]]:
+    """Подбор одним запросом к БД (SPOT_MATCH = "query"), группы — как by_template"""
+    groups: dict[templates.Template, list[int]] = {}
+    for cid, fmt in await db.match_spot(rda, mode, freq):
+        if not own(cid):
+            continue
+        try:
+            tmpl = templates.compile_template(fmt)
+        except ValueError:
+            tmpl = templates.DEFAULT
+        groups.setdefault(tmpl, []).append(cid)
+    return groups
+
+async def dispatch_spot(s: spots.Spot) -> bool:
+    if not await db.is_new(s.key): return False
+    recent.add(s)
+    if history is not None:
+        history.add(s)
+    await spot_sink(s)
+    return True
+
+async def deliver_spot(s: spots.Spot):
+    t0 = perf_counter()
+    if config.SPOT_MATCH == "query":
+        groups = await query_groups(s.rda, s.mode, s.freq)
+    elif config.SPOT_MATCH == "vector":
+        groups = subs.by_template(await matcher.submit((s.rda, s.mode, s.freq)))
+    else:
+        groups = subs.by_template(subs.match(s.rda, s.mode, s.freq))
+    metrics.FILTER_SEC.observe(perf_counter() - t0)
+    fields = s.fields()
+    for tmpl, cids in groups.items():
+        # повтор того же позывного/RDA на той же полосе и моде — мимо чата
+        cids = repeats.filter(cids, s.callsign, s.rda, s.band, s.mode)
+        if not cids:
+            continue
+        # рендер и sanitize — один раз на шаблон, не на подписчика
+        out = tmpl.render(**fields)
+        chunks = None
+        for cid in cids:
+            if digests.add(cid, out):
+                continue
+            if chunks is None:
+                chunks = split_html(out)
+            send_chunks(cid, chunks, Lane.SPOT, wait=False)
+
+def send_digest(cid: int, texts: list[str]):
+    send_big(cid, f"🗞 <b>Дайджест</b>: {len(texts)} спот(ов)\n\n" + "\n\n".join(texts),
+             Lane.SPOT, wait=False)
+
+# буферы дайджеста (окна чатов грузятся в on_startup)
+digests = digest.Digest(
+    send_digest,
+    max_items=config.DIGEST_MAX_ITEMS,
+    max_total=config.DIGEST_MAX_TOTAL,
+)
+
+# недавно доставленные (позывной, RDA, диапазон, мода) по чатам — для подавления повторов
+repeats = repeat.Repeats(config.REPEAT_MIN, max_entries=config.REPEAT_MAX_ENTRIES)
+
+# разбор строк кластера и кольцо последних спотов для /recent
+wire = spots.WireParser()
+recent = spots.Recent(config.RECENT_SIZE)
+# архив всех спотов для /history — пишется пачками в фоне
+history = archive.Archive(
+    config.ARCHIVE_PATH,
+    days=config.ARCHIVE_DAYS,
+    flush_batch=config.ARCHIVE_FLUSH_BATCH,
+    flush_sec=config.ARCHIVE_FLUSH_SEC,
+) if config.ARCHIVE_PATH else None
+
+spot_queue = ingest.SpotPipeline(
+    dispatch_spot,
+    workers=config.SPOT_WORKERS,
+    maxsize=config.SPOT_QUEUE_SIZE,
+    policy=config.SPOT_OVERFLOW,
+)
+
+# узлы кластера → разбор → дубли между узлами отсекаются → spot_queue
+# (сами источники создаются в cluster_loop: Socket.IO-клиенту нужен цикл)
+feeds: sources.Ingest | None = None
+# сервер webhook (создаётся в run_webhook; в режиме polling — None)
+hook: webhook.Webhook | None = None
+
+# ─── Метрики: показатели читаются в момент опроса /metrics ───
+async def _subscriber_counts() -> dict:
+    return {("spot",): len(subs), ("ann",): await db.count_subscribers("ann")}
+
+metrics.Gauge("rda_subscribers", "Subscribers by kind", _subscriber_counts, ("kind",))
+metrics.Gauge("rda_dedup_size", "Spot hashes in the dedup cache", db.seen_size)
+metrics.Gauge("rda_digest_buffered", "Spots waiting in digest buffers", lambda: len(digests))
+metrics.Gauge("rda_repeat_entries", "Recently delivered (callsign, RDA, chat) entries",
+              lambda: len(repeats))
+metrics.Counter("rda_repeat_total", "Repeat window: sends suppressed/passed, entries evicted",
+                lambda: {("suppressed",): repeats.suppressed, ("passed",): repeats.passed,
+                         ("evicted",): repeats.evicted}, ("outcome",))
+metrics.Gauge("rda_webhook_pending", "Webhook updates accepted and not yet handled",
+              lambda: len(hook) if hook is not None else 0)
+metrics.Counter("rda_webhook_updates_total", "Webhook requests by outcome",
+                lambda: {(k,): v for k, v in hook.stats().items()} if hook is not None else {},
+                ("outcome",))
+metrics.Gauge("rda_ingest_queued", "Spots waiting in the ingest queue", lambda: len(spot_queue))
+metrics.Counter("rda_ingest_spots_total", "Ingest queue outcomes",
+                lambda: {(k,): v for k, v in spot_queue.stats().items()
+                         if k in ("received", "deduped", "dropped", "coalesced",
+                                  "dispatched", "failed")},
+                ("outcome",))
+metrics.Counter("rda_ingest_lines_total", "Cluster lines by parse outcome",
+                lambda: {(k,): v for k, v in wire.stats().items()}, ("outcome",))
+def _source_stats(*keys: str) -> Callable[[], dict]:
+    def read() -> dict:
+        st = feeds.stats() if feeds is not None else {}
+        if len(keys) == 1:
+            return {(name,): v[keys[0]] for name, v in st.items()}
+        return {(name, k): v[k] for name, v in st.items() for k in keys}
+    return read
+
+metrics.Gauge("rda_source_up", "Cluster source connected (1 = up)",
+              _source_stats("up"), ("source",))
+metrics.Counter("rda_source_events_total", "Per-source lines, parsed spots, first arrivals, "
+                "cross-source copies, rejected lines and reconnects",
+                _source_stats("lines", "spots", "first", "copies", "rejected", "reconnects"),
+                ("source", "event"))
+metrics.Gauge("rda_source_seconds", "Per-source silence and spot lag (p50/p95, minute resolution)",
+              _source_stats("silent_sec", "lag_p50", "lag_p95"), ("source", "stat"))
+metrics.Gauge("rda_recent_spots", "Spots in the /recent ring buffer", lambda: len(recent))
+if history is not None:
+    metrics.Counter("rda_archive_spots_total", "Spots written to the archive",
+                    lambda: history.written)
+    metrics.Gauge("rda_archive_buffered", "Spots waiting for the archive flush",
+                  lambda: len(history))
+    metrics.Gauge("rda_archive_partitions", "Daily archive partitions on disk",
+                  lambda: len(history.partitions()))
+if config.SPOT_MATCH == "vector":
+    metrics.Counter("rda_vector_matched_total", "Vector engine micro-batches and spots",
+                    lambda: {("batches",): matcher.batches, ("spots",): matcher.items},
+                    ("kind",))
+metrics.Counter("rda_ann_snapshot_total", "/announcements snapshot: cache hits, site fetches, "
+                "requests that joined a running fetch, stale answers",
+                lambda: {(k,): getattr(rda_parser.snapshot, k)
+                         for k in ("hits", "fetches", "joined", "stale")},
+                ("outcome",))
+metrics.Gauge("rda_send_queue", "Outgoing messages queued by lane",
+              lambda: {(k,): v for k, v in outbox.stats()["depth"].items()}, ("lane",))
+metrics.Counter("rda_send_total", "Outgoing chunk outcomes",
+                lambda: {("sent",): outbox.sent, ("failed",): outbox.failed,
+                         ("retry",): outbox.retries, ("skipped",): outbox.skipped,
+                         ("migrated",): outbox.migrated},
+                ("outcome",))
+metrics.Gauge("rda_send_chats", "Chats by delivery health (this process)",
+              lambda: {(k,): v for k, v in outbox.health().items()}, ("state",))
+metrics.Counter("rda_send_breaker_trips_total", "Per-chat breaker trips",
+                lambda: outbox.trips)
+
 # ─── Background loops ───
+async def ann_delta(items: list[dict], known: dict[str, tuple[str, str, list[str]]],
+                    silent: bool = False):
+    """Сравнивает ленту с сохранённым состоянием, пишет дельту в БД и
+    рассылает только её — каждому подписчику по его RDA-фильтру.
+    known (id → (хэш, позывной, RDA)) обновляется."""
+    new, changed, removed = rda_parser.diff(
+        items, {i: v[0] for i, v in known.items()}
+    )
+    if not (new or changed or removed):
+        return
+    upsert = {a["id"]: (rda_parser.card_hash(a), a["callsign"], a["rdas"])
+              for a in new + changed}
+    gone = [known[i][1:] for i in removed]
+    await db.save_ann_state(upsert, removed)
+    for i in removed:
+        del known[i]
+    known.update(upsert)
+    if silent:
+        log.info("ann: warm-up, %s announcements stored silently", len(upsert))
+        return
+    await ann_sink(new, changed, gone)
+
+async def deliver_ann(new: list[dict], changed: list[dict], gone: list[tuple[str, list[str]]]):
+    """Дельта анонсов — каждому подписчику по его RDA-фильтру"""
+    delta = rda_parser.Delta(new, changed, gone)
+    chunks: dict[tuple[int, ...], list[str]] = {}
+    for cid in await db.subscribers("ann"):
+        if not own(cid):
+            continue
+        sel = delta.select(subs.get(cid).mask)
+        if not sel:
+            continue                    # под фильтр ничего не попало
+        if sel not in chunks:
+            chunks[sel] = split_html(delta.text(sel))
+        send_chunks(cid, chunks[sel], Lane.ANN, wait=False)
+
+# куда уходят новые споты и дельты анонсов: по умолчанию — рассылка в этом
+# же процессе; хаб fanout.py подменяет их публикацией в шину доставщикам
+spot_sink: Callable[[spots.Spot], Awaitable[None]] = deliver_spot
+ann_sink: Callable[[list, list, list], Awaitable[None]] = deliver_ann
+
 async def ann_loop():
-    last = None
+    # состояние анонсов живёт в БД: рестарт не повторяет всю ленту;
+    # лента загружается через общий снимок — /announcements берёт его же
+    known = await db.ann_state()
+    warmup = not known and config.ANN_SILENT_WARMUP
     while True:
         try:
-            txt = rda_parser.build_announcements_message(only_new=True)
-            if txt and txt != last:
-                last = txt
-                for cid in await db.subscribers("ann"):
-                    await send_big(cid, "🆕 <b>Новые анонсы</b>\n\n" + txt)
+            items = await rda_parser.snapshot.refresh()
+            if not items and known:
+                # пустая лента — скорее сбой разметки, чем снятие всех анонсов
+                log.warning("ann_loop: empty announcement list, state kept")
+            else:
+                await ann_delta(items, known, silent=warmup)
+                warmup = False
         except Exception:
             log.exception("ann_loop")
         await asyncio.sleep(config.CHECK_INTERVAL_SEC)
 
-async def ws_loop():
-    while True:
-        sio = socketio.AsyncClient(logger=False, engineio_logger=False)
-
-        @sio.on("new_spot")
-        async def on_spot(msg: str):
-            p = msg.split("|")
-            callsign, time, freq, mode = p[0], p[1], float(p[2]), p[3]
-            rda, text, spotter = p[5], p[7], p[8]
-            if not rda or rda=="?": return
-            if not await db.is_new(sha(callsign, time, p[2])): return
-            for cid in await db.subscribers("spot"):
-                if not await allowed(cid, rda, mode, freq): continue
-                out = (await db.get_template(cid)).format(
-                    callsign=callsign, mode=mode, freq=freq,
-                    rda=rda, text=text.strip(),
-                    spotter=spotter, time=time
-                )
-                await send_big(cid, out)
-
-        try:
-            await sio.connect(config.CLUSTER_WS_URL, transports=["websocket"])
-            log.info("WS connected")
-            await sio.wait()
-        except Exception:
-            log.exception("ws_loop")
-        await asyncio.sleep(15)
+async def cluster_loop():
+    global feeds
+    feeds = sources.Ingest(
+        [sources.open_source(url, config.CLUSTER_CALL, idle=config.SOURCE_IDLE_SEC,
+                             backoff=sources.Backoff(cap=config.SOURCE_BACKOFF_MAX))
+         for url in config.CLUSTER_SOURCES],
+        wire,
+        # только разбор и очередь — рассылка в воркерах spot_queue
+        lambda s: spot_queue.push(s, key=(s.callsign, s.rda)),
+    )
+    await feeds.run()
+
+async def run_webhook():
+    """Апдейты по webhook: сервер в этом же процессе, до SIGINT/SIGTERM"""
+    global hook
+    hook = webhook.Webhook(
+        dp, bot,
+        secret=config.WEBHOOK_SECRET,
+        concurrency=config.WEBHOOK_CONCURRENCY,
+        max_pending=config.WEBHOOK_MAX_PENDING,
+    )
+    await dp.emit_startup(bot=bot)
+    try:
+        await hook.start(config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH)
+        await bot.set_webhook(
+            config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=hook.secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(config.WEBHOOK_CONCURRENCY, 100),
+        )
+        await hook.wait_closed()
+    finally:
+        await hook.stop(config.WEBHOOK_GRACE_SEC)
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
 
 async def main():
-    await dp.start_polling(bot)
+    if config.WEBHOOK_URL:
+        await run_webhook()
+    else:
+        # webhook от прошлого запуска мешает getUpdates (409 Conflict)
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Разбиение HTML-сообщений на куски под лимит Telegram — за один проход.
+
+Вход — текст, где разметкой считаются только <b>, </b>, <i>, </i>;
+всё остальное экранируется (html.escape), как и раньше в sanitize_html.
+Длина считается по уже экранированному куску вместе с тегами и в
+единицах UTF-16 — так Telegram меряет текст (эмодзи вне BMP — две
+единицы). Это с запасом: сам Telegram не считает теги и сущности.
+
+Куски набираются жадно до лимита. Место разрыва (по убыванию
+предпочтения): перевод строки вне <b>/<i>, пробел вне тегов, перевод
+строки внутри, пробел внутри; из класса берётся последнее место, если
+оно не раньше середины куска. Только если пара тегов длиннее целого
+сообщения, она закрывается в конце куска и открывается в начале
+следующего — каждый кусок остаётся корректным HTML. Слово длиннее
+куска режется по символам; сущность (&amp; …) не разрывается никогда.
+"""
+
+import html
+import re
+from collections import deque
+
+LIMIT = 4096
+
+# тег | перевод строки | отрезок строки между тегами (с пробелами)
+_TOKEN_RE = re.compile(r"<(/?)([bi])>|(\n)|([^\n<]+|<)")
+
+_TAG_RE = re.compile(r"</?[bi]>")
+
+# виды атомов; разрывы: ранг = вид + 2 * (внутри тегов).
+# _LINE — целая строка с парными тегами внутри: кладётся одним атомом,
+# если влезает и снаружи тегов нет, иначе дробится на мелкие
+_NL, _SP, _TEXT, _OPEN, _CLOSE, _LINE = 0, 1, 2, 3, 4, 5
+
+
+def utf16_len(s: str) -> int:
+    return len(s) if s.isascii() else len(s.encode("utf-16-le")) // 2
+
+
+def _paired(tags: list[str]) -> bool:
+    stack = []
+    for t in tags:
+        if t[1] != "/":
+            if t[1] in stack:
+                return False
+            stack.append(t[1])
+        elif not stack or stack.pop() != t[2]:
+            return False
+    return not stack
+
+
+def _escape(text: str) -> str:
+    """html.escape с возвратом тегов — только когда все они парные"""
+    s = html.escape(text)
+    if "&lt;" in s:
+        for t in ("b", "i"):
+            s = s.replace(f"&lt;{t}&gt;", f"<{t}>").replace(f"&lt;/{t}&gt;", f"</{t}>")
+    return s
+
+
+def _lines(text: str):
+    first = True
+    for line in text.split("\n"):
+        if not first:
+            yield _NL, "\n", 1, None
+        first = False
+        if not line:
+            continue
+        if "<" not in line:
+            s = html.escape(line)
+            yield _TEXT, s, utf16_len(s), None
+        elif _paired(_TAG_RE.findall(line)):
+            s = _escape(line)
+            yield _LINE, s, utf16_len(s), line
+        else:
+            yield from _atoms(line)
+
+
+def _atoms(text: str):
+    for m in _TOKEN_RE.finditer(text):
+        slash, tag, nl, run = m.groups()
+        if tag:
+            yield (_CLOSE if slash else _OPEN), m.group(), len(m.group()), tag
+        elif nl:
+            yield _NL, "\n", 1, None
+        else:
+            s = html.escape(run)
+            yield _TEXT, s, utf16_len(s), None
+
+
+def _words(s: str) -> list[tuple]:
+    """Отрезок текста (уже экранирован) → слова и пробелы"""
+    return [(_SP, " ", 1, None) if w == " " else (_TEXT, w, utf16_len(w), None)
+            for w in re.split("( )", s) if w]
+
+
+def _closers(stack) -> str:
+    return "".join(f"</{t}>" for t in reversed(stack))
+
+
+def split_html(text: str, limit: int = LIMIT) -> list[str]:
+    """Куски готового HTML, каждый не длиннее limit единиц UTF-16"""
+    if len(text) <= limit and ("<" not in text or _paired(_TAG_RE.findall(text))):
+        s = _escape(text)                                     # частый случай: один кусок
+        if utf16_len(s) <= limit:
+            return [s]
+    chunks: list[str] = []
+    src = _lines(text)
+    pending: deque = deque()
+    parts: list[tuple] = []          # атомы текущего куска
+    size = 0                         # его длина (UTF-16)
+    stack: list[str] = []            # открытые теги
+    reserve = 0                      # длина закрывающих тегов для stack
+    content = False                  # в куске есть текст, а не только теги
+    cands: list[tuple] = []          # (ранг, № атома-разделителя, теги в этой точке)
+
+    def start(tags):
+        nonlocal parts, size, stack, reserve, content, cands
+        parts = [(_OPEN, f"<{t}>", 3, t) for t in tags]
+        size = 3 * len(tags)
+        stack = list(tags)
+        reserve = 4 * len(tags)
+        content = False
+        cands = []
+
+    def emit(upto: int, tags):
+        chunks.append("".join(a[1] for a in parts[:upto]) + _closers(tags))
+
+    def pick():
+        half = limit // 2
+        for rank in range(4):
+            best = None
+            for c in reversed(cands):
+                if c[0] == rank:
+                    best = c
+                    break
+            if best is not None and best[3] >= half:
+                return best
+        return min(cands, key=lambda c: (c[0], -c[1])) if cands else None
+
+    start(())
+    while True:
+        a = pending.popleft() if pending else next(src, None)
+        if a is None:
+            break
+        kind, s, u, tag = a
+        if kind == _LINE:
+            if stack or size + u + reserve > limit:
+                pending.extendleft(reversed(list(_atoms(tag))))   # tag — исходная строка
+                continue
+            kind, a = _TEXT, (_TEXT, s, u, None)
+        if (kind == _CLOSE and (not stack or stack[-1] != tag)
+                or kind == _OPEN and tag in stack):
+            s = html.escape(s)                      # непарный/вложенный тег — текст
+            kind, u, tag = _TEXT, len(s), None
+            a = (kind, s, u, tag)
+        if kind in (_NL, _SP) and not content and chunks:
+            continue                                # пробелы в начале продолжения
+        if kind == _OPEN:
+            need = size + u + reserve + 4
+        elif kind == _CLOSE:
+            need = size + reserve
+        else:
+            need = size + u + reserve
+        if need <= limit:
+            if kind in (_NL, _SP) and content:
+                cands.append((kind + 2 * bool(stack), len(parts), tuple(stack), size))
+            parts.append(a)
+            size += u
+            if kind == _OPEN:
+                stack.append(tag)
+                reserve += 4
+            elif kind == _CLOSE:
+                stack.pop()
+                reserve -= 4
+            elif kind == _TEXT:
+                content = True
+            continue
+        # не влезает. Отрезок с пробелами сначала дробим на слова:
+        # пробелы — тоже места разрыва
+        if kind == _TEXT and " " in s:
+            pending.extendleft(reversed(_words(s)))
+            continue
+        # рвём в лучшем месте, хвост и атом — заново
+        if kind in (_NL, _SP) and content:
+            cands.append((kind + 2 * bool(stack), len(parts), tuple(stack), size))
+        c = pick()
+        if c is not None:
+            _, i, tags, _ = c
+            emit(i, tags)
+            tail = parts[i + 1:]
+            if i < len(parts):
+                tail.append(a)
+            else:
+                tail = []                           # разрыв на самом атоме-разделителе
+            start(tags)
+            pending.extendleft(reversed(tail))
+        elif content:
+            emit(len(parts), stack)                 # разделителей нет — рвём здесь
+            start(tuple(stack))
+            pending.appendleft(a)
+        elif kind == _TEXT and len(html.unescape(s)) > 1:
+            # слово длиннее куска — по символам, сущности целиком
+            pending.extendleft(reversed([
+                (_TEXT, e, utf16_len(e), None)
+                for e in (html.escape(ch) for ch in html.unescape(s))
+            ]))
+        else:
+            raise ValueError(f"limit {limit} too small")
+    if content or not chunks:
+        emit(len(parts), stack)
+    return chunks
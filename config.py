@@ -8,10 +8,91 @@ CLUSTER_WS_URL = (
     "&name=Ivan"
 )
 
+# источники спотов (sources.py), работают одновременно, дубли между ними
+# отсекаются: http(s)/ws(s):// — Socket.IO, telnet://[позывной@]узел:порт
+CLUSTER_SOURCES = [
+    CLUSTER_WS_URL,
+    # "telnet://dxc.example.org:7300",
+]
+CLUSTER_CALL = "R0BI"          # логин на telnet-узлах
+SOURCE_IDLE_SEC = 300          # узел молчит дольше — переподключиться
+SOURCE_BACKOFF_MAX = 120       # потолок задержки переподключения, с
+
 DB_PATH = "bot.db"
 
+# хранилище: "sqlite" — storage.py (aiosqlite, DB_PATH);
+# "sqlalchemy" — db.py (DB_URL, например postgresql+asyncpg://… для
+# нескольких экземпляров бота на общей базе)
+DB_BACKEND = "sqlite"
+DB_URL = "sqlite+aiosqlite:///bot.db"
+# подбор подписчиков на спот: "index" — резидентный filters.SubscriberIndex;
+# "query" — один SQL-запрос на спот (match_spot), видит правки других экземпляров;
+# "vector" — vecmatch.VectorIndex (NumPy), споты пачками за VECTOR_WINDOW_MS —
+# пачка не больше SPOT_WORKERS, для неё их стоит поднять
+SPOT_MATCH = "index"
+VECTOR_WINDOW_MS = 3
+VECTOR_MAX_BATCH = 64
+
 SEEN_LIMIT = 2000              # сколько спотов держать в dedup‑кэше
+SEEN_FLUSH_BATCH = 200         # сброс dedup‑кэша на диск пачками по N…
+SEEN_FLUSH_SEC = 5             # …или не реже, чем раз в N секунд
 CHECK_INTERVAL_SEC = 10 * 60   # опрос анонсов
+ANN_SILENT_WARMUP = True       # пустое состояние анонсов — запомнить, не рассылая
+ANN_TTL_SEC = 11 * 60          # /announcements: снимок старше — загрузить заново
+ANN_WRAP = 10                  # RDA-кодов в строке списка анонса (0 — без переноса)
+
+# очередь приёма спотов (ingest.SpotPipeline)
+SPOT_WORKERS = 4               # воркеров рассылки
+SPOT_QUEUE_SIZE = 1000         # предел очереди…
+SPOT_OVERFLOW = "drop-oldest"  # …и политика переполнения: drop-oldest | coalesce
+
+# последние споты в памяти для /recent (spots.Recent)
+RECENT_SIZE = 5000             # ёмкость кольца
+RECENT_LIMIT = 20              # спотов в ответе
+
+# архив спотов для /history (archive.py): отдельный SQLite-файл, секции по суткам
+ARCHIVE_PATH = "archive.db"    # "" — архив выключен
+ARCHIVE_DAYS = 30              # срок хранения: старше — секция удаляется целиком
+ARCHIVE_FLUSH_BATCH = 500      # запись пачками по N спотов…
+ARCHIVE_FLUSH_SEC = 5          # …или не реже, чем раз в N секунд
+HISTORY_DAYS = 7               # /history без числа дней
+HISTORY_LIMIT = 20             # спотов в ответе
+
+# режим дайджеста (digest.Digest)
+DIGEST_MAX_ITEMS = 30          # спотов в одном дайджесте — дальше сброс раньше срока
+DIGEST_MAX_TOTAL = 20000       # спотов во всех буферах разом
+
+# подавление повторов (repeat.Repeats): тот же позывной, RDA, диапазон и мода —
+# не чаще раза в N минут
+REPEAT_MIN = 15                # окно по умолчанию (0 — выкл), у чата может быть своё
+REPEAT_MAX_ENTRIES = 200000    # записей (позывной, RDA, диапазон, мода, чат) в памяти
+
+# отправка в Telegram (delivery.Scheduler)
+SEND_WORKERS = 16              # параллельных отправителей
+SEND_RATE = 30                 # сообщений/с на весь бот
+SEND_CHAT_RATE = 1             # сообщений/с в один чат…
+SEND_CHAT_BURST = 3            # …с коротким всплеском до N
+SEND_TRIP_AFTER = 3            # временных сбоев подряд — рассылки чату на паузу…
+SEND_BACKOFF_BASE = 30         # …на N секунд, дальше вдвое дольше…
+SEND_BACKOFF_MAX = 3600        # …но не больше N секунд
+FANOUT_OUTBOX = 10000          # fanout.py: сообщений в очереди хаба к доставщику, сверх — потеряны
+
+ADMIN_IDS: list[int] = []      # кому доступна /delivery (статистика доставки)
+
+# приём апдейтов: WEBHOOK_URL пуст — long polling; иначе webhook.Webhook
+# слушает WEBHOOK_HOST:WEBHOOK_PORT, Telegram шлёт на WEBHOOK_URL + WEBHOOK_PATH
+WEBHOOK_URL = ""               # публичный адрес, например https://bot.example.org
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = ""            # пусто — новый случайный на каждый запуск
+WEBHOOK_CONCURRENCY = 32       # апдейтов в обработке одновременно
+WEBHOOK_MAX_PENDING = 1000     # принятых и не обработанных больше — 503, Telegram повторит
+WEBHOOK_GRACE_SEC = 10         # остановка: ждать начатые апдейты не дольше
+
+# метрики Prometheus: GET http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0
 
 DEFAULT_FMT = (
     "🆕 <b>{callsign}</b> • {mode} • {freq:.1f}kHz\n"
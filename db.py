@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Async‑ORM (SQLAlchemy 2) + SQLite/PostgreSQL
+Async‑ORM (SQLAlchemy 2) + SQLite/PostgreSQL.
+Тот же набор функций, что и в storage.py: бот берёт этот модуль
+при config.DB_BACKEND = "sqlalchemy" (общая база Postgres на несколько
+экземпляров). match_spot — подбор подписчиков на спот одним запросом.
 """
 
+import asyncio
 import datetime as dt
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from typing import Optional
 
 from sqlalchemy import (
-    Column, DateTime, Enum, Float, Integer, String,
-    ForeignKey, select, delete, func, update, Text
+    BigInteger, Column, DateTime, Enum, Float, Index, Integer, String,
+    exists, or_, select, delete, func, update, Text
 )
 from sqlalchemy.ext.asyncio import (
     AsyncSession, async_sessionmaker, create_async_engine
@@ -17,124 +24,336 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 import config
+import dedup
+import metrics
+import spots
+import templates
 
 # ────────── подключение ──────────
 engine = create_async_engine(config.DB_URL, echo=False, pool_size=10)
-Session: async_sessionmaker[AsyncSession] = async_sessionmaker(bind=engine)
+Session: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    bind=engine, expire_on_commit=False
+)
+# сессия текущей транзакции (см. transaction())
+_tx: ContextVar[AsyncSession | None] = ContextVar("db_tx", default=None)
+_timed = metrics.timed(metrics.STORAGE_SEC)
 
 class Base(DeclarativeBase): pass
 
 # ────────── модели ──────────
 class User(Base):
     __tablename__ = "users"
-    chat_id:    Mapped[int] = mapped_column(primary_key=True)
-    first_name: Mapped[str] = mapped_column(String(64))
+    chat_id:    Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    first_name: Mapped[str | None] = mapped_column(String(64))
     username:   Mapped[str | None] = mapped_column(String(64))
     fmt:        Mapped[str] = mapped_column(Text, default=config.DEFAULT_FMT)
+    digest_sec: Mapped[int] = mapped_column(Integer, default=0)
+    repeat_min: Mapped[int | None] = mapped_column(Integer)
+    # бот заблокирован / чат удалён: подписки сняты и запомнены (см. set_dormant)
+    dormant_at:   Mapped[dt.datetime | None] = mapped_column(DateTime)
+    dormant_why:  Mapped[str | None] = mapped_column(String(32))
+    dormant_subs: Mapped[str | None] = mapped_column(String(32))
     created_at: Mapped[dt.datetime] = mapped_column(
         DateTime, default=dt.datetime.utcnow
     )
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
-    chat_id: Mapped[int] = mapped_column(ForeignKey(User.chat_id), primary_key=True)
+    __table_args__ = (Index("subscriptions_kind", "kind", "chat_id"),)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     kind:    Mapped[str] = mapped_column(
         Enum("ann", "spot", name="sub_kind"), primary_key=True
     )
 
 class FilterRDA(Base):
     __tablename__ = "filters_rda"
-    chat_id:  Mapped[int] = mapped_column(ForeignKey(User.chat_id), primary_key=True)
+    __table_args__ = (Index("filters_rda_rda", "rda", "chat_id"),)
+    chat_id:  Mapped[int] = mapped_column(BigInteger, primary_key=True)
     rda:      Mapped[str] = mapped_column(String(6), primary_key=True)
 
 class FilterMisc(Base):
     __tablename__ = "filters_misc"
-    chat_id: Mapped[int] = mapped_column(ForeignKey(User.chat_id), primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     mode:    Mapped[str] = mapped_column(String(8), default="ANY")   # DIGI / CW / ...
     f_min:   Mapped[float] = mapped_column(Float, default=0.0)
     f_max:   Mapped[float] = mapped_column(Float, default=99999.0)
 
+class AnnState(Base):
+    __tablename__ = "ann_state"
+    id:       Mapped[str] = mapped_column(String(64), primary_key=True)
+    hash:     Mapped[str] = mapped_column(String(32))
+    callsign: Mapped[str | None] = mapped_column(String(32))
+    rdas:     Mapped[str] = mapped_column(Text, default="")
+
 class SeenSpot(Base):
-    __tablename__ = "seen_spots"
-    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
-    ts:   Mapped[int] = mapped_column(Integer)
+    __tablename__ = "seen_hashes"
+    __table_args__ = {"sqlite_with_rowid": False}
+    hash: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    ts:   Mapped[int] = mapped_column(Integer, index=True)
+
+# Пользователи появляются в users только после /start, подписки и фильтры
+# пишутся раньше — поэтому связи по chat_id без внешних ключей (как в storage.py).
+
+# ────────── сессии и транзакции ──────────
+@asynccontextmanager
+async def _session():
+    """Сессия текущей transaction() или своя — с commit в конце"""
+    s = _tx.get()
+    if s is not None:
+        yield s
+        return
+    async with Session() as s:
+        yield s
+        await s.commit()
+
+@asynccontextmanager
+async def transaction():
+    """Несколько операций одной транзакцией (как storage.transaction)"""
+    if _tx.get() is not None:      # вложенная — часть внешней
+        yield
+        return
+    async with Session() as s:
+        async with s.begin():
+            token = _tx.set(s)
+            try:
+                yield
+            finally:
+                _tx.reset(token)
+
+def _upsert(model):
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def _insert_ignore(model):
+    return _upsert(model).on_conflict_do_nothing()
 
 # ────────── инициализация ──────────
-async def init_models() -> None:
+@_timed
+async def init_db() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    async with Session() as s:
+        rows = await s.execute(
+            select(SeenSpot.hash, SeenSpot.ts)
+            .order_by(SeenSpot.ts.desc()).limit(config.SEEN_LIMIT)
+        )
+        _seen.load(reversed(rows.all()))
+
+init_models = init_db
+
+async def close_db() -> None:
+    await flush_seen()
+    await engine.dispose()
 
 # ────────── USERS ──────────
+@_timed
 async def upsert_user(cid: int, first: str, uname: str | None) -> None:
-    async with Session() as s:
-        await s.merge(User(chat_id=cid, first_name=first, username=uname))
-        await s.commit()
+    stmt = _upsert(User).values(chat_id=cid, first_name=first, username=uname)
+    async with _session() as s:
+        await s.execute(stmt.on_conflict_do_update(
+            index_elements=[User.chat_id],
+            set_={"first_name": first, "username": uname},
+        ))
 
+@_timed
 async def set_template(cid: int, tmpl: str) -> None:
-    async with Session() as s:
+    """ValueError, если шаблон не компилируется (см. templates.py)"""
+    templates.compile_template(tmpl)
+    async with _session() as s:
         await s.execute(
             update(User).where(User.chat_id == cid).values(fmt=tmpl)
         )
-        await s.commit()
 
+@_timed
 async def get_template(cid: int) -> str:
-    async with Session() as s:
+    async with _session() as s:
         res = await s.scalar(select(User.fmt).where(User.chat_id == cid))
         return res or config.DEFAULT_FMT
 
+@_timed
+async def set_digest(cid: int, sec: int) -> None:
+    stmt = _upsert(User).values(chat_id=cid, digest_sec=sec)
+    async with _session() as s:
+        await s.execute(stmt.on_conflict_do_update(
+            index_elements=[User.chat_id], set_={"digest_sec": sec}
+        ))
+
+@_timed
+async def get_digest(cid: int) -> int:
+    async with _session() as s:
+        res = await s.scalar(select(User.digest_sec).where(User.chat_id == cid))
+        return res or 0
+
+@_timed
+async def load_digests() -> dict[int, int]:
+    async with _session() as s:
+        rows = await s.execute(
+            select(User.chat_id, User.digest_sec).where(User.digest_sec > 0)
+        )
+        return dict(rows.all())
+
+@_timed
+async def set_repeat(cid: int, minutes: int | None) -> None:
+    stmt = _upsert(User).values(chat_id=cid, repeat_min=minutes)
+    async with _session() as s:
+        await s.execute(stmt.on_conflict_do_update(
+            index_elements=[User.chat_id], set_={"repeat_min": minutes}
+        ))
+
+@_timed
+async def get_repeat(cid: int) -> int | None:
+    async with _session() as s:
+        return await s.scalar(select(User.repeat_min).where(User.chat_id == cid))
+
+@_timed
+async def load_repeats() -> dict[int, int]:
+    async with _session() as s:
+        rows = await s.execute(
+            select(User.chat_id, User.repeat_min).where(User.repeat_min.is_not(None))
+        )
+        return dict(rows.all())
+
 # ────────── SUBSCRIPTIONS ──────────
+@_timed
 async def change_sub(cid: int, kind: str, on: bool) -> None:
-    async with Session() as s:
+    async with _session() as s:
         if on:
-            s.add(Subscription(chat_id=cid, kind=kind))
+            await s.execute(
+                _insert_ignore(Subscription).values(chat_id=cid, kind=kind)
+            )
         else:
             await s.execute(
                 delete(Subscription).where(
                     Subscription.chat_id == cid, Subscription.kind == kind
                 )
             )
-        await s.commit()
 
+@_timed
 async def subscribers(kind: str) -> list[int]:
-    async with Session() as s:
+    async with _session() as s:
         rows = await s.scalars(
             select(Subscription.chat_id).where(Subscription.kind == kind)
         )
-        return rows.all()
+        return list(rows.all())
+
+@_timed
+async def count_subscribers(kind: str) -> int:
+    async with _session() as s:
+        return await s.scalar(
+            select(func.count()).select_from(Subscription)
+            .where(Subscription.kind == kind)
+        )
+
+# ────────── «СПЯЩИЕ» ЧАТЫ ──────────
+@_timed
+async def set_dormant(cid: int, reason: str) -> list[str]:
+    """Снимает подписки чата, запоминая их для /start; → снятые виды"""
+    async with transaction():
+        async with _session() as s:
+            kinds = sorted((await s.scalars(
+                select(Subscription.kind).where(Subscription.chat_id == cid)
+            )).all())
+            await s.execute(delete(Subscription).where(Subscription.chat_id == cid))
+            stmt = _upsert(User).values(
+                chat_id=cid, dormant_at=dt.datetime.utcnow(),
+                dormant_why=reason, dormant_subs=" ".join(kinds),
+            )
+            await s.execute(stmt.on_conflict_do_update(
+                index_elements=[User.chat_id],
+                set_={"dormant_at": stmt.excluded.dormant_at,
+                      "dormant_why": stmt.excluded.dormant_why,
+                      "dormant_subs": stmt.excluded.dormant_subs},
+                where=User.dormant_at.is_(None),
+            ))
+            return kinds
+
+@_timed
+async def revive(cid: int) -> list[str]:
+    """Возвращает подписки спящего чата; → восстановленные виды"""
+    async with transaction():
+        async with _session() as s:
+            row = (await s.execute(
+                select(User.dormant_subs)
+                .where(User.chat_id == cid, User.dormant_at.is_not(None))
+            )).first()
+            if row is None:
+                return []
+            kinds = (row[0] or "").split()
+            if kinds:
+                await s.execute(_insert_ignore(Subscription),
+                                [{"chat_id": cid, "kind": k} for k in kinds])
+            await s.execute(update(User).where(User.chat_id == cid).values(
+                dormant_at=None, dormant_why=None, dormant_subs=None))
+            return kinds
+
+@_timed
+async def migrate_chat(old: int, new: int) -> None:
+    """Группа стала супергруппой: пользователь, подписки и фильтры — на
+    новый chat_id (строки, уже заведённые под новым id, остаются)"""
+    async with transaction():
+        async with _session() as s:
+            for model, key in ((User, None), (Subscription, Subscription.kind),
+                               (FilterRDA, FilterRDA.rda), (FilterMisc, None)):
+                if key is None:                 # одна строка на чат
+                    clash = select(model.chat_id).where(model.chat_id == new).exists()
+                else:
+                    clash = key.in_(select(key).where(model.chat_id == new))
+                await s.execute(delete(model).where(model.chat_id == old, clash))
+                await s.execute(update(model).where(model.chat_id == old).values(chat_id=new))
+
+@_timed
+async def count_dormant() -> dict[str, int]:
+    async with _session() as s:
+        rows = await s.execute(
+            select(User.dormant_why, func.count())
+            .where(User.dormant_at.is_not(None)).group_by(User.dormant_why)
+        )
+        return dict(rows.all())
 
 # ────────── RDA‑FILTER ──────────
+@_timed
 async def add_rda(cid: int, *codes: str) -> list[str]:
-    async with Session() as s:
-        have = (
-            await s.scalars(
-                select(FilterRDA.rda).where(FilterRDA.chat_id == cid)
-            )
-        ).all()
-        new = [c for c in codes if c not in have]
-        s.add_all([FilterRDA(chat_id=cid, rda=c) for c in new])
-        await s.commit()
-        return new
+    if not codes:
+        return []
+    async with _session() as s:
+        await s.execute(
+            _insert_ignore(FilterRDA), [{"chat_id": cid, "rda": c} for c in codes]
+        )
+        rows = await s.scalars(
+            select(FilterRDA.rda).where(FilterRDA.chat_id == cid)
+        )
+        return list(rows.all())
 
+@_timed
 async def get_rda(cid: int) -> list[str]:
-    async with Session() as s:
+    async with _session() as s:
         rows = await s.scalars(
             select(FilterRDA.rda).where(FilterRDA.chat_id == cid)
         )
-        return rows.all()
+        return list(rows.all())
+
+@_timed
+async def clear_rda(cid: int) -> None:
+    async with _session() as s:
+        await s.execute(delete(FilterRDA).where(FilterRDA.chat_id == cid))
 
 # ────────── MODE/BAND FILTER ──────────
+@_timed
 async def set_mode(cid: int, mode: str | None) -> None:
-    async with Session() as s:
+    async with _session() as s:
         await _ensure_misc(s, cid)
         await s.execute(
             update(FilterMisc).where(FilterMisc.chat_id == cid).values(
                 mode="ANY" if mode is None else mode.upper()
             )
         )
-        await s.commit()
 
+@_timed
 async def set_band(cid: int, lo: float | None, hi: float | None) -> None:
-    async with Session() as s:
+    async with _session() as s:
         await _ensure_misc(s, cid)
         await s.execute(
             update(FilterMisc).where(FilterMisc.chat_id == cid).values(
@@ -142,30 +361,154 @@ async def set_band(cid: int, lo: float | None, hi: float | None) -> None:
                 f_max=99999.0 if hi is None else hi,
             )
         )
-        await s.commit()
 
-async def misc(cid: int) -> FilterMisc:
-    async with Session() as s:
-        row = await s.get(FilterMisc, cid)
-        return row or FilterMisc(chat_id=cid)
+@_timed
+async def misc(cid: int) -> tuple[str, float, float]:
+    async with _session() as s:
+        row = (await s.execute(
+            select(FilterMisc.mode, FilterMisc.f_min, FilterMisc.f_max)
+            .where(FilterMisc.chat_id == cid)
+        )).first()
+        return ("ANY", 0.0, 99999.0) if row is None else tuple(row)
 
 async def _ensure_misc(s: AsyncSession, cid: int) -> None:
-    if not await s.get(FilterMisc, cid):
-        s.add(FilterMisc(chat_id=cid))
-        await s.flush()
+    await s.execute(_insert_ignore(FilterMisc).values(chat_id=cid))
+
+# ────────── ИНДЕКС ФИЛЬТРОВ ──────────
+@_timed
+async def load_filters() -> dict[int, tuple[list[str], str, float, float]]:
+    """Все фильтры разом — для filters.SubscriberIndex при старте"""
+    out: dict[int, tuple[list[str], str, float, float]] = {}
+    async with _session() as s:
+        for cid, mode, lo, hi in await s.execute(
+            select(FilterMisc.chat_id, FilterMisc.mode, FilterMisc.f_min, FilterMisc.f_max)
+        ):
+            out[cid] = ([], mode, lo, hi)
+        for cid, code in await s.execute(select(FilterRDA.chat_id, FilterRDA.rda)):
+            out.setdefault(cid, ([], "ANY", 0.0, 99999.0))[0].append(code)
+    return out
+
+@_timed
+async def load_templates() -> dict[int, str]:
+    """Нестандартные шаблоны; битые (сохранённые до проверки) пропускаются"""
+    async with _session() as s:
+        rows = (await s.execute(
+            select(User.chat_id, User.fmt)
+            .where(User.fmt.is_not(None), User.fmt != config.DEFAULT_FMT)
+        )).all()
+    out: dict[int, str] = {}
+    for cid, fmt in rows:
+        try:
+            templates.compile_template(fmt)
+        except ValueError:
+            continue
+        out[cid] = fmt
+    return out
+
+# ────────── ПОДБОР ПОДПИСЧИКОВ НА СПОТ ──────────
+def match_query(codes: list[str], mode: str, freq: float):
+    """Один SELECT вместо allowed() по каждому чату: кандидаты по индексу
+    filters_rda(rda) плюс чаты без RDA-фильтра, мода и диапазон —
+    условиями LEFT JOIN filters_misc; шаблон — из users."""
+    has_rda = exists().where(FilterRDA.chat_id == Subscription.chat_id)
+    by_rda = select(FilterRDA.chat_id).where(FilterRDA.rda.in_(codes))
+    return (
+        select(Subscription.chat_id, User.fmt)
+        .outerjoin(FilterMisc, FilterMisc.chat_id == Subscription.chat_id)
+        .outerjoin(User, User.chat_id == Subscription.chat_id)
+        .where(
+            Subscription.kind == "spot",
+            or_(FilterMisc.mode.is_(None), FilterMisc.mode.in_(("ANY", mode))),
+            or_(FilterMisc.f_min.is_(None), FilterMisc.f_min <= freq),
+            or_(FilterMisc.f_max.is_(None), FilterMisc.f_max >= freq),
+            or_(Subscription.chat_id.in_(by_rda), ~has_rda),
+        )
+    )
+
+@_timed
+async def match_spot(rda: str, mode: str, freq: float) -> list[tuple[int, str]]:
+    """(chat_id, шаблон) подписчиков, чьи фильтры пропускают спот"""
+    async with _session() as s:
+        rows = await s.execute(match_query(rda.split(), spots.norm_mode(mode), freq))
+        return [(cid, fmt or config.DEFAULT_FMT) for cid, fmt in rows]
+
+# ────────── АНОНСЫ ──────────
+@_timed
+async def ann_state() -> dict[str, tuple[str, str, list[str]]]:
+    """id анонса → (хэш карточки, позывной, RDA-коды)"""
+    async with _session() as s:
+        rows = await s.execute(
+            select(AnnState.id, AnnState.hash, AnnState.callsign, AnnState.rdas)
+        )
+        return {i: (h, c, (r or "").split()) for i, h, c, r in rows}
+
+@_timed
+async def save_ann_state(upsert: dict[str, tuple[str, str, list[str]]],
+                         removed: list[str]) -> None:
+    """Применяет дельту одной транзакцией"""
+    async with transaction():
+        async with _session() as s:
+            if upsert:
+                stmt = _upsert(AnnState)
+                await s.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[AnnState.id],
+                        set_={"hash": stmt.excluded.hash,
+                              "callsign": stmt.excluded.callsign,
+                              "rdas": stmt.excluded.rdas},
+                    ),
+                    [{"id": i, "hash": h, "callsign": c, "rdas": " ".join(r)}
+                     for i, (h, c, r) in upsert.items()]
+                )
+            if removed:
+                await s.execute(delete(AnnState).where(AnnState.id.in_(removed)))
 
 # ────────── DEDUPLICATION ──────────
-async def is_new(h: str) -> bool:
-    async with Session() as s:
-        if await s.get(SeenSpot, h):
-            return False
-        # trim
-        cnt = await s.scalar(select(func.count()).select_from(SeenSpot))
-        if cnt and cnt >= config.SEEN_LIMIT:
-            oldest = await s.scalars(
-                select(SeenSpot).order_by(SeenSpot.ts).limit(cnt - config.SEEN_LIMIT + 1)
+# как в storage.py: проверка в памяти, запись на диск пачками
+_seen = dedup.SeenCache(
+    config.SEEN_LIMIT, config.SEEN_FLUSH_BATCH, config.SEEN_FLUSH_SEC
+)
+_seen_task: Optional[asyncio.Task] = None
+_seen_full = asyncio.Event()                     # пачка набралась
+
+async def is_new(h: int) -> bool:
+    global _seen_task
+    if not _seen.add(h, int(time.time())):
+        return False
+    if _seen.full():
+        _seen_full.set()
+    if _seen_task is None or _seen_task.done():
+        _seen_task = asyncio.create_task(_seen_writer())
+    return True
+
+def seen_size() -> int:
+    """Хэшей в dedup-кэше"""
+    return len(_seen)
+
+async def _seen_writer() -> None:
+    # пачка по заполнению (is_new будит) или раз в flush_sec; пока есть что писать
+    while _seen.backlog():
+        if not _seen.due():
+            try:
+                await asyncio.wait_for(_seen_full.wait(), _seen.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+        _seen_full.clear()
+        await flush_seen()
+
+@_timed
+async def flush_seen() -> None:
+    rows = _seen.drain()
+    if not rows:
+        return
+    try:
+        async with _session() as s:
+            await s.execute(
+                _insert_ignore(SeenSpot), [{"hash": h, "ts": ts} for h, ts in rows]
             )
-            for row in oldest: await s.delete(row)
-        s.add(SeenSpot(hash=h, ts=int(dt.datetime.utcnow().timestamp())))
-        await s.commit()
-        return True
+            oldest = _seen.oldest_ts()
+            if oldest is not None:
+                await s.execute(delete(SeenSpot).where(SeenSpot.ts < oldest))
+    except BaseException:
+        _seen.requeue(rows)                     # не записали — запишет следующий сброс
+        raise
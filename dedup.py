@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Дедупликация спотов в памяти.
+Ключ — 64-битный хэш (влезает в INTEGER SQLite/BIGINT Postgres), ровно
+SEEN_LIMIT последних ключей в порядке вставки, проверка O(1) без диска.
+На диск новые ключи уходят пачками (write-behind) — см. storage/db.is_new.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+
+def key64(*parts: str) -> int:
+    """Знаковый 64-битный хэш частей спота"""
+    digest = hashlib.blake2b("|".join(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class SeenCache:
+    def __init__(self, limit: int, flush_batch: int = 200, flush_sec: float = 5.0):
+        self.limit = limit
+        self.flush_batch = flush_batch
+        self.flush_sec = flush_sec
+        self._items: OrderedDict[int, int] = OrderedDict()   # hash → ts
+        self._pending: list[tuple[int, int]] = []
+        self._flushed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, h: int) -> bool:
+        return h in self._items
+
+    def load(self, rows: Iterable[tuple[int, int]]):
+        """rows — (hash, ts) от старых к новым"""
+        for h, ts in rows:
+            self._items[h] = ts
+        while len(self._items) > self.limit:
+            self._items.popitem(last=False)
+
+    def add(self, h: int, ts: int) -> bool:
+        """True, если ключ новый (и он запомнен)"""
+        if h in self._items:
+            return False
+        self._items[h] = ts
+        self._pending.append((h, ts))
+        if len(self._items) > self.limit:
+            self._items.popitem(last=False)
+        return True
+
+    def oldest_ts(self) -> int | None:
+        """ts самого старого ключа, если кэш заполнен (граница очистки диска)"""
+        if len(self._items) < self.limit:
+            return None
+        return next(iter(self._items.values()))
+
+    def backlog(self) -> int:
+        """Ключей, ещё не сброшенных на диск"""
+        return len(self._pending)
+
+    def full(self) -> bool:
+        """Накопилась полная пачка — сбрасывать, не дожидаясь flush_sec"""
+        return len(self._pending) >= self.flush_batch
+
+    def due(self) -> bool:
+        """Пора ли сбрасывать накопленное на диск"""
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.flush_batch
+                or time.monotonic() - self._flushed_at >= self.flush_sec)
+
+    def drain(self) -> list[tuple[int, int]]:
+        rows, self._pending = self._pending, []
+        self._flushed_at = time.monotonic()
+        return rows
+
+    def requeue(self, rows: list[tuple[int, int]]):
+        """Вернуть пачку, которую не удалось записать, перед новыми ключами"""
+        self._pending[:0] = rows
@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик исходящих сообщений Telegram.
+  • N воркеров шлют параллельно;
+  • общий лимит (~30 сообщений/с) и лимит на чат — token bucket;
+  • TelegramRetryAfter ставит отправку на паузу и повторяет кусок;
+  • полосы приоритета: ответы на команды > споты > анонсы;
+  • порядок сообщений внутри одного чата сохраняется: у чата своя
+    очередь по полосам, воркеру он выдаётся, только когда у него нет
+    отправки в работе и в его bucket есть токен (очередь готовых чатов);
+    занятый или «медленный» чат воркер не ждёт — тот берёт другой;
+  • исход по чату: бот заблокирован / чат не найден — чат «мёртв»,
+    on_dead(cid, причина), рассылки ему больше не идут; группа стала
+    супергруппой — очередь чата переезжает на новый id, кусок
+    повторяется, on_migrate(старый, новый); временные сбои (сеть, 5xx) —
+    предохранитель чата (Breaker): после trip_after подряд рассылки чату
+    пропускаются с экспоненциальной паузой, чтобы один плохой чат не
+    тратил воркеры на заведомо зависающие запросы. Сбой держит только
+    очередь своего чата — воркер его не ждёт. Ответы на команды идут
+    всегда: успешная отправка снимает и паузу, и «смерть» (on_alive).
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from enum import IntEnum
+
+from typing import Callable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramMigrateToChat,
+    TelegramNetworkError, TelegramRetryAfter, TelegramServerError,
+)
+
+import metrics
+
+log = logging.getLogger("RDA-bot.delivery")
+
+
+class Lane(IntEnum):
+    REPLY = 0   # ответы на команды
+    SPOT  = 1   # рассылка спотов
+    ANN   = 2   # рассылка анонсов
+
+
+class TokenBucket:
+    """Bucket с резервированием: каждый вызов сразу занимает токен
+    (баланс может уйти в минус), ожидание = долг / rate. Так параллельные
+    отправители получают слоты строго по очереди, без гонок."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._ts = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def delay(self) -> float:
+        """Сколько ждать свободного токена, не занимая его"""
+        tokens = min(self.burst, self._tokens + (time.monotonic() - self._ts) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def gone_reason(e: Exception) -> str | None:
+    """Причина, если чата для бота больше нет (заблокирован, удалён,
+    бот исключён); иначе None"""
+    if isinstance(e, TelegramForbiddenError):
+        return "forbidden"
+    if isinstance(e, TelegramBadRequest) and "chat not found" in e.message.lower():
+        return "chat not found"
+    return None
+
+
+def is_transient(e: Exception) -> bool:
+    return isinstance(e, (TelegramNetworkError, TelegramServerError, TimeoutError,
+                          ConnectionError))
+
+
+class ChatUnavailable(Exception):
+    """Отправка пропущена: чат «мёртв» или его предохранитель открыт"""
+
+
+class Breaker:
+    """Предохранитель чата: trip_after временных сбоев подряд — пауза
+    base·2ⁿ (не больше cap); после паузы одна пробная отправка: сбой —
+    пауза вдвое дольше, успех — предохранитель снимается"""
+    __slots__ = ("fails", "trips", "until")
+
+    def __init__(self):
+        self.fails = 0
+        self.trips = 0
+        self.until = 0.0
+
+    def fail(self, trip_after: int, base: float, cap: float) -> bool:
+        """True — предохранитель сработал"""
+        self.fails += 1
+        if self.fails < trip_after:
+            return False
+        self.until = time.monotonic() + min(cap, base * 2 ** self.trips)
+        self.trips += 1
+        self.fails = trip_after - 1
+        return True
+
+    def open(self) -> bool:
+        return self.until > time.monotonic()
+
+
+class _Job:
+    __slots__ = ("cid", "chunks", "kwargs", "fut", "ts", "seq", "pos", "msg")
+
+    def __init__(self, cid: int, chunks: list[str], kwargs: dict,
+                 fut: asyncio.Future | None, seq: int):
+        self.cid = cid
+        self.chunks = chunks
+        self.kwargs = kwargs
+        self.fut = fut
+        self.ts = time.monotonic()
+        self.seq = seq
+        self.pos = 0                            # следующий кусок
+        self.msg = None
+
+
+class _Chat:
+    """Очередь одного чата: по FIFO на полосу, начатое сообщение (cur)
+    досылается раньше новых; queued — чат в очереди готовых или ждёт
+    токена по таймеру, busy — кусок в отправке; записи готовых с другим
+    ключом, чем prio, устарели"""
+    __slots__ = ("lanes", "cur", "queued", "busy", "timer", "prio")
+
+    def __init__(self):
+        self.lanes: list[deque[_Job]] = [deque() for _ in Lane]
+        self.cur: tuple[Lane, _Job] | None = None
+        self.queued = False
+        self.busy = False
+        self.timer: asyncio.TimerHandle | None = None
+        self.prio: tuple[Lane, int] | None = None  # с каким ключом в готовых
+
+    def head(self) -> tuple[Lane, _Job] | None:
+        if self.cur is not None:
+            return self.cur
+        for lane, q in zip(Lane, self.lanes):
+            if q:
+                return lane, q[0]
+        return None
+
+
+class Scheduler:
+    def __init__(self, bot: Bot, workers: int = 16, rate: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 report_sec: float = 60.0, trip_after: int = 3,
+                 backoff_base: float = 30.0, backoff_cap: float = 3600.0,
+                 on_dead: Callable[[int, str], None] | None = None,
+                 on_alive: Callable[[int], None] | None = None,
+                 on_migrate: Callable[[int, int], None] | None = None):
+        self.bot = bot
+        self.workers = workers
+        self.report_sec = report_sec
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(rate, rate)
+        self._chats: dict[int, TokenBucket] = {}
+        self._fifo: dict[int, _Chat] = {}        # чаты с очередью или отправкой
+        self._ready: asyncio.PriorityQueue = asyncio.PriorityQueue()  # (полоса, seq, чат)
+        self._pending = 0                        # сообщений не дослано
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._depth = [0] * len(Lane)
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self._pause_until = 0.0
+        # исходы по чатам
+        self.trip_after = trip_after
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.on_dead = on_dead
+        self.on_alive = on_alive
+        self.on_migrate = on_migrate
+        self._breakers: dict[int, Breaker] = {}  # чаты с недавними сбоями
+        self._dead: dict[int, str] = {}          # чат → причина
+        self._healthy: set[int] = set()          # последняя отправка удалась
+        # статистика
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.skipped = 0                         # пропущено без запроса к API
+        self.trips = 0
+        self.migrated = 0
+        self._send_lat: deque[float] = deque(maxlen=1024)
+        self._queue_lat: deque[float] = deque(maxlen=1024)
+
+    def set_rate(self, rate: float):
+        """Общий лимит процесса (в fanout.py бюджет бота делится на процессы)"""
+        self._global = TokenBucket(rate, max(rate, 1.0))
+
+    # ───── жизненный цикл ─────
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.report_sec:
+            self._tasks.append(asyncio.create_task(self._reporter()))
+
+    async def join(self):
+        """Дождаться, пока всё поставленное будет дослано или отброшено"""
+        await self._idle.wait()
+
+    async def stop(self, timeout: float = 10.0):
+        """Дослать очередь (не дольше timeout) и остановить воркеры"""
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("delivery: dropped %s queued jobs on stop", self._pending)
+        for ch in self._fifo.values():
+            if ch.timer is not None:
+                ch.timer.cancel()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def __len__(self) -> int:
+        return self._pending
+
+    # ───── постановка в очередь ─────
+    def submit(self, cid: int, chunks: list[str], lane: Lane = Lane.REPLY,
+               *, wait: bool = True, **kwargs) -> asyncio.Future | None:
+        """Ставит сообщение (уже разбитое на куски) в очередь.
+        kwargs (reply_markup …) уходят с последним куском.
+        wait=True — вернуть Future с последним Message; иначе ошибки
+        только логируются (рассылки «выстрелил и забыл»)."""
+        fut = asyncio.get_running_loop().create_future() if wait else None
+        self._depth[lane] += 1
+        self._pending += 1
+        self._idle.clear()
+        ch = self._fifo.get(cid)
+        if ch is None:
+            ch = self._fifo[cid] = _Chat()
+        job = _Job(cid, chunks, kwargs, fut, next(self._seq))
+        ch.lanes[lane].append(job)
+        if ch.queued and ch.timer is None and (lane, job.seq) < ch.prio:
+            ch.prio = lane, job.seq                # ответ обгоняет рассылку чату
+            self._ready.put_nowait((lane, job.seq, cid))
+        self._schedule(cid, ch)
+        return fut
+
+    # ───── очередь готовых чатов ─────
+    def _bucket(self, cid: int) -> TokenBucket:
+        bucket = self._chats.get(cid)
+        if bucket is None:
+            bucket = self._chats[cid] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _schedule(self, cid: int, ch: _Chat):
+        """Свободный чат с очередью — в готовые, если есть токен, иначе
+        таймер до токена; пустой свободный чат забывается"""
+        if ch.busy or ch.queued:
+            return
+        head = ch.head()
+        if head is None:
+            del self._fifo[cid]
+            return
+        ch.queued = True
+        delay = self._bucket(cid).delay()
+        if delay > 0:
+            ch.timer = asyncio.get_running_loop().call_later(delay, self._wake, cid, ch)
+            return
+        lane, job = head
+        ch.prio = lane, job.seq
+        self._ready.put_nowait((lane, job.seq, cid))
+
+    def _wake(self, cid: int, ch: _Chat):
+        ch.timer = None
+        ch.queued = False
+        self._schedule(cid, ch)
+
+    def _done(self):
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    # ───── воркеры ─────
+    async def _worker(self):
+        while True:
+            lane, seq, cid = await self._ready.get()
+            ch = self._fifo.get(cid)
+            if ch is None or not ch.queued or ch.timer is not None or ch.prio != (lane, seq):
+                continue
+            ch.queued = False
+            ch.busy = True
+            try:
+                await self._step(cid, ch)
+            finally:
+                ch.busy = False
+                self._schedule(cid, ch)
+
+    # ───── исходы по чатам ─────
+    def _unavailable(self, cid: int, lane: Lane) -> str | None:
+        if lane == Lane.REPLY:                  # чат сам пишет боту — пробуем всегда
+            return None
+        if cid in self._dead:
+            return self._dead[cid]
+        br = self._breakers.get(cid)
+        if br is not None and br.open():
+            return "breaker open"
+        return None
+
+    def _succeeded(self, cid: int):
+        self._breakers.pop(cid, None)
+        self._healthy.add(cid)
+        if self._dead.pop(cid, None) is not None and self.on_alive is not None:
+            self.on_alive(cid)
+
+    def _failed(self, cid: int, e: Exception):
+        self._healthy.discard(cid)
+        reason = gone_reason(e)
+        if reason is not None:
+            self._breakers.pop(cid, None)
+            if cid not in self._dead:
+                self._dead[cid] = reason
+                log.info("delivery: chat %s is gone (%s)", cid, reason)
+                if self.on_dead is not None:
+                    self.on_dead(cid, reason)
+            return
+        if not is_transient(e):
+            return                              # ошибка сообщения, а не чата
+        br = self._breakers.get(cid)
+        if br is None:
+            br = self._breakers[cid] = Breaker()
+        if br.fail(self.trip_after, self.backoff_base, self.backoff_cap):
+            self.trips += 1
+            log.warning("delivery: chat %s breaker open for %.0f s after %r",
+                        cid, br.until - time.monotonic(), e)
+
+    def revive(self, cid: int):
+        """Чат снова доступен (пользователь вернулся) — снять «смерть» и паузу"""
+        self._dead.pop(cid, None)
+        self._breakers.pop(cid, None)
+
+    def health(self) -> dict:
+        return {"healthy": len(self._healthy), "dead": len(self._dead),
+                "tripped": sum(br.open() for br in self._breakers.values()),
+                "failing": len(self._breakers)}
+
+    async def _step(self, cid: int, ch: _Chat):
+        """Один кусок из головы очереди чата (токен чата уже есть)"""
+        if ch.cur is None:
+            lane, job = ch.head()
+            ch.lanes[lane].popleft()
+            self._depth[lane] -= 1
+            why = self._unavailable(cid, lane)
+            if why is not None:
+                # ответы так не пропускаются — значит, и вся рассылка чату в очереди
+                self._skip(job, why)
+                for lane in (Lane.SPOT, Lane.ANN):
+                    q = ch.lanes[lane]
+                    self._depth[lane] -= len(q)
+                    while q:
+                        self._skip(q.popleft(), why)
+                return
+            self._queue_lat.append(time.monotonic() - job.ts)
+            ch.cur = lane, job
+        lane, job = ch.cur
+        last = len(job.chunks) - 1
+        self._bucket(cid).reserve()
+        try:
+            job.msg = await self._send(cid, job.chunks[job.pos],
+                                       **(job.kwargs if job.pos == last else {}))
+        except TelegramMigrateToChat as e:
+            self._migrate(cid, ch, e.migrate_to_chat_id)
+            return
+        except Exception as e:
+            ch.cur = None
+            self._done()
+            self.failed += 1
+            self._failed(cid, e)
+            if job.fut is not None and not job.fut.done():
+                job.fut.set_exception(e)
+            else:
+                log.warning("delivery to %s failed: %r", cid, e)
+            return
+        job.pos += 1
+        if job.pos <= last:
+            return                              # следующий кусок — со следующим токеном
+        ch.cur = None
+        self._done()
+        self._succeeded(cid)
+        if job.fut is not None and not job.fut.done():
+            job.fut.set_result(job.msg)
+
+    def _migrate(self, cid: int, ch: _Chat, new: int):
+        """Начатое сообщение (с неотправленного куска) и вся очередь чата —
+        в конец очереди нового id, порядок внутри чата сохраняется"""
+        self.migrated += 1
+        log.info("delivery: chat %s migrated to %s", cid, new)
+        lane, job = ch.cur
+        ch.cur = None
+        job.chunks = job.chunks[job.pos:]
+        job.pos = 0
+        self._depth[lane] += 1
+        ch.lanes[lane].appendleft(job)
+        dst = self._fifo.get(new)
+        if dst is None:
+            dst = self._fifo[new] = _Chat()
+        for src, q in zip(ch.lanes, dst.lanes):
+            for job in src:
+                job.cid = new
+            q.extend(src)
+            src.clear()
+        if self.on_migrate is not None:
+            self.on_migrate(cid, new)
+        self._schedule(new, dst)
+
+    def _skip(self, job: _Job, why: str):
+        self.skipped += 1
+        self._done()
+        if job.fut is not None and not job.fut.done():
+            job.fut.set_exception(ChatUnavailable(f"chat {job.cid}: {why}"))
+
+    async def _send(self, cid: int, text: str, **kwargs):
+        while True:
+            pause = self._pause_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self._global.acquire()
+            t0 = time.monotonic()
+            try:
+                msg = await self.bot.send_message(cid, text, **kwargs)
+            except TelegramRetryAfter as e:
+                # флуд-контроль Telegram общий для бота — тормозим всех
+                self.retries += 1
+                self._pause_until = max(self._pause_until, time.monotonic() + e.retry_after)
+                log.warning("delivery: RetryAfter %ss (chat %s)", e.retry_after, cid)
+                continue
+            dt = time.monotonic() - t0
+            self._send_lat.append(dt)
+            metrics.TG_SEND_SEC.observe(dt)
+            self.sent += 1
+            return msg
+
+    # ───── метрики ─────
+    async def _reporter(self):
+        last = -1
+        while True:
+            await asyncio.sleep(self.report_sec)
+            if self.sent != last or self._pending:
+                last = self.sent
+                log.info("delivery: %s", self.report())
+
+    def stats(self) -> dict:
+        return {
+            "depth": {lane.name.lower(): self._depth[lane] for lane in Lane},
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "skipped": self.skipped,
+            "trips": self.trips,
+            "migrated": self.migrated,
+            "send_p50": metrics.pct(self._send_lat, 0.5),
+            "send_p95": metrics.pct(self._send_lat, 0.95),
+            "wait_p50": metrics.pct(self._queue_lat, 0.5),
+            "wait_p95": metrics.pct(self._queue_lat, 0.95),
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        d = s["depth"]
+        return (
+            f"queue reply/spot/ann={d['reply']}/{d['spot']}/{d['ann']} "
+            f"sent={s['sent']} failed={s['failed']} retries={s['retries']} "
+            f"skipped={s['skipped']} "
+            f"send p50/p95={s['send_p50'] * 1e3:.0f}/{s['send_p95'] * 1e3:.0f}ms "
+            f"wait p50/p95={s['wait_p50'] * 1e3:.0f}/{s['wait_p95'] * 1e3:.0f}ms"
+        )
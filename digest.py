@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Режим дайджеста: споты чата копятся окно N секунд (или до max_items)
+и уходят одним сообщением. Память ограничена: не больше max_items на
+чат и max_total спотов на всех — при переполнении раньше срока
+сбрасывается самый старый буфер. На остановке сбрасывается всё.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable
+
+
+def label(sec: int) -> str:
+    return f"{sec // 60} мин" if sec else "выкл"
+
+
+class _Buf:
+    __slots__ = ("texts", "deadline")
+
+    def __init__(self, deadline: float):
+        self.texts: list[str] = []
+        self.deadline = deadline
+
+
+class Digest:
+    def __init__(self, flush: Callable[[int, list[str]], None],
+                 max_items: int = 30, max_total: int = 20000):
+        """flush(cid, тексты) — отправка готового дайджеста"""
+        self.flush = flush
+        self.max_items = max_items
+        self.max_total = max_total
+        self._windows: dict[int, int] = {}       # чаты в режиме дайджеста
+        self._bufs: dict[int, _Buf] = {}
+        self._heap: list[tuple[float, int, int]] = []
+        self._seq = itertools.count()
+        self._total = 0
+        self.flushed = 0                         # отправлено дайджестов
+        self.buffered = 0                        # спотов прошло через буферы
+
+    def __len__(self) -> int:
+        return self._total
+
+    # ───── настройки ─────
+    def load(self, windows: dict[int, int]):
+        self._windows = {cid: sec for cid, sec in windows.items() if sec}
+
+    def window(self, cid: int) -> int:
+        return self._windows.get(cid, 0)
+
+    def set_window(self, cid: int, sec: int):
+        if sec:
+            self._windows[cid] = sec
+        else:
+            self._windows.pop(cid, None)
+            self._flush(cid)                     # выключили — отдать накопленное
+
+    # ───── буферы ─────
+    def add(self, cid: int, text: str) -> bool:
+        """True — спот ушёл в буфер; False — чат не в режиме дайджеста"""
+        sec = self._windows.get(cid)
+        if not sec:
+            return False
+        buf = self._bufs.get(cid)
+        if buf is None:
+            buf = self._bufs[cid] = _Buf(time.monotonic() + sec)
+            heapq.heappush(self._heap, (buf.deadline, next(self._seq), cid))
+        buf.texts.append(text)
+        self._total += 1
+        self.buffered += 1
+        if len(buf.texts) >= self.max_items:
+            self._flush(cid)
+        while self._total > self.max_total and self._heap:
+            self._flush(heapq.heappop(self._heap)[2])
+        return True
+
+    def _flush(self, cid: int):
+        buf = self._bufs.pop(cid, None)
+        if buf is None or not buf.texts:
+            return
+        self._total -= len(buf.texts)
+        self.flushed += 1
+        self.flush(cid, buf.texts)
+
+    def flush_due(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, cid = heapq.heappop(self._heap)
+            buf = self._bufs.get(cid)
+            if buf is not None and buf.deadline == deadline:
+                self._flush(cid)
+
+    def flush_all(self):
+        for cid in list(self._bufs):
+            self._flush(cid)
+        self._heap.clear()
+
+    async def run(self, tick: float = 1.0):
+        while True:
+            await asyncio.sleep(tick)
+            self.flush_due()
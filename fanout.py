@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Многопроцессный режим: один хаб + N доставщиков на одной машине.
+
+Хаб — обычный bot.py (polling, команды, cluster_loop, ann_loop, dedup), только
+новые споты и дельты анонсов не рассылаются сам, а публикуются в шину —
+Unix-сокет, строки JSON:
+
+    {"t": "spot", "p": [поля спота]}                 — всем (spots.Spot.astuple)
+    {"t": "ann",  "new": […], "changed": […], "gone": […]} — всем
+    {"t": "chat", "cid": …, "on": …, "rdas": …, …}   — владельцу шарда
+
+Обратно доставщик шлёт только {"t": "migrate", "old": …, "new": …}: отправка
+упёрлась в смену id чата (группа → супергруппа). Перенос ведёт хаб
+(bot.chat_migrated) — он же получает служебное сообщение о миграции — и
+рассылает снимки обоих чатов их владельцам.
+
+Доставщик k из N владеет чатами chat_id % N == k: свой индекс фильтров,
+дайджесты, очередь спотов и планировщик отправки с долей общего лимита
+(SEND_RATE / (N + 1), ещё одна доля — ответам хаба). Хаб запускает
+доставщиков сам и перезапускает упавших; внешних брокеров не нужно.
+У каждого доставщика своя очередь в хабе (config.FANOUT_OUTBOX): медленный
+шард не тормозит публикацию остальным, переполнение считается в lost.
+
+Запускается вместо bot.py, не вместе с ним: getUpdates/webhook у токена
+один (см. Procfile).
+
+    python fanout.py --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+
+import bot as app
+import config
+import metrics
+import spots
+
+log = logging.getLogger("RDA-bot.fanout")
+
+SOCKET = os.environ.get("RDA_FANOUT_SOCKET", "/tmp/rda-fanout.sock")
+
+
+def _line(msg: dict) -> bytes:
+    return json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+# ───── хаб ─────
+class Hub:
+    def __init__(self, path: str, shards: int, outbox: int = 10000):
+        self.path = path
+        self.shards = shards
+        self._writers: dict[int, asyncio.StreamWriter] = {}
+        self._outbox: dict[int, asyncio.Queue[bytes]] = {
+            k: asyncio.Queue(outbox) for k in range(shards)
+        }
+        self._server: asyncio.AbstractServer | None = None
+        self._procs: dict[int, asyncio.subprocess.Process] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+        self.published = 0
+        self.lost = 0              # сообщений отключённому шарду или сверх его очереди
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._client, self.path)
+        for k in range(self.shards):
+            self._tasks.append(asyncio.create_task(self._supervise(k)))
+
+    async def stop(self):
+        self._stopping = True
+        for p in self._procs.values():
+            if p.returncode is None:
+                p.send_signal(signal.SIGTERM)
+        await asyncio.gather(*(p.wait() for p in self._procs.values()))
+        for t in self._tasks:
+            t.cancel()
+        if self._server is not None:
+            self._server.close()
+        for w in list(self._writers.values()):
+            w.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _supervise(self, k: int):
+        """Запускает доставщика k и перезапускает, если тот упал"""
+        while not self._stopping:
+            proc = self._procs[k] = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "worker",
+                "--shard", str(k), "--of", str(self.shards), "--socket", self.path,
+            )
+            rc = await proc.wait()
+            if not self._stopping:
+                log.warning("fanout: worker %s exited with %s, restarting", k, rc)
+                await asyncio.sleep(1)
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            k = json.loads(await reader.readline())["shard"]
+        except (ValueError, KeyError, ConnectionError):
+            writer.close()
+            return
+        self._writers[k] = writer
+        pump = asyncio.create_task(self._pump(k, writer))
+        log.info("fanout: worker %s/%s connected", k, self.shards)
+        try:
+            while line := await reader.readline():
+                m = json.loads(line)
+                if m.get("t") == "migrate":  # доставщик упёрся в смену id чата
+                    app.chat_migrated(m["old"], m["new"])
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            pump.cancel()
+            if self._writers.get(k) is writer:
+                del self._writers[k]
+        if not self._stopping:
+            log.warning("fanout: worker %s disconnected", k)
+
+    async def _pump(self, k: int, writer: asyncio.StreamWriter):
+        """Очередь шарда k → сокет; drain ждёт только этот шард"""
+        q = self._outbox[k]
+        while True:
+            data = await q.get()
+            try:
+                writer.write(data)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self.lost += 1 + q.qsize()
+                while not q.empty():
+                    q.get_nowait()
+                return
+
+    def queued(self) -> dict[int, int]:
+        return {k: q.qsize() for k, q in self._outbox.items()}
+
+    async def publish(self, msg: dict, shard: int | None = None):
+        data = _line(msg)
+        self.published += 1
+        targets = range(self.shards) if shard is None else (shard,)
+        for k in targets:
+            w = self._writers.get(k)
+            if w is None or w.is_closing():
+                self.lost += 1
+                continue
+            try:
+                self._outbox[k].put_nowait(data)
+            except asyncio.QueueFull:
+                self.lost += 1
+
+    # ───── стоки bot.py ─────
+    async def spot(self, s: spots.Spot):
+        await self.publish({"t": "spot", "p": s.astuple()})
+
+    async def ann(self, new: list[dict], changed: list[dict], gone: list):
+        await self.publish({"t": "ann", "new": new, "changed": changed, "gone": gone})
+
+    def chat(self, cid: int):
+        """Снимок настроек чата из индекса хаба — владельцу шарда"""
+        f = app.subs.get(cid)
+        msg = {
+            "t": "chat", "cid": cid, "on": cid in app.subs,
+            "rdas": sorted(f.rdas), "mode": f.mode, "lo": f.lo, "hi": f.hi,
+            "fmt": app.subs.template(cid).fmt, "digest": app.digests.window(cid),
+            "repeat": app.repeats.window(cid),
+        }
+        asyncio.get_running_loop().create_task(self.publish(msg, cid % self.shards))
+
+
+def run_hub(shards: int, path: str):
+    hub = Hub(path, shards, config.FANOUT_OUTBOX)
+    app.spot_sink = hub.spot
+    app.ann_sink = hub.ann
+    app.on_chat_change = hub.chat
+    app.outbox.set_rate(config.SEND_RATE / (shards + 1))
+
+    @app.dp.startup()
+    async def start_workers():              # после on_startup: схема БД уже есть
+        await hub.start()
+
+    @app.dp.shutdown()
+    async def stop_workers():
+        await hub.stop()
+        log.info("fanout: published=%s lost=%s", hub.published, hub.lost)
+
+    asyncio.run(app.main())
+
+
+# ───── доставщик ─────
+async def _deliver(s: spots.Spot) -> bool:
+    await app.deliver_spot(s)
+    return True
+
+
+def _apply_chat(m: dict):
+    cid = m["cid"]
+    app.subs.set_rda(cid, m["rdas"])
+    app.subs.set_mode(cid, m["mode"])
+    app.subs.set_band(cid, m["lo"], m["hi"])
+    app.subs.set_template(cid, m["fmt"])
+    app.subs.subscribe(cid, m["on"])
+    app.digests.set_window(cid, m["digest"])
+    app.repeats.set_window(cid, m["repeat"])
+    app.outbox.revive(cid)                  # чат правит настройки — значит, жив
+
+
+async def _consume(reader: asyncio.StreamReader):
+    while line := await reader.readline():
+        m = json.loads(line)
+        t = m["t"]
+        if t == "spot":
+            s = spots.Spot(*m["p"])
+            app.spot_queue.push(s, key=(s.callsign, s.rda))
+        elif t == "ann":
+            gone = [tuple(g) for g in m["gone"]]
+            asyncio.create_task(app.deliver_ann(m["new"], m["changed"], gone))
+        elif t == "chat":
+            _apply_chat(m)
+
+
+async def run_worker(shard: int, shards: int, path: str):
+    app.SHARD = (shard, shards)
+    app.spot_queue.handler = _deliver
+    app.outbox.set_rate(config.SEND_RATE / (shards + 1))
+    await app.load_state()
+    if config.METRICS_PORT:
+        await metrics.serve(config.METRICS_HOST, config.METRICS_PORT + 1 + shard)
+    app.outbox.start()
+    app.spot_queue.start()
+    digest_task = asyncio.create_task(app.digests.run())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    link: list[asyncio.StreamWriter] = []   # текущее соединение с хабом
+
+    def migrate_up(old: int, new: int):
+        """Перенос чата ведёт хаб: у него полный индекс, он шлёт снимки обоим владельцам"""
+        w = link[0] if link else None
+        if w is None or w.is_closing():
+            log.warning("fanout: chat %s → %s migrated while off the bus", old, new)
+            return
+        w.write(_line({"t": "migrate", "old": old, "new": new}))
+
+    app.on_chat_migrate = migrate_up
+
+    async def bus():
+        first = True
+        while True:
+            try:
+                # строка с дельтой анонсов может быть большой
+                reader, writer = await asyncio.open_unix_connection(path, limit=1 << 24)
+            except OSError:
+                await asyncio.sleep(1)
+                continue
+            if not first:
+                await app.load_state()      # пока не было связи, могли пропустить правки
+            first = False
+            writer.write(_line({"shard": shard}))
+            await writer.drain()
+            link[:] = [writer]
+            log.info("fanout: worker %s/%s on the bus", shard, shards)
+            try:
+                await _consume(reader)
+            except (ConnectionError, json.JSONDecodeError):
+                log.exception("fanout: bus")
+            link.clear()
+            writer.close()
+            await asyncio.sleep(1)
+
+    bus_task = asyncio.create_task(bus())
+    await stop.wait()
+    bus_task.cancel()
+    await app.spot_queue.stop()
+    app.digests.flush_all()
+    digest_task.cancel()
+    await app.outbox.stop()
+    await metrics.stop()
+    await app.db.close_db()
+    await app.bot.session.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("role", nargs="?", default="hub", choices=("hub", "worker"))
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--shard", type=int)
+    ap.add_argument("--of", type=int)
+    ap.add_argument("--socket", default=SOCKET)
+    a = ap.parse_args()
+    if a.role == "worker":
+        asyncio.run(run_worker(a.shard, a.of, a.socket))
+    else:
+        run_hub(a.workers, a.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Резидентный индекс фильтров подписчиков на споты.
+Заменяет поштучный allowed() (2–3 SQL-запроса на каждого подписчика):
+  • RDA-код → множество chat_id (+ отдельное множество «без RDA-фильтра»);
+  • корзины по моде (ANY / CW / SSB / DIGI …);
+  • интервалы диапазонов (lo, hi) → множество chat_id, отсортированы по lo.
+Семантика совпадения — ровно как у allowed() в bot.py.
+Рядом лежат скомпилированные шаблоны чатов (templates.Template).
+"""
+
+from bisect import bisect_right
+from typing import Iterable
+
+import templates
+from rda_catalog import catalog
+from spots import norm_mode
+from templates import Template
+
+_EMPTY: frozenset[int] = frozenset()
+_NEG, _POS = float("-inf"), float("inf")
+
+
+def _mode_key(mode: str | None) -> str:
+    # пустая мода и None в allowed() означают «любая»
+    return mode or "ANY"
+
+
+class Filter:
+    """Фильтр одного чата (как в filters_rda + filters_misc).
+    mask — RDA-коды битами rda_catalog (0 — без RDA-фильтра)."""
+    __slots__ = ("rdas", "mask", "mode", "lo", "hi")
+
+    def __init__(self, rdas: Iterable[str] = (), mode: str | None = "ANY",
+                 lo: float | None = 0.0, hi: float | None = 99999.0):
+        self.rdas = frozenset(rdas)
+        self.mask = catalog.mask(self.rdas)
+        self.mode = _mode_key(mode)
+        self.lo = _NEG if lo is None else lo
+        self.hi = _POS if hi is None else hi
+
+    def match(self, mask: int, mode: str, freq: float) -> bool:
+        """Скалярная проверка — то же, что allowed(), но без БД.
+        mask — RDA спота (rda_catalog.catalog.mask)."""
+        if self.mask and not self.mask & mask:
+            return False
+        if self.mode != "ANY" and self.mode != norm_mode(mode):
+            return False
+        return self.lo <= freq <= self.hi
+
+
+class _Bands:
+    """Интервалы диапазонов: (lo, hi) → chat_id. Различных интервалов мало
+    (в основном пресеты из keyboards.band_menu), поэтому поиск покрывающих
+    частоту — bisect по lo + проверка hi."""
+
+    def __init__(self):
+        self._sets: dict[tuple[float, float], set[int]] = {}
+        self._keys: list[tuple[float, float]] = []   # отсортированы по lo
+
+    def add(self, key: tuple[float, float], cid: int):
+        s = self._sets.get(key)
+        if s is None:
+            s = self._sets[key] = set()
+            self._keys.insert(bisect_right(self._keys, key), key)
+        s.add(cid)
+
+    def discard(self, key: tuple[float, float], cid: int):
+        s = self._sets.get(key)
+        if s is None:
+            return
+        s.discard(cid)
+        if not s:
+            del self._sets[key]
+            self._keys.remove(key)
+
+    def covering(self, freq: float) -> list[set[int]]:
+        end = bisect_right(self._keys, (freq, _POS))
+        return [self._sets[k] for k in self._keys[:end] if freq <= k[1]]
+
+
+class SubscriberIndex:
+    """Индекс подписчиков на споты.
+    Фильтры хранятся для всех известных чатов, в корзины попадают только
+    подписанные на «spot». Все методы синхронные и O(изменений)."""
+
+    def __init__(self):
+        self._filters: dict[int, Filter] = {}
+        self._subs: set[int] = set()
+        self._by_rda: dict[str, set[int]] = {}
+        self._no_rda: set[int] = set()
+        self._by_mode: dict[str, set[int]] = {}
+        self._bands = _Bands()
+        self._tmpl: dict[int, Template] = {}     # только нестандартные
+
+    # ───── загрузка ─────
+    def load(self, subs: Iterable[int], filters: dict[int, Filter],
+             fmts: dict[int, str] | None = None):
+        """Полная загрузка при старте (см. storage.load_filters)."""
+        self.__init__()
+        self._filters.update(filters)
+        for cid, fmt in (fmts or {}).items():
+            self.set_template(cid, fmt)
+        for cid in subs:
+            self.subscribe(cid, True)
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def __contains__(self, cid: int) -> bool:
+        return cid in self._subs
+
+    def get(self, cid: int) -> Filter:
+        return self._filters.get(cid) or Filter()
+
+    # ───── корзины ─────
+    def _link(self, cid: int, f: Filter):
+        if f.rdas:
+            for code in f.rdas:
+                self._by_rda.setdefault(code, set()).add(cid)
+        else:
+            self._no_rda.add(cid)
+        self._by_mode.setdefault(f.mode, set()).add(cid)
+        self._bands.add((f.lo, f.hi), cid)
+
+    def _unlink(self, cid: int, f: Filter):
+        if f.rdas:
+            for code in f.rdas:
+                s = self._by_rda.get(code)
+                if s is not None:
+                    s.discard(cid)
+                    if not s:
+                        del self._by_rda[code]
+        else:
+            self._no_rda.discard(cid)
+        s = self._by_mode.get(f.mode)
+        if s is not None:
+            s.discard(cid)
+        self._bands.discard((f.lo, f.hi), cid)
+
+    def _replace(self, cid: int, new: Filter):
+        if cid in self._subs:
+            self._unlink(cid, self.get(cid))
+            self._link(cid, new)
+        self._filters[cid] = new
+
+    # ───── инкрементальные изменения ─────
+    def subscribe(self, cid: int, on: bool):
+        if on and cid not in self._subs:
+            self._subs.add(cid)
+            self._link(cid, self.get(cid))
+        elif not on and cid in self._subs:
+            self._subs.discard(cid)
+            self._unlink(cid, self.get(cid))
+
+    def set_rda(self, cid: int, codes: Iterable[str]):
+        f = self.get(cid)
+        self._replace(cid, Filter(codes, f.mode, f.lo, f.hi))
+
+    def set_mode(self, cid: int, mode: str | None):
+        f = self.get(cid)
+        self._replace(cid, Filter(f.rdas, mode, f.lo, f.hi))
+
+    def set_band(self, cid: int, lo: float | None, hi: float | None):
+        f = self.get(cid)
+        self._replace(cid, Filter(f.rdas, f.mode, lo, hi))
+
+    def set_template(self, cid: int, fmt: str | None):
+        """Шаблон уже проверен при сохранении (storage.set_template)"""
+        t = templates.compile_template(fmt) if fmt else templates.DEFAULT
+        if t is templates.DEFAULT:
+            self._tmpl.pop(cid, None)
+        else:
+            self._tmpl[cid] = t
+
+    def template(self, cid: int) -> Template:
+        return self._tmpl.get(cid, templates.DEFAULT)
+
+    def move(self, old: int, new: int) -> bool:
+        """Чат сменил id (группа → супергруппа): фильтр, шаблон и подписка —
+        на new. False — о старом id индекс ничего не знает (уже перенесён)"""
+        if old not in self._filters and old not in self._subs and old not in self._tmpl:
+            return False
+        on = old in self._subs
+        self.subscribe(old, False)
+        f = self._filters.pop(old, None)
+        if f is not None:
+            self._replace(new, f)
+        t = self._tmpl.pop(old, None)
+        if t is not None:
+            self._tmpl[new] = t
+        if on:
+            self.subscribe(new, True)
+        return True
+
+    def by_template(self, cids: Iterable[int]) -> dict[Template, list[int]]:
+        """Группирует чаты по шаблону: спот рендерится раз на группу"""
+        out: dict[Template, list[int]] = {}
+        tmpl = self._tmpl
+        for cid in cids:
+            out.setdefault(tmpl.get(cid, templates.DEFAULT), []).append(cid)
+        return out
+
+    # ───── поиск ─────
+    def match(self, rda: str, mode: str, freq: float) -> list[int]:
+        """chat_id подписчиков, которым подходит спот (аналог allowed())."""
+        codes = rda.split()
+        cand: set[int] = set(self._no_rda)
+        for code in codes:
+            cand.update(self._by_rda.get(code, _EMPTY))
+        if not cand:
+            return []
+        any_mode = self._by_mode.get("ANY", _EMPTY)
+        this_mode = self._by_mode.get(norm_mode(mode), _EMPTY)
+        bands = self._bands.covering(freq)
+        if not bands:
+            return []
+        return [
+            cid for cid in cand
+            if (cid in any_mode or cid in this_mode)
+            and any(cid in b for b in bands)
+        ]
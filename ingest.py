@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь приёма спотов между Socket.IO-колбэком и рассылкой.
+Колбэк только разбирает строку и кладёт спот в ограниченную очередь,
+пул воркеров разбирает очередь (dedup → фильтры → рендер → delivery).
+Переполнение — явная политика:
+  drop-oldest — выбрасываем самый старый спот;
+  coalesce    — новый спот заменяет ждущий с тем же ключом
+                (позывной + RDA), иначе выбрасываем самый старый.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+import metrics
+
+log = logging.getLogger("RDA-bot.ingest")
+
+POLICIES = ("drop-oldest", "coalesce")
+
+
+class SpotPipeline:
+    def __init__(self, handler: Callable[[Any], Awaitable[bool]], workers: int = 4,
+                 maxsize: int = 1000, policy: str = "drop-oldest",
+                 report_sec: float = 60.0):
+        """handler(spot) → True, если спот новый и разослан; False — дубль"""
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy: {policy}")
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.policy = policy
+        self.report_sec = report_sec
+        self._items: OrderedDict[int, tuple[float, Any, Hashable]] = OrderedDict()
+        self._by_key: dict[Hashable, int] = {}   # для coalesce
+        self._seq = itertools.count()
+        self._ready = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._busy = 0
+        # счётчики
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.deduped = 0
+        self.dispatched = 0
+        self.failed = 0
+        self._lag: deque[float] = deque(maxlen=1024)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # ───── жизненный цикл ─────
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.report_sec:
+            self._tasks.append(asyncio.create_task(self._reporter()))
+
+    async def stop(self, timeout: float = 5.0):
+        """Разобрать очередь (не дольше timeout) и остановить воркеры"""
+        deadline = time.monotonic() + timeout
+        while (self._items or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ───── приём ─────
+    def push(self, spot: Any, key: Hashable = None):
+        """Синхронно: из колбэка сокета, без ожидания рассылки"""
+        self.received += 1
+        now = time.monotonic()
+        if len(self._items) >= self.maxsize:
+            seq = self._by_key.get(key) if self.policy == "coalesce" else None
+            if seq is not None:
+                ts, _, _ = self._items[seq]
+                self._items[seq] = (ts, spot, key)  # место и время приёма — старые
+                self.coalesced += 1
+                return
+            self._pop()
+            self.dropped += 1
+        seq = next(self._seq)
+        self._items[seq] = (now, spot, key)
+        if self.policy == "coalesce":
+            self._by_key[key] = seq
+        self._ready.set()
+
+    def _pop(self) -> tuple[float, Any]:
+        seq, (ts, spot, key) = self._items.popitem(last=False)
+        if self._by_key.get(key) == seq:
+            del self._by_key[key]
+        return ts, spot
+
+    async def _get(self) -> tuple[float, Any]:
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._pop()
+
+    # ───── воркеры ─────
+    async def _worker(self):
+        while True:
+            ts, spot = await self._get()
+            self._busy += 1
+            try:
+                if await self.handler(spot):
+                    self.dispatched += 1
+                    lag = time.monotonic() - ts
+                    self._lag.append(lag)
+                    metrics.SPOT_LATENCY.observe(lag)
+                else:
+                    self.deduped += 1
+            except Exception:
+                self.failed += 1
+                log.exception("spot dispatch")
+            finally:
+                self._busy -= 1
+
+    # ───── метрики ─────
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._items),
+            "received": self.received,
+            "deduped": self.deduped,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "lag_p50": metrics.pct(self._lag, 0.5),
+            "lag_p95": metrics.pct(self._lag, 0.95),
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (
+            f"queued={s['queued']} received={s['received']} deduped={s['deduped']} "
+            f"dropped={s['dropped']} coalesced={s['coalesced']} "
+            f"dispatched={s['dispatched']} failed={s['failed']} "
+            f"lag p50/p95={s['lag_p50'] * 1e3:.0f}/{s['lag_p95'] * 1e3:.0f}ms"
+        )
+
+    async def _reporter(self):
+        last = -1
+        while True:
+            await asyncio.sleep(self.report_sec)
+            if self.received != last:
+                last = self.received
+                log.info("ingest: %s", self.report())
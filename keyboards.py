@@ -30,6 +30,8 @@ def settings_menu() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="⚙️ Режим",    callback_data="set_mode")],
         [InlineKeyboardButton(text="📡 Диапазон", callback_data="set_band")],
         [InlineKeyboardButton(text="📍 RDA-зоны", callback_data="set_rda")],
+        [InlineKeyboardButton(text="🗞 Дайджест", callback_data="set_digest")],
+        [InlineKeyboardButton(text="🔁 Повторы",  callback_data="set_repeat")],
         [InlineKeyboardButton(text="✅ Готово",   callback_data="set_done")],
     ])
 
@@ -63,3 +65,30 @@ def band_menu() -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text="🔧 Другой…", callback_data="band|custom")])
     rows.append([InlineKeyboardButton(text="◀️ Назад",    callback_data="settings_back")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def digest_menu(current: int) -> InlineKeyboardMarkup:
+    # окно дайджеста в секундах: 0 — каждый спот отдельным сообщением
+    windows = [0, 5 * 60, 15 * 60, 30 * 60, 60 * 60]
+    row = []
+    for sec in windows:
+        text = f"{sec // 60} мин" if sec else "Выкл"
+        label = f"✅ {text}" if sec == current else text
+        row.append(InlineKeyboardButton(text=label, callback_data=f"digest|{sec}"))
+    return InlineKeyboardMarkup(inline_keyboard=[
+        row,
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="settings_back")],
+    ])
+
+def repeat_menu(current: int | None, default: int) -> InlineKeyboardMarkup:
+    # окно подавления повторов в минутах: None — общее, 0 — слать все
+    row = [InlineKeyboardButton(
+        text=f"✅ Общее ({default})" if current is None else f"Общее ({default})",
+        callback_data="repeat|default")]
+    for m in [0, 5, 15, 30, 60]:
+        text = f"{m} мин" if m else "Выкл"
+        label = f"✅ {text}" if m == current else text
+        row.append(InlineKeyboardButton(text=label, callback_data=f"repeat|{m}"))
+    return InlineKeyboardMarkup(inline_keyboard=[
+        row[:3], row[3:],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="settings_back")],
+    ])
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики процесса в текстовом формате Prometheus — без внешних зависимостей.
+  • Histogram — фиксированные корзины; observe() = bisect + два сложения,
+    дёшево настолько, чтобы стоять на горячем пути спотов постоянно;
+  • Counter / Gauge — либо set()/inc(), либо fn: значение читается
+    в момент опроса (fn может быть корутиной — например, запрос к БД);
+  • serve(host, port) / stop() — GET /metrics на aiohttp внутри процесса бота.
+"""
+
+import abc
+import bisect
+import inspect
+import time
+from functools import wraps
+from typing import Callable, Sequence
+
+from aiohttp import web
+
+# секунды: от долей миллисекунды (фильтр, запрос к БД) до минут (очередь)
+LATENCY = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNTS = (1, 2, 3, 5, 10, 20)
+
+_registry: list["_Metric"] = []
+
+
+def pct(data, q: float) -> float:
+    """Квантиль q выборки (окно последних значений в stats()); пусто — 0"""
+    if not data:
+        return 0.0
+    s = sorted(data)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def _fmt(v: float) -> str:
+    return "+Inf" if v == float("inf") else repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._child()
+        return child
+
+    @abc.abstractmethod
+    def _child(self):
+        """Значение одного набора меток"""
+
+    @abc.abstractmethod
+    async def samples(self) -> list[str]:
+        """Строки экспозиции без HELP/TYPE"""
+
+    async def render(self) -> str:
+        head = f"# HELP {self.name} {self.doc}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(s + "\n" for s in await self.samples())
+
+
+# ───── гистограмма ─────
+class _Hist:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.sum += v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: Sequence[float] = LATENCY,
+                 labelnames: Sequence[str] = ()):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames)
+        self._default = None if self.labelnames else self.labels()
+
+    def _child(self) -> _Hist:
+        return _Hist(self.buckets)
+
+    def observe(self, v: float):
+        self._default.observe(v)
+
+    async def samples(self) -> list[str]:
+        out = []
+        for values, h in self._children.items():
+            acc = 0
+            for le, n in zip(self.buckets + (float("inf"),), h.counts):
+                acc += n
+                le_pair = f'le="{_fmt(le)}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, values, le_pair)} {acc}")
+            lb = _labels(self.labelnames, values)
+            out.append(f"{self.name}_sum{lb} {h.sum!r}")
+            out.append(f"{self.name}_count{lb} {acc}")
+        return out
+
+
+# ───── счётчики и показатели ─────
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, v: float):
+        self.value = v
+
+    def inc(self, v: float = 1):
+        self.value += v
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, fn: Callable | None = None,
+                 labelnames: Sequence[str] = ()):
+        """fn() → число или {(метки…): число}; вызывается при опросе"""
+        super().__init__(name, doc, labelnames)
+        self.fn = fn
+        self._default = None if self.labelnames or fn else self.labels()
+
+    def _child(self) -> _Value:
+        return _Value()
+
+    def set(self, v: float):
+        self._default.set(v)
+
+    def inc(self, v: float = 1):
+        self._default.inc(v)
+
+    async def samples(self) -> list[str]:
+        if self.fn is None:
+            items = [(k, c.value) for k, c in self._children.items()]
+        else:
+            v = self.fn()
+            if inspect.isawaitable(v):
+                v = await v
+            items = list(v.items()) if isinstance(v, dict) else [((), v)]
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Counter(Gauge):
+    kind = "counter"
+
+
+# ───── хелперы ─────
+def timed(hist: Histogram):
+    """Декоратор корутины: время вызова в hist с меткой = имя функции"""
+    def wrap(fn):
+        child = hist.labels(fn.__name__)
+
+        @wraps(fn)
+        async def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - t0)
+        return inner
+    return wrap
+
+
+async def render() -> str:
+    return "".join([await m.render() for m in _registry])
+
+
+async def _handler(request: web.Request) -> web.Response:
+    return web.Response(body=(await render()).encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+_runner: web.AppRunner | None = None
+
+async def serve(host: str, port: int):
+    global _runner
+    app = web.Application()
+    app.router.add_get("/metrics", _handler)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+
+async def stop():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+
+
+# ───── метрики бота ─────
+# регистрируются здесь, чтобы модули просто импортировали нужную
+SPOT_LATENCY = Histogram(
+    "rda_spot_latency_seconds", "Spot receive to dispatch (queue + filters + enqueue)")
+FILTER_SEC = Histogram(
+    "rda_spot_filter_seconds", "Subscriber index match + template grouping per spot")
+STORAGE_SEC = Histogram(
+    "rda_storage_query_seconds", "storage.py call duration", labelnames=("query",))
+SEND_CHUNKS = Histogram(
+    "rda_send_chunks", "Chunks per outgoing message (split_html)", buckets=COUNTS)
+TG_SEND_SEC = Histogram(
+    "rda_telegram_send_seconds", "Bot API sendMessage round trip")
+ANN_FETCH_SEC = Histogram(
+    "rda_ann_fetch_seconds", "rdaward.ru download (incl. 304)")
+ANN_PARSE_SEC = Histogram(
+    "rda_ann_parse_seconds", "Announcement fragment parse")
+WEBHOOK_SEC = Histogram(
+    "rda_webhook_update_seconds", "Webhook update: receive to handled (feed_update)")
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Скомпилированный каталог RDA-кодов.
+Каждому коду — плотный номер (бит в маске), коды сгруппированы по
+префиксу области («AD-*» — все районы AD). Фильтры чатов и RDA спотов
+и анонсов превращаются в маски int, проверка «есть общий код» — одно
+побитовое И.
+
+Разбор RDA_list_2025.json / .csv (CSV — перебор кодировок и regex по
+строкам) делается один раз: результат пишется в компактный двоичный
+кэш рядом с источником и пересобирается, только если источник
+изменился (размер или mtime).
+
+Коды, которых нет в списке (пришли со спотом или списка нет вовсе),
+получают номер на лету — маски всё равно сравнимы внутри процесса.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import re
+import struct
+from itertools import groupby
+from typing import Iterable
+
+log = logging.getLogger("RDA-bot.rda")
+
+SOURCES = ("RDA_list_2025.json", "RDA_list_2025.csv")
+CODE_RE = re.compile(r"[A-Z]{2}-\d{2}")
+
+# заголовок кэша: магия, размер и mtime_ns источника, число кодов;
+# дальше — коды ASCII через \n в порядке номеров
+_MAGIC = b"RDAC\x01\x00"
+_HEAD = struct.Struct("<6sQQI")
+
+
+def region(code: str) -> str:
+    return code.split("-", 1)[0]
+
+
+class Catalog:
+    def __init__(self, codes: Iterable[str] = ()):
+        self.codes: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.regions: dict[str, int] = {}      # префикс → маска кодов списка
+        self.known = 0                         # коды из списка: номера 0…known-1
+        self._set(sorted(set(codes)))
+
+    def _set(self, codes: list[str]):
+        """codes отсортированы: коды области идут подряд, её маска — один отрезок бит"""
+        self.codes = list(codes)
+        self.ids = {c: i for i, c in enumerate(self.codes)}
+        self.regions = {}
+        start = 0
+        for r, group in groupby(self.codes, region):
+            n = sum(1 for _ in group)
+            self.regions[r] = ((1 << n) - 1) << start
+            start += n
+        self.known = len(self.codes)
+
+    def __len__(self) -> int:
+        return self.known
+
+    def __contains__(self, code: str) -> bool:
+        """Код есть в загруженном списке (не выдан на лету)"""
+        return self.ids.get(code, self.known) < self.known
+
+    # ───── номера и маски ─────
+    def id(self, code: str) -> int:
+        i = self.ids.get(code)
+        if i is None:
+            i = self.ids[code] = len(self.codes)
+            self.codes.append(code)
+        return i
+
+    def mask(self, codes: Iterable[str]) -> int:
+        m = 0
+        for code in codes:
+            m |= 1 << self.id(code)
+        return m
+
+    def unmask(self, mask: int) -> list[str]:
+        out = []
+        while mask:
+            low = mask & -mask
+            out.append(self.codes[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    # ───── шаблоны и отображение ─────
+    def expand(self, token: str) -> list[str]:
+        """«AD-*» → районы области, «AD-01» → [AD-01]; [] — нет такого.
+        Без загруженного списка принимается любой код."""
+        token = token.upper()
+        if token.endswith("-*"):
+            return self.unmask(self.regions.get(token[:-2], 0))
+        if token in self or (not self.known and CODE_RE.fullmatch(token)):
+            return [token]
+        return []
+
+    def compact(self, codes: Iterable[str]) -> list[str]:
+        """Полностью выбранные области — как «AD-*», остальное по коду"""
+        codes = set(codes)
+        m = self.mask(codes)
+        out: list[str] = []
+        for r, rm in sorted(self.regions.items()):
+            if m & rm == rm and rm & (rm - 1):          # вся область, кодов > 1
+                out.append(f"{r}-*")
+                codes.difference_update(self.unmask(rm))
+        return out + sorted(codes)
+
+    # ───── загрузка и кэш ─────
+    def load(self, paths: Iterable[str] = SOURCES) -> "Catalog":
+        """Первый найденный источник; кэш — <источник>.bin"""
+        for p in paths:
+            src = pathlib.Path(p)
+            if not src.exists():
+                continue
+            st = src.stat()
+            cache = src.with_suffix(".bin")
+            codes = _read_cache(cache, st)
+            if codes is None:
+                codes = sorted(_parse(src))
+                _write_cache(cache, st, codes)
+                log.info("RDA catalog compiled from %s", src)
+            self._set(codes)
+            return self
+        self._set([])
+        return self
+
+
+def _parse(f: pathlib.Path) -> set[str]:
+    if f.suffix == ".json":
+        return set(json.loads(f.read_text(encoding="utf-8")))
+    codes = set()
+    for enc in ("utf-8-sig", "utf-8", "cp1251", "koi8-r", "latin1"):
+        try:
+            with f.open(encoding=enc) as fh:
+                for ln in fh:
+                    code = re.split(r"[;\t ,]+", ln.strip())[0]
+                    if CODE_RE.fullmatch(code):
+                        codes.add(code)
+            break
+        except UnicodeDecodeError:
+            continue
+    return codes
+
+
+def _read_cache(cache: pathlib.Path, st: os.stat_result) -> list[str] | None:
+    try:
+        data = cache.read_bytes()
+        magic, size, mtime, n = _HEAD.unpack_from(data)
+        codes = data[_HEAD.size:].decode("ascii").split("\n") if n else []
+    except (OSError, struct.error, ValueError):
+        return None
+    if magic != _MAGIC or size != st.st_size or mtime != st.st_mtime_ns:
+        return None
+    return codes if len(codes) == n else None
+
+
+def _write_cache(cache: pathlib.Path, st: os.stat_result, codes: list[str]):
+    tmp = cache.with_suffix(".tmp")
+    try:
+        tmp.write_bytes(_HEAD.pack(_MAGIC, st.st_size, st.st_mtime_ns, len(codes))
+                        + "\n".join(codes).encode("ascii"))
+        os.replace(tmp, cache)
+    except (OSError, UnicodeEncodeError) as e:
+        log.warning("RDA catalog cache not written: %s", e)
+
+
+# общий каталог процесса: bot.py загружает его при импорте
+catalog = Catalog()
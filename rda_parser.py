@@ -4,29 +4,54 @@
 Парсер «Анонсов экспедиций» с rdaward.ru
 ✓ корректно вытаскивает все RDA‑коды (даже внутри […])
 ✓ аккуратно вытаскивает даты/источник/добавлено
-✓ умеет отдавать только новые записи (only_new=True)
+✓ считает хэш карточки и дельту (новые / изменённые / снятые) против
+  сохранённого состояния (storage.ann_state) — см. ann_loop в bot.py
+✓ качает асинхронно (aiohttp, keep-alive), с ETag/If-Modified-Since;
+  если фрагмент не изменился — разбор пропускается
+✓ общий снимок ленты (Snapshot): TTL, одна загрузка на всех ждущих,
+  текст кэшируется; сайт лёг — отдаётся прошлый снимок
+✓ быстрый разбор: фрагмент ищется регэкспом по странице, карточки —
+  потоковым html.parser без построения дерева (старый движок на
+  BeautifulSoup оставлен как эталон: _extract_fragment_bs4/_parse_bs4,
+  сверка и замеры — bench/parser_bench.py)
 """
 
-import html, re, requests
+import asyncio, hashlib, html, re, time
 from datetime import datetime
+from html.parser import HTMLParser
+
+import aiohttp
 from bs4 import BeautifulSoup
 
-URL = "https://rdaward.ru"
+import metrics
+from rda_catalog import catalog
 
-# запоминаем id анонсов, чтобы не повторяться
-_seen: set[str] = set()
+URL = "https://rdaward.ru"
 
 RDA_RE = re.compile(r"[A-Z]{2}-\d{2}")           # OM‑07, NS‑44 …
+DIV_RE = re.compile(r"var\s+div_contents\s*=\s*'(.+?)';", re.S)
+CARD_RE = re.compile(r"border:1px solid")
+DATE_RE = re.compile(r"с\s*(\d{2}\.\d{2}\.\d{4}).*?по\s*(\d{2}\.\d{2}\.\d{4})")
+SRC_RE = re.compile(r"источник:\s*([^,•]+)", re.I)
+ADD_RE = re.compile(r"добавлено:\s*(\d{2}\.\d{2}\.\d{4})")
+SPACE_RE = re.compile(r"\s+")
 
 # ─────────── helpers ───────────
 def _clean_space(txt: str) -> str:
     """заменяем не‑разрывные пробелы и убираем лишние"""
-    return re.sub(r"\s+", " ", txt.replace("\xa0", " ")).strip()
+    return SPACE_RE.sub(" ", txt.replace("\xa0", " ")).strip()
 
 
-def _fetch_fragment() -> str:
+def _extract_fragment(page: str) -> str:
     """отдаёт HTML‑фрагмент, который сайт вставляет JS‑ом"""
-    page = requests.get(URL, timeout=20).text
+    m = DIV_RE.search(page)
+    if m is None:
+        raise ValueError("div_contents not found")
+    return html.unescape(m.group(1)).replace("\\'", "'")
+
+
+def _extract_fragment_bs4(page: str) -> str:
+    """эталон для _extract_fragment: весь документ через BeautifulSoup"""
     soup = BeautifulSoup(page, "html.parser")
     script = soup.find("script", string=re.compile(r"var\s+div_contents"))
     raw = re.search(r"var\s+div_contents\s*=\s*'(.+?)';", script.string, re.S).group(1)
@@ -44,8 +69,155 @@ def _unique_ordered(seq):
 
 
 # ─────────── main low‑level parse ───────────
-def _parse() -> list[dict]:
-    frag = BeautifulSoup(_fetch_fragment(), "html.parser")
+def _card(callsign: str, declared: str, right_text: str) -> dict:
+    # даты
+    m_date = DATE_RE.search(right_text)
+    d_from, d_to = m_date.groups() if m_date else ("—", "—")
+
+    # источник, добавлено
+    m_src  = SRC_RE.search(right_text)
+    m_add  = ADD_RE.search(right_text)
+    source = _clean_space(m_src.group(1)) if m_src else "—"
+    added  = m_add.group(1) if m_add else "—"
+
+    # RDA‑коды: берём ТЕКСТ целиком → ищем регэкспом → удаляем дубли сохраняя порядок
+    rdas = _unique_ordered(RDA_RE.findall(right_text))
+
+    return {
+        "id": f"{callsign}_{declared}",
+        "callsign": callsign,
+        "date_from": d_from,
+        "date_to":   d_to,
+        "source":    source,
+        "added":     added,
+        "rdas":      rdas,
+    }
+
+
+class _Card:
+    """состояние одной открытой карточки"""
+    __slots__ = ("depth", "child", "n_child", "b", "span",
+                 "b_txt", "span_txt", "right", "slot")
+
+    def __init__(self, depth: int, slot: int):
+        self.depth = depth      # глубина div-карточки в стеке
+        self.child = 0          # глубина текущего прямого div-потомка
+        self.n_child = 0        # его номер: 1 — левый, 2 — правый
+        self.b = self.span = 0  # глубина захвата <b>/<span>
+        self.b_txt: list[str] | None = None
+        self.span_txt: list[str] | None = None
+        self.right: list[str] = []
+        self.slot = slot        # место в выдаче (порядок открытия)
+
+
+class _CardScanner(HTMLParser):
+    """Потоковый разбор карточек без дерева. Повторяет то, что видит
+    BeautifulSoup (html.parser): пустые теги не открываются, закрывающий
+    тег снимает стек до ближайшего одноимённого, конец документа закрывает
+    всё, комментарии не текст, вложенные карточки тоже карточки.
+    Из карточки (div со style «border:1px solid») берём:
+    левый div → первый <b> и первый <span>, правый div → весь текст."""
+
+    VOID = frozenset((
+        "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+        "link", "menuitem", "meta", "param", "source", "track", "wbr",
+        "basefont", "bgsound", "command", "frame", "image", "isindex",
+        "nextid", "spacer",
+    ))
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._out: list[dict | None] = []
+        self._stack: list[str] = []
+        self._open: list[_Card] = []
+        self._skip = 0          # внутри <script>/<style>
+
+    @property
+    def cards(self) -> list[dict]:
+        return [c for c in self._out if c is not None]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID:
+            return
+        self._stack.append(tag)
+        depth = len(self._stack)
+        if tag in ("script", "style"):
+            self._skip += 1
+        for c in self._open:
+            if tag == "div" and depth == c.depth + 1:
+                c.child = depth
+                c.n_child += 1
+            elif c.n_child == 1 and c.child:
+                if tag == "b" and c.b_txt is None:
+                    c.b, c.b_txt = depth, []
+                elif tag == "span" and c.span_txt is None:
+                    c.span, c.span_txt = depth, []
+        if tag == "div" and CARD_RE.search(dict(attrs).get("style") or ""):
+            self._open.append(_Card(depth, len(self._out)))
+            self._out.append(None)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        try:
+            i = len(self._stack) - 1 - self._stack[::-1].index(tag)
+        except ValueError:
+            return                  # нечего закрывать — как в bs4
+        self._unwind(i)
+
+    def close(self):
+        super().close()
+        self._unwind(0)             # конец документа закрывает всё
+
+    def _unwind(self, i: int):
+        while len(self._stack) > i:
+            depth = len(self._stack)
+            if self._stack.pop() in ("script", "style"):
+                self._skip -= 1
+            for c in self._open:
+                if depth == c.b:
+                    c.b = 0
+                if depth == c.span:
+                    c.span = 0
+                if depth == c.child:
+                    c.child = 0
+            if self._open and self._open[-1].depth == depth:
+                self._emit(self._open.pop())
+
+    def handle_data(self, data):
+        if not self._open or self._skip:
+            return
+        stripped = data.strip()
+        for c in self._open:
+            if c.b:
+                c.b_txt.append(data)
+            if c.span:
+                c.span_txt.append(data)
+            if c.n_child == 2 and c.child and stripped:
+                c.right.append(stripped)
+
+    def _emit(self, c: _Card):
+        if c.n_child < 2 or c.b_txt is None or c.span_txt is None:
+            return                  # битая карточка — пропускаем
+        self._out[c.slot] = _card(
+            _clean_space("".join(c.b_txt)),
+            _clean_space("".join(c.span_txt)),
+            _clean_space(" ".join(c.right)),
+        )
+
+
+def _parse(fragment: str) -> list[dict]:
+    scanner = _CardScanner()
+    scanner.feed(fragment)
+    scanner.close()
+    return scanner.cards
+
+
+def _parse_bs4(fragment: str) -> list[dict]:
+    """эталон для _parse (прежний движок на BeautifulSoup)"""
+    frag = BeautifulSoup(fragment, "html.parser")
     cards = frag.find_all("div", style=re.compile(r"border:1px solid"))
     out = []
 
@@ -53,61 +225,243 @@ def _parse() -> list[dict]:
         left, right = card.find_all("div", recursive=False)[:2]
         callsign = _clean_space(left.b.text)
         declared = _clean_space(left.span.text)
-
         right_text = _clean_space(right.get_text(" ", strip=True))
-
-        # даты
-        m_date = re.search(r"с\s*(\d{2}\.\d{2}\.\d{4}).*?по\s*(\d{2}\.\d{2}\.\d{4})", right_text)
-        d_from, d_to = m_date.groups() if m_date else ("—", "—")
-
-        # источник, добавлено
-        m_src  = re.search(r"источник:\s*([^,•]+)", right_text, re.I)
-        m_add  = re.search(r"добавлено:\s*(\d{2}\.\d{2}\.\d{4})", right_text)
-        source = _clean_space(m_src.group(1)) if m_src else "—"
-        added  = m_add.group(1) if m_add else "—"
-
-        # RDA‑коды: берём ТЕКСТ целиком → ищем регэкспом → удаляем дубли сохраняя порядок
-        rdas = _unique_ordered(RDA_RE.findall(right_text))
-
-        out.append({
-            "id": f"{callsign}_{declared}",
-            "callsign": callsign,
-            "date_from": d_from,
-            "date_to":   d_to,
-            "source":    source,
-            "added":     added,
-            "rdas":      rdas,
-        })
+        out.append(_card(callsign, declared, right_text))
     return out
 
 
+# ─────────── загрузка ───────────
+class Fetcher:
+    """Одна aiohttp-сессия на весь процесс + условные GET.
+    304 или тот же хэш фрагмента → отдаём прошлый результат разбора."""
+
+    def __init__(self, url: str = URL, timeout: float = 20):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+        self._etag: str | None = None
+        self._modified: str | None = None
+        self._hash: bytes | None = None
+        self._items: list[dict] = []
+        self.parsed = 0          # сколько раз реально разбирали фрагмент
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=300),
+            )
+        return self._session
+
+    async def items(self) -> list[dict]:
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._modified:
+            headers["If-Modified-Since"] = self._modified
+        t0 = time.perf_counter()
+        async with self._get_session().get(self.url, headers=headers) as r:
+            if r.status == 304:
+                metrics.ANN_FETCH_SEC.observe(time.perf_counter() - t0)
+                return self._items
+            r.raise_for_status()
+            page = await r.text()
+            etag, modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        t1 = time.perf_counter()
+        metrics.ANN_FETCH_SEC.observe(t1 - t0)
+        fragment = _extract_fragment(page)
+        h = hashlib.blake2b(fragment.encode(), digest_size=16).digest()
+        if h != self._hash:
+            # разбор карточек — чистый Python: в потоке, не блокируя цикл
+            self._items = await asyncio.to_thread(_parse, fragment)
+            self._hash = h
+            self.parsed += 1
+        metrics.ANN_PARSE_SEC.observe(time.perf_counter() - t1)
+        self._etag, self._modified = etag, modified
+        return self._items
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_fetcher = Fetcher()
+
+async def fetch_items() -> list[dict]:
+    return await _fetcher.items()
+
+async def close():
+    await _fetcher.close()
+
+
+class Snapshot:
+    """Общий снимок ленты анонсов. ann_loop обновляет его по расписанию,
+    /announcements берёт готовый, пока он моложе ttl. Загрузка всегда
+    одна: кто пришёл во время неё, ждёт её же (single-flight). Текст
+    рендерится один раз на каждый wrap и живёт до изменения ленты.
+    Не удалось обновить — отдаётся прошлый снимок, error задан."""
+
+    def __init__(self, fetch=fetch_items, ttl: float = 600):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.items: list[dict] | None = None
+        self.fetched = 0.0                   # monotonic последней удачной загрузки
+        self.stamp = 0.0                     # она же по часам — для показа возраста
+        self.error: Exception | None = None  # последняя загрузка не удалась
+        self.version = 0                     # растёт, когда лента изменилась
+        self._task: asyncio.Task | None = None
+        self._texts: dict[int, str] = {}
+        self.hits = self.fetches = self.joined = self.stale = 0
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched if self.items is not None else float("inf")
+
+    async def refresh(self) -> list[dict]:
+        """Загрузить сейчас; одновременные вызовы ждут одну загрузку"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._load())
+        else:
+            self.joined += 1
+        # shield: отмена одного ждущего не обрывает загрузку остальным
+        return await asyncio.shield(self._task)
+
+    async def _load(self) -> list[dict]:
+        self.fetches += 1
+        try:
+            items = await self._fetch()
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self._task = None
+        if items is not self.items:          # Fetcher отдаёт тот же список, если ничего не менялось
+            self.items = items
+            self._texts.clear()
+            self.version += 1
+        self.fetched, self.stamp, self.error = time.monotonic(), time.time(), None
+        return items
+
+    async def get(self) -> list[dict]:
+        """Снимок не старше ttl, иначе обновление; при сбое — прошлый снимок
+        (исключение, только если его нет вовсе)"""
+        if self.items is not None and self.age() < self.ttl:
+            self.hits += 1
+            return self.items
+        try:
+            return await self.refresh()
+        except Exception:
+            if self.items is None:
+                raise
+            self.stale += 1
+            return self.items
+
+    def text(self, wrap: int = 10) -> str:
+        txt = self._texts.get(wrap)
+        if txt is None:
+            txt = self._texts[wrap] = render(self.items or [], wrap)
+        return txt
+
+
+snapshot = Snapshot()
+
+
+# ─────────── изменения ───────────
+def card_hash(a: dict) -> str:
+    """хэш того, что считаем «изменением» анонса: даты и список RDA"""
+    key = "|".join((a["date_from"], a["date_to"], ",".join(a["rdas"])))
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def diff(items: list[dict], known: dict[str, str]) -> tuple[list[dict], list[dict], list[str]]:
+    """(новые, изменённые, id снятых) относительно known: id → card_hash"""
+    new, changed = [], []
+    for a in items:
+        h = known.get(a["id"])
+        if h is None:
+            new.append(a)
+        elif h != card_hash(a):
+            changed.append(a)
+    ids = {a["id"] for a in items}
+    removed = [i for i in known if i not in ids]
+    return new, changed, removed
+
+
 # ─────────── публичная точка входа ───────────
-def build_announcements_message(*, only_new=False, wrap: int = 10) -> str:
-    """Возвращает красиво отформатированный текст.
+def render_block(a: dict, wrap: int = 10) -> str:
+    """Блок одного анонса.
        wrap — через сколько RDA делать перенос строки (0 = не переносить)."""
-    global _seen
-    items = _parse()
+    # красиво упаковываем RDA‑список
+    if wrap:
+        parts = [", ".join(a["rdas"][i:i + wrap]) for i in range(0, len(a["rdas"]), wrap)]
+        rda_txt = ",\n".join(parts)
+    else:
+        rda_txt = ", ".join(a["rdas"])
 
-    if only_new:
-        items = [i for i in items if i["id"] not in _seen]
-    if not items:
-        return ""
+    return (
+        f"📡 <b>{a['callsign']}</b> "
+        f"(<i>{a['date_from']}—{a['date_to']}</i>)\n"
+        f"🏷️ <b>{len(a['rdas'])}</b> районов: {rda_txt}\n"
+        f"🔗 источник: <i>{a['source']}</i> • ➕ {a['added']}"
+    )
 
-    _seen.update(i["id"] for i in items)
 
-    blocks: list[str] = []
-    for a in items:
-        # красиво упаковываем RDA‑список
-        if wrap:
-            parts = [", ".join(a["rdas"][i:i + wrap]) for i in range(0, len(a["rdas"]), wrap)]
-            rda_txt = ",\n".join(parts)
-        else:
-            rda_txt = ", ".join(a["rdas"])
+def render(items: list[dict], wrap: int = 10) -> str:
+    """Красиво отформатированный текст"""
+    return "\n\n".join(render_block(a, wrap) for a in items)
 
-        blocks.append(
-            f"📡 <b>{a['callsign']}</b> "
-            f"(<i>{a['date_from']}—{a['date_to']}</i>)\n"
-            f"🏷️ <b>{len(a['rdas'])}</b> районов: {rda_txt}\n"
-            f"🔗 источник: <i>{a['source']}</i> • ➕ {a['added']}"
-        )
-    return "\n\n".join(blocks)
+
+async def build_announcements_message(*, wrap: int = 10) -> str:
+    """Все текущие анонсы одним текстом (из общего снимка)"""
+    await snapshot.get()
+    return snapshot.text(wrap)
+
+
+class Delta:
+    """Дельта анонсов для адресной рассылки: каждый блок рендерится один
+    раз, маска RDA блока (rda_catalog) против маски фильтра получателя
+    подбирает нужные блоки, а собранный текст кэшируется по набору
+    блоков (одинаковые фильтры — один и тот же текст).
+    removed — (позывной, RDA-коды) снятых анонсов."""
+
+    _HEAD = ("🆕 <b>Новые анонсы</b>", "✏️ <b>Изменённые анонсы</b>")
+
+    def __init__(self, new: list[dict], changed: list[dict],
+                 removed: list[tuple[str, list[str]]], wrap: int = 10):
+        # (раздел, текст): 0 — новые, 1 — изменённые, 2 — снятые
+        self._blocks: list[tuple[int, str]] = []
+        self._masks: list[int] = []
+        for kind, items in ((0, new), (1, changed)):
+            for a in items:
+                self._add(kind, render_block(a, wrap), a["rdas"])
+        for callsign, rdas in removed:
+            self._add(2, callsign, rdas)
+        self._all = tuple(range(len(self._blocks)))
+        self._texts: dict[tuple[int, ...], str] = {}
+
+    def _add(self, kind: int, text: str, rdas: list[str]):
+        self._blocks.append((kind, text))
+        self._masks.append(catalog.mask(rdas))
+
+    def __bool__(self) -> bool:
+        return bool(self._blocks)
+
+    def select(self, mask: int) -> tuple[int, ...]:
+        """Номера блоков под маску RDA-фильтра (0 — все блоки)"""
+        if not mask:
+            return self._all
+        return tuple(n for n, m in enumerate(self._masks) if m & mask)
+
+    def text(self, sel: tuple[int, ...]) -> str:
+        txt = self._texts.get(sel)
+        if txt is None:
+            sections: list[list[str]] = [[], [], []]
+            for n in sel:
+                kind, block = self._blocks[n]
+                sections[kind].append(block)
+            parts = [f"{self._HEAD[k]}\n\n" + "\n\n".join(sections[k])
+                     for k in (0, 1) if sections[k]]
+            if sections[2]:
+                parts.append("🗑 <b>Сняты</b>: " + ", ".join(sections[2]))
+            txt = self._texts[sel] = "\n\n".join(parts)
+        return txt
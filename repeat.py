@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Подавление повторов: тот же позывной с тем же RDA на том же диапазоне
+и моде не уходит в чат повторно N минут после доставки (экспедицию
+спотят десять спотеров подряд — чат получает один спот; станция,
+перешедшая на другой диапазон или моду, приходит сразу).
+
+Окно — config.REPEAT_MIN, у чата может быть своё (мастер настроек):
+None — общее, 0 — не подавлять. Всё в памяти, не в БД:
+    (позывной, RDA, диапазон, мода) → {chat_id: истекает}
+Истечение — колесо таймеров с шагом slot секунд (номер шага → записи,
+истекающие в нём). Записей колеса, включая перезаписанные и ещё не
+дошедшие до своего шага, не больше max_entries — при переполнении
+раньше срока уходят истекающие первыми.
+"""
+
+import time
+from typing import Iterable
+
+
+def label(minutes: int | None, default: int) -> str:
+    if minutes is None:
+        return f"по умолчанию ({default} мин)" if default else "по умолчанию (выкл)"
+    return f"{minutes} мин" if minutes else "выкл"
+
+
+class Repeats:
+    def __init__(self, default_min: int = 15, max_entries: int = 200_000, slot: float = 60.0):
+        self.default = default_min
+        self.max_entries = max_entries
+        self.slot = slot
+        self._windows: dict[int, int] = {}      # свои окна чатов, минуты
+        self._seen: dict[tuple[str, str, str | None, str], dict[int, float]] = {}
+        self._wheel: dict[int, list[tuple[tuple, int, float]]] = {}
+        self._tick = int(time.time() // slot)
+        self._n = 0                             # записей в колесе
+        self.suppressed = 0                     # сэкономленных отправок
+        self.passed = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    # ───── настройки ─────
+    def load(self, windows: dict[int, int]):
+        self._windows = dict(windows)
+
+    def window(self, cid: int) -> int | None:
+        """Своё окно чата (None — общее)"""
+        return self._windows.get(cid)
+
+    def set_window(self, cid: int, minutes: int | None):
+        if minutes is None:
+            self._windows.pop(cid, None)
+        else:
+            self._windows[cid] = minutes
+
+    # ───── подбор ─────
+    def filter(self, cids: Iterable[int], callsign: str, rda: str, band: str | None,
+               mode: str, now: float | None = None) -> list[int]:
+        """Чаты, которым спот отправлять; им же он запоминается"""
+        now = time.time() if now is None else now
+        self._advance(now)
+        key = (callsign, rda, band, mode)
+        per = self._seen.get(key)
+        out = []
+        for cid in cids:
+            win = self._windows.get(cid, self.default)
+            if not win:
+                out.append(cid)
+                continue
+            if per is None:
+                per = self._seen[key] = {}
+            exp = per.get(cid)
+            if exp is not None and exp > now:
+                self.suppressed += 1
+                continue
+            exp = per[cid] = now + win * 60
+            self._wheel.setdefault(int(exp // self.slot) + 1, []).append((key, cid, exp))
+            self._n += 1
+            out.append(cid)
+        self.passed += len(out)
+        if self._n > self.max_entries:
+            self._evict()
+        return out
+
+    # ───── истечение ─────
+    def _expire(self, tick: int) -> None:
+        for key, cid, exp in self._wheel.pop(tick, ()):
+            self._n -= 1
+            per = self._seen.get(key)
+            if per is not None and per.get(cid) == exp:  # не перезаписана после постановки
+                del per[cid]
+                if not per:
+                    del self._seen[key]
+
+    def _advance(self, now: float):
+        tick = int(now // self.slot)
+        if tick <= self._tick:
+            return
+        if tick - self._tick > len(self._wheel):  # долго не звали — по занятым шагам
+            for t in sorted(t for t in self._wheel if t <= tick):
+                self._expire(t)
+        else:
+            for t in range(self._tick + 1, tick + 1):
+                self._expire(t)
+        self._tick = tick
+
+    def _evict(self):
+        while self._n > self.max_entries and self._wheel:
+            n = self._n
+            self._expire(min(self._wheel))
+            self.evicted += n - self._n
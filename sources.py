@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Источники спотов: несколько узлов DX-кластера одновременно.
+
+  SocketIOSource — лента Socket.IO (событие new_spot, строка полями через «|»);
+  TelnetSource   — классический telnet-узел на asyncio streams: строки
+                   «DX de СПОТТЕР: частота позывной комментарий ЧЧММZ»
+                   переводятся в ту же строку через «|» (dx_to_wire) и
+                   дальше разбираются тем же spots.WireParser.
+
+У каждого источника свой цикл переподключения: экспоненциальная
+задержка с полным джиттером (Backoff), сброс после первой строки
+нового соединения. Узел, молчащий дольше idle секунд, считается
+зависшим и переподключается.
+
+Ingest сводит источники в одну точку: ключ спота (Spot.key — позывной,
+время, частота) проверяется в общем окне последних ключей — первый
+приход уходит в очередь приёма, копии с других узлов отбрасываются до
+очереди и БД. Счётчики по источнику: строки, споты, первые/копии,
+отброшенные, переподключения, задержка (приём минус время спота) и
+молчание.
+"""
+
+import abc
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Callable
+from urllib.parse import urlsplit
+
+import socketio
+
+import metrics
+import spots
+
+log = logging.getLogger("RDA-bot.sources")
+
+# DX de UA0AAA:     14025.0  R0BI         CW RDA AD-01 tnx        1200Z
+DX_RE = re.compile(r"DX de ([A-Z0-9/#-]+)[:\s]\s*(\d+(?:\.\d+)?)\s+([A-Z0-9/]+)\s+(.*?)\s*(\d{4})Z",
+                   re.I)
+MODE_RE = re.compile(r"\b(CW|SSB|USB|LSB|FM|AM|RTTY|FT8|FT4|PSK\d*|JT65|DIGI|MSK144)\b")
+PROMPT_RE = re.compile(rb"(login|call)\W*$", re.I)
+
+
+def guess_mode(freq: float) -> str:
+    """Мода по бэнд-плану, если в комментарии её нет: нижние 60 кГц
+    диапазона — CW, следующие 40 — цифра, выше — SSB"""
+    for lo, hi, _ in spots.BANDS:
+        if lo <= freq <= hi:
+            off = freq - lo
+            return "CW" if off < 60 else "DIGI" if off < 100 else "SSB"
+    return "SSB"
+
+
+def dx_to_wire(line: str) -> str | None:
+    """«DX de …» → строка кластера через «|»; None — это не спот"""
+    m = DX_RE.search(line)
+    if m is None:
+        return None
+    spotter, freq, call, comment, hhmm = m.groups()
+    up = comment.upper()
+    rda = " ".join(dict.fromkeys(spots.RDA_RE.findall(up))) or "?"
+    mm = MODE_RE.search(up)
+    mode = mm.group(1) if mm else guess_mode(float(freq))
+    return "|".join((call, hhmm + "Z", freq, mode, "?", rda, "?",
+                     comment.replace("|", "/"), spotter))
+
+
+class Backoff:
+    """Экспоненциальная задержка с полным джиттером: uniform(0, min(cap, base·2ⁿ))"""
+
+    def __init__(self, base: float = 1.0, cap: float = 120.0, rnd: random.Random | None = None):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+        self._rnd = rnd or random.Random()
+
+    def next(self) -> float:
+        d = self._rnd.uniform(0, min(self.cap, self.base * 2 ** self.attempt))
+        self.attempt = min(self.attempt + 1, 30)
+        return d
+
+    def reset(self):
+        self.attempt = 0
+
+
+def _lag(hhmm: str, ts: float) -> float | None:
+    """Секунды от начала минуты спота (UTC) до приёма; точность — минута"""
+    if len(hhmm) < 4 or not hhmm[:4].isdigit():
+        return None
+    spot = int(hhmm[:2]) * 3600 + int(hhmm[2:4]) * 60
+    return (ts - spot) % 86400
+
+
+class Source(abc.ABC):
+    """Один узел кластера. run(on_line) — бесконечный цикл подключений;
+    on_line(источник, строка через «|» или None — не спот)"""
+    kind = "?"
+
+    def __init__(self, url: str, *, idle: float = 300.0, backoff: Backoff | None = None):
+        self.url = url
+        self.name = urlsplit(url).netloc or url
+        self.idle = idle
+        self.backoff = backoff or Backoff()
+        self.up = False
+        self.lines = self.spots = self.first = self.copies = self.rejected = 0
+        self.reconnects = 0
+        self.last_line = time.monotonic()
+        self._lag: deque[float] = deque(maxlen=256)
+        self._on_line: Callable | None = None
+        self._fresh = False                     # соединение ещё не дало ни строки
+
+    async def run(self, on_line: Callable):
+        self._on_line = on_line
+        while True:
+            try:
+                await self._session()
+                reason = "closed by peer"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+            finally:
+                self.up = False
+            self.reconnects += 1
+            delay = self.backoff.next()
+            log.warning("source %s: %s; reconnect in %.1f s", self.name, reason, delay)
+            await asyncio.sleep(delay)
+
+    def _connected(self):
+        self.up = True
+        self._fresh = True
+        self.last_line = time.monotonic()
+        log.info("source %s (%s) connected", self.name, self.kind)
+
+    def _line(self, wire: str | None):
+        if self._fresh:
+            self._fresh = False
+            self.backoff.reset()                # узел живой — следующий сбой с малой задержки
+        self.lines += 1
+        self.last_line = time.monotonic()
+        if wire is not None:
+            self._on_line(self, wire)
+
+    def observe_lag(self, lag: float):
+        """Задержка спота от времени в строке до приёма, с"""
+        self._lag.append(lag)
+
+    def silent(self) -> float:
+        return time.monotonic() - self.last_line
+
+    def stats(self) -> dict:
+        return {"up": int(self.up), "lines": self.lines, "spots": self.spots,
+                "first": self.first, "copies": self.copies, "rejected": self.rejected,
+                "reconnects": self.reconnects, "silent_sec": self.silent(),
+                "lag_p50": metrics.pct(self._lag, 0.5), "lag_p95": metrics.pct(self._lag, 0.95)}
+
+    @abc.abstractmethod
+    async def _session(self):
+        """Одно подключение: читает строки в _line, пока узел не отвалится"""
+
+
+class SocketIOSource(Source):
+    kind = "socketio"
+
+    def __init__(self, url: str, **kw):
+        super().__init__(url, **kw)
+        # один клиент на всё время жизни; переподключения — наши, с Backoff
+        self._sio = socketio.AsyncClient(reconnection=False, logger=False, engineio_logger=False)
+        self._sio.on("new_spot", self._on_spot)
+
+    async def _on_spot(self, msg):
+        self._line(msg if isinstance(msg, str) else repr(msg))
+
+    async def _session(self):
+        await self._sio.connect(self.url, transports=["websocket"])
+        self._connected()
+        try:
+            while self._sio.connected:
+                if self.silent() > self.idle:
+                    raise TimeoutError(f"silent for {self.idle:.0f} s")
+                await asyncio.sleep(min(1.0, self.idle / 4))
+        finally:
+            await self._sio.disconnect()
+
+
+class TelnetSource(Source):
+    """telnet://host:port — логин позывным, дальше строки «DX de …»"""
+    kind = "telnet"
+
+    def __init__(self, url: str, call: str, *, login_timeout: float = 10.0, **kw):
+        super().__init__(url, **kw)
+        u = urlsplit(url)
+        self.host, self.port = u.hostname, u.port or 23
+        self.call = u.username or call
+        self.login_timeout = login_timeout
+
+    async def _login(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Ждём приглашения «login:»/«call:» (узлы без него — по таймауту)"""
+        buf = b""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.login_timeout
+        while not PROMPT_RE.search(buf.rstrip()[-64:]):
+            left = deadline - loop.time()
+            if left <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(1024), left)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                raise ConnectionError("closed before login")
+            buf += chunk
+        writer.write(f"{self.call}\r\n".encode())
+        await writer.drain()
+
+    async def _session(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.login_timeout)
+        try:
+            await self._login(reader, writer)
+            self._connected()
+            while True:
+                try:
+                    raw = await asyncio.wait_for(reader.readline(), self.idle)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"silent for {self.idle:.0f} s") from None
+                if not raw:
+                    return
+                line = raw.decode("utf-8", "replace").strip("\r\n\x07 ")
+                self._line(dx_to_wire(line) if line.startswith("DX de") else None)
+        finally:
+            writer.close()
+
+
+def open_source(url: str, call: str, **kw) -> Source:
+    """По схеме URL: telnet:// — TelnetSource, http(s)/ws(s) — SocketIOSource"""
+    scheme = urlsplit(url).scheme
+    if scheme == "telnet":
+        return TelnetSource(url, call, **kw)
+    if scheme in ("http", "https", "ws", "wss"):
+        return SocketIOSource(url, **kw)
+    raise ValueError(f"unknown spot source: {url}")
+
+
+class Ingest:
+    """Все источники → разбор → общий dedup «первый побеждает» → push(spot)"""
+
+    def __init__(self, sources: list[Source], parser: spots.WireParser,
+                 push: Callable[[spots.Spot], None], window: int = 4096):
+        self.sources = sources
+        self.parser = parser
+        self.push = push
+        self.window = window
+        self._seen: OrderedDict[int, None] = OrderedDict()
+
+    def on_line(self, src: Source, line: str):
+        s = self.parser.parse(line)
+        if s is None:
+            src.rejected += 1
+            log.debug("%s: spot line rejected: %r", src.name, line)
+            return
+        src.spots += 1
+        lag = _lag(s.time, s.ts)
+        if lag is not None:
+            src.observe_lag(lag)
+        if s.key in self._seen:
+            src.copies += 1                     # уже пришёл с другого узла
+            return
+        self._seen[s.key] = None
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+        src.first += 1
+        self.push(s)
+
+    async def run(self):
+        await asyncio.gather(*(src.run(self.on_line) for src in self.sources))
+
+    def stats(self) -> dict[str, dict]:
+        return {src.name: src.stats() for src in self.sources}
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Спот кластера: компактная запись, разбор строки и кольцо последних спотов.
+
+Строка кластера (Socket.IO, событие new_spot) — поля через «|»:
+    позывной|время|частота кГц|мода|?|RDA|?|текст|спотер
+WireParser проверяет поля и вместо исключения в колбэке считает
+отброшенные строки по причинам. Мода остаётся как у кластера (FT8,
+RTTY … — для показа и архива); к модам фильтров её приводит norm_mode
+там, где споты сверяются с фильтрами. Мода и RDA интернируются:
+значений мало, а спотов в памяти — тысячи.
+
+Recent — кольцо фиксированной ёмкости с вторичными индексами по RDA,
+позывному и диапазону; вытесняемый спот удаляется из индексов за O(1)
+(номера в индексе идут в порядке вставки — старейший всегда слева).
+"""
+
+import re
+import sys
+import time
+from bisect import bisect_right
+from collections import deque
+from typing import Callable, Iterator
+
+import dedup
+from rda_catalog import catalog
+
+CALL_RE = re.compile(r"[A-Z0-9]+(?:/[A-Z0-9]+)*")
+RDA_RE = re.compile(r"[A-Z]{2}-\d{2}")
+
+# любительские диапазоны, кГц: (начало, конец, название)
+BANDS = (
+    (1800, 2000, "160m"), (3500, 4000, "80m"), (5250, 5450, "60m"),
+    (7000, 7300, "40m"), (10100, 10150, "30m"), (14000, 14350, "20m"),
+    (18068, 18168, "17m"), (21000, 21450, "15m"), (24890, 24990, "12m"),
+    (28000, 29700, "10m"), (50000, 54000, "6m"), (144000, 148000, "2m"),
+)
+_BAND_LO = [b[0] for b in BANDS]
+BAND_NAMES = frozenset(b[2] for b in BANDS)
+
+# фильтр чата знает CW / SSB / DIGI: боковые полосы — SSB, вся цифра
+# (RTTY, FT8, PSK31 …) — DIGI; AM, FM и прочее остаются как есть
+_MODE_ALIAS = {"USB": "SSB", "LSB": "SSB", "RTTY": "DIGI", "FT8": "DIGI", "FT4": "DIGI",
+               "JT65": "DIGI", "MSK144": "DIGI"}
+
+
+def norm_mode(mode: str) -> str:
+    """Мода спота → мода фильтров чатов (в верхнем регистре)"""
+    mode = mode.upper()
+    return "DIGI" if mode.startswith("PSK") else _MODE_ALIAS.get(mode, mode)
+
+
+def band_of(freq: float) -> str | None:
+    """Название диапазона по частоте в кГц; None — вне любительских"""
+    i = bisect_right(_BAND_LO, freq) - 1
+    if i >= 0 and freq <= BANDS[i][1]:
+        return BANDS[i][2]
+    return None
+
+
+class Spot:
+    """Один спот. key — 64-битный ключ дедупликации (dedup.key64 от
+    позывного, времени без «Z» и частоты с точностью 0.1 кГц),
+    mask — RDA-коды битами rda_catalog."""
+    __slots__ = ("callsign", "time", "freq", "mode", "rda", "codes", "mask",
+                 "text", "spotter", "key", "ts")
+
+    def __init__(self, callsign: str, time: str, freq: float, mode: str, rda: str,
+                 text: str, spotter: str, key: int, ts: float):
+        self.callsign = callsign
+        self.time = time
+        self.freq = freq
+        self.mode = sys.intern(mode)
+        self.rda = sys.intern(rda)
+        self.codes = tuple(sys.intern(c) for c in rda.split())
+        self.mask = catalog.mask(self.codes)
+        self.text = text
+        self.spotter = spotter
+        self.key = key
+        self.ts = ts                    # время приёма, time.time()
+
+    def astuple(self) -> tuple:
+        """Поля для Spot(*t) — так спот ходит по шине fanout.py"""
+        return (self.callsign, self.time, self.freq, self.mode, self.rda,
+                self.text, self.spotter, self.key, self.ts)
+
+    @property
+    def band(self) -> str | None:
+        return band_of(self.freq)
+
+    def fields(self) -> dict:
+        """Поля для templates.Template.render"""
+        return {"callsign": self.callsign, "mode": self.mode, "freq": self.freq,
+                "rda": self.rda, "text": self.text, "spotter": self.spotter,
+                "time": self.time}
+
+
+class WireParser:
+    """Разбор строк кластера; плохие строки считаются, а не роняют колбэк"""
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected: dict[str, int] = {}     # причина → строк
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def parse(self, msg) -> Spot | None:
+        if not isinstance(msg, str):
+            return self._reject("type")
+        p = msg.split("|")
+        if len(p) < 9:
+            return self._reject("fields")
+        rda = p[5].strip().upper()
+        if not rda or rda == "?":
+            return self._reject("no_rda")      # спот без района — не для нас
+        if not all(RDA_RE.fullmatch(c) for c in rda.split()):
+            return self._reject("rda")
+        callsign = p[0].strip().upper()
+        if not CALL_RE.fullmatch(callsign):
+            return self._reject("callsign")
+        try:
+            freq = float(p[2])
+        except ValueError:
+            return self._reject("freq")
+        if not 0 < freq < 1e7:                 # NaN тоже не проходит
+            return self._reject("freq")
+        mode = p[3].strip().upper()
+        if not mode or len(mode) > 16:
+            return self._reject("mode")
+        self.accepted += 1
+        t = p[1].strip()
+        # ключ — из нормализованных полей: один спот с разных узлов
+        # кластера (sources.py) даёт один ключ
+        return Spot(callsign, t, freq, mode, rda, p[7].strip(), p[8].strip(),
+                    dedup.key64(callsign, t.upper().rstrip("Z"), f"{freq:.1f}"), time.time())
+
+    def stats(self) -> dict:
+        return {"accepted": self.accepted, **self.rejected}
+
+
+class Recent:
+    """Последние capacity спотов в памяти с индексами по RDA/позывному/диапазону"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf: list[Spot | None] = [None] * capacity
+        self._seq = 0                               # номер следующего спота
+        self._by_rda: dict[str, deque[int]] = {}
+        self._by_call: dict[str, deque[int]] = {}
+        self._by_band: dict[str, deque[int]] = {}
+
+    def __len__(self) -> int:
+        return min(self._seq, self.capacity)
+
+    def _keys(self, s: Spot) -> Iterator[tuple[dict, str]]:
+        for code in set(s.codes):
+            yield self._by_rda, code
+        yield self._by_call, s.callsign
+        band = s.band
+        if band is not None:
+            yield self._by_band, band
+
+    def add(self, s: Spot):
+        seq = self._seq
+        slot = seq % self.capacity
+        old = self._buf[slot]
+        if old is not None:                         # вытесняем старейший
+            for idx, k in self._keys(old):
+                d = idx[k]
+                d.popleft()
+                if not d:
+                    del idx[k]
+        self._buf[slot] = s
+        for idx, k in self._keys(s):
+            d = idx.get(k)
+            if d is None:
+                d = idx[k] = deque()
+            d.append(seq)
+        self._seq = seq + 1
+
+    def query(self, rda: str | None = None, callsign: str | None = None,
+              band: str | None = None, since: float = 0.0, limit: int = 20,
+              where: Callable[[Spot], bool] | None = None) -> list[Spot]:
+        """Новые → старые. Перебирается самый короткий из подходящих
+        индексов, остальные условия проверяются на споте."""
+        lists = [idx.get(k, ()) for idx, k in ((self._by_rda, rda),
+                                               (self._by_call, callsign),
+                                               (self._by_band, band)) if k]
+        if lists:
+            seqs = reversed(min(lists, key=len))
+        else:
+            seqs = range(self._seq - 1, self._seq - 1 - len(self), -1)
+        out: list[Spot] = []
+        for seq in seqs:
+            s = self._buf[seq % self.capacity]
+            if s.ts < since:
+                break                               # дальше только старее
+            if rda and rda not in s.codes:
+                continue
+            if callsign and s.callsign != callsign:
+                continue
+            if band and s.band != band:
+                continue
+            if where is not None and not where(s):
+                continue
+            out.append(s)
+            if len(out) >= limit:
+                break
+        return out
@@ -4,25 +4,98 @@
 SQLite‑хранилище (aiosqlite) — полностью совместимо с Python 3.13.
 """
 
-import datetime as dt
-from typing import List, Tuple
-import aiosqlite, config
-
-def _conn():
-    # Подключение с autocommit
-    return aiosqlite.connect(
-        config.DB_PATH,
-        timeout=30,
-        isolation_level=None
-    )
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+import aiosqlite, config, dedup, metrics, spots, templates
 
-SCHEMA = f"""
+# ───── Общее соединение ─────
+# Одно соединение на весь процесс: без connect/teardown и нового потока
+# на каждый запрос, а кэш подготовленных выражений sqlite3 (cached_statements)
+# живёт столько же, сколько процесс.
+PRAGMAS = """
 PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-16000;
+PRAGMA mmap_size=268435456;
+PRAGMA temp_store=MEMORY;
+"""
+
+_db: aiosqlite.Connection | None = None
+_timed = metrics.timed(metrics.STORAGE_SEC)      # время вызова по имени функции
+_lock = asyncio.Lock()
+# соединение текущей транзакции (см. transaction())
+_tx: ContextVar[aiosqlite.Connection | None] = ContextVar("storage_tx", default=None)
+
+async def _open() -> aiosqlite.Connection:
+    global _db
+    if _db is None:
+        db = await aiosqlite.connect(
+            config.DB_PATH,
+            timeout=30,
+            isolation_level=None,    # autocommit, транзакции — явно
+            cached_statements=256
+        )
+        await db.executescript(PRAGMAS)
+        _db = db
+    return _db
+
+@asynccontextmanager
+async def _conn():
+    """Общее соединение; внутри transaction() — соединение транзакции"""
+    db = _tx.get()
+    if db is not None:
+        yield db
+        return
+    async with _lock:
+        yield await _open()
+
+@asynccontextmanager
+async def transaction():
+    """Несколько операций одной транзакцией:
+
+        async with storage.transaction():
+            await storage.set_mode(cid, "CW")
+            await storage.add_rda(cid, "AD-01")
+    """
+    if _tx.get() is not None:      # вложенная — часть внешней
+        yield
+        return
+    async with _lock:
+        db = await _open()
+        token = _tx.set(db)
+        try:
+            await db.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                await db.execute("ROLLBACK")
+                raise
+            await db.execute("COMMIT")
+        finally:
+            _tx.reset(token)
+
+async def close_db():
+    global _db
+    await flush_seen()
+    async with _lock:
+        if _db is not None:
+            await _db.close()
+            _db = None
+
+SCHEMA = f"""
 CREATE TABLE IF NOT EXISTS users(
   chat_id     INTEGER PRIMARY KEY,
   first_name  TEXT,
   username    TEXT,
   fmt         TEXT DEFAULT '{config.DEFAULT_FMT.replace("'","''")}',
+  digest_sec  INTEGER DEFAULT 0,
+  repeat_min  INTEGER,
+  dormant_at  TEXT,
+  dormant_why TEXT,
+  dormant_subs TEXT,
   created_at  TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now'))
 );
 CREATE TABLE IF NOT EXISTS subscriptions(
@@ -35,24 +108,62 @@ CREATE TABLE IF NOT EXISTS filters_rda(
   rda     TEXT,
   PRIMARY KEY(chat_id, rda)
 );
+CREATE INDEX IF NOT EXISTS subscriptions_kind ON subscriptions(kind, chat_id);
+CREATE INDEX IF NOT EXISTS filters_rda_rda ON filters_rda(rda, chat_id);
 CREATE TABLE IF NOT EXISTS filters_misc(
   chat_id INTEGER PRIMARY KEY,
   mode  TEXT  DEFAULT 'ANY',
   f_min REAL  DEFAULT 0,
   f_max REAL  DEFAULT 99999
 );
-CREATE TABLE IF NOT EXISTS seen_spots(
-  hash TEXT PRIMARY KEY,
-  ts   INTEGER
+CREATE TABLE IF NOT EXISTS ann_state(
+  id       TEXT PRIMARY KEY,
+  hash     TEXT NOT NULL,
+  callsign TEXT,
+  rdas     TEXT DEFAULT ''
 );
+CREATE TABLE IF NOT EXISTS seen_hashes(
+  hash INTEGER PRIMARY KEY,
+  ts   INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seen_hashes_ts ON seen_hashes(ts);
 """
 
+# таблицы прежних выпусков, замещённые новыми (seen_spots → seen_hashes)
+DROPPED = ["seen_spots"]
+
+# колонки, добавленные после первого выпуска схемы: (таблица, колонка, тип)
+COLUMNS = [
+    ("users",     "digest_sec", "INTEGER DEFAULT 0"),
+    ("users",     "repeat_min", "INTEGER"),
+    ("users",     "dormant_at", "TEXT"),
+    ("users",     "dormant_why", "TEXT"),
+    ("users",     "dormant_subs", "TEXT"),
+]
+
+@_timed
 async def init_db():
-    """Создает таблицы при старте"""
+    """Создает таблицы при старте и поднимает dedup-кэш с диска"""
     async with _conn() as db:
         await db.executescript(SCHEMA)
+        for table, col, decl in COLUMNS:
+            cur = await db.execute(f"PRAGMA table_info({table})")
+            if col not in {r[1] for r in await cur.fetchall()}:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+        for table in DROPPED:
+            cur = await db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+            )
+            if await cur.fetchone():
+                await db.execute(f"DROP TABLE {table}")
+        cur = await db.execute(
+            "SELECT hash,ts FROM seen_hashes ORDER BY ts DESC LIMIT ?",
+            (config.SEEN_LIMIT,)
+        )
+        _seen.load(reversed(await cur.fetchall()))
 
 # ───── USERS ─────
+@_timed
 async def upsert_user(cid: int, first: str, uname: str | None):
     async with _conn() as db:
         await db.execute(
@@ -62,13 +173,17 @@ async def upsert_user(cid: int, first: str, uname: str | None):
             (cid, first, uname)
         )
 
+@_timed
 async def set_template(cid: int, tmpl: str):
+    """ValueError, если шаблон не компилируется (см. templates.py)"""
+    templates.compile_template(tmpl)
     async with _conn() as db:
         await db.execute(
             "UPDATE users SET fmt=? WHERE chat_id=?",
             (tmpl, cid)
         )
 
+@_timed
 async def get_template(cid: int) -> str:
     async with _conn() as db:
         cur = await db.execute(
@@ -78,7 +193,64 @@ async def get_template(cid: int) -> str:
         row = await cur.fetchone()
         return row[0] if row else config.DEFAULT_FMT
 
+@_timed
+async def set_digest(cid: int, sec: int):
+    """Окно дайджеста в секундах (0 — каждый спот отдельно)"""
+    async with _conn() as db:
+        await db.execute(
+            "INSERT INTO users(chat_id,digest_sec) VALUES(?,?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET digest_sec=excluded.digest_sec",
+            (cid, sec)
+        )
+
+@_timed
+async def get_digest(cid: int) -> int:
+    async with _conn() as db:
+        cur = await db.execute(
+            "SELECT digest_sec FROM users WHERE chat_id=?",
+            (cid,)
+        )
+        row = await cur.fetchone()
+        return (row[0] or 0) if row else 0
+
+@_timed
+async def load_digests() -> Dict[int, int]:
+    async with _conn() as db:
+        cur = await db.execute(
+            "SELECT chat_id,digest_sec FROM users WHERE digest_sec>0"
+        )
+        return dict(await cur.fetchall())
+
+@_timed
+async def set_repeat(cid: int, minutes: int | None):
+    """Окно подавления повторов в минутах (None — общее, 0 — выкл)"""
+    async with _conn() as db:
+        await db.execute(
+            "INSERT INTO users(chat_id,repeat_min) VALUES(?,?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET repeat_min=excluded.repeat_min",
+            (cid, minutes)
+        )
+
+@_timed
+async def get_repeat(cid: int) -> int | None:
+    async with _conn() as db:
+        cur = await db.execute(
+            "SELECT repeat_min FROM users WHERE chat_id=?",
+            (cid,)
+        )
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+@_timed
+async def load_repeats() -> Dict[int, int]:
+    async with _conn() as db:
+        cur = await db.execute(
+            "SELECT chat_id,repeat_min FROM users WHERE repeat_min IS NOT NULL"
+        )
+        return dict(await cur.fetchall())
+
 # ───── SUBSCRIPTIONS ─────
+@_timed
 async def change_sub(cid: int, kind: str, on: bool):
     async with _conn() as db:
         if on:
@@ -92,6 +264,7 @@ async def change_sub(cid: int, kind: str, on: bool):
                 (cid, kind)
             )
 
+@_timed
 async def subscribers(kind: str) -> List[int]:
     async with _conn() as db:
         cur = await db.execute(
@@ -100,7 +273,88 @@ async def subscribers(kind: str) -> List[int]:
         )
         return [r[0] for r in await cur.fetchall()]
 
+@_timed
+async def count_subscribers(kind: str) -> int:
+    async with _conn() as db:
+        cur = await db.execute(
+            "SELECT COUNT(*) FROM subscriptions WHERE kind=?",
+            (kind,)
+        )
+        return (await cur.fetchone())[0]
+
+# ───── «СПЯЩИЕ» ЧАТЫ ─────
+# бот заблокирован или чат удалён: подписки снимаются, но запоминаются
+# в users.dormant_subs — /start их возвращает
+@_timed
+async def set_dormant(cid: int, reason: str) -> List[str]:
+    """Снимает подписки чата; → снятые виды (ann/spot)"""
+    async with transaction():
+        async with _conn() as db:
+            cur = await db.execute(
+                "SELECT kind FROM subscriptions WHERE chat_id=? ORDER BY kind",
+                (cid,)
+            )
+            kinds = [r[0] for r in await cur.fetchall()]
+            await db.execute("DELETE FROM subscriptions WHERE chat_id=?", (cid,))
+            # уже спящий — не затираем запомненные подписки
+            await db.execute(
+                "INSERT INTO users(chat_id,dormant_at,dormant_why,dormant_subs) "
+                "VALUES(?,strftime('%Y-%m-%dT%H:%M:%fZ','now'),?,?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET dormant_at=excluded.dormant_at, "
+                "dormant_why=excluded.dormant_why, dormant_subs=excluded.dormant_subs "
+                "WHERE users.dormant_at IS NULL",
+                (cid, reason, " ".join(kinds))
+            )
+            return kinds
+
+@_timed
+async def revive(cid: int) -> List[str]:
+    """Возвращает подписки спящего чата; → восстановленные виды"""
+    async with transaction():
+        async with _conn() as db:
+            cur = await db.execute(
+                "SELECT dormant_subs FROM users WHERE chat_id=? AND dormant_at IS NOT NULL",
+                (cid,)
+            )
+            row = await cur.fetchone()
+            if row is None:
+                return []
+            kinds = (row[0] or "").split()
+            await db.executemany(
+                "INSERT OR IGNORE INTO subscriptions(chat_id,kind) VALUES(?,?)",
+                [(cid, k) for k in kinds]
+            )
+            await db.execute(
+                "UPDATE users SET dormant_at=NULL, dormant_why=NULL, dormant_subs=NULL "
+                "WHERE chat_id=?",
+                (cid,)
+            )
+            return kinds
+
+@_timed
+async def migrate_chat(old: int, new: int):
+    """Группа стала супергруппой: пользователь, подписки и фильтры — на
+    новый chat_id (строки, уже заведённые под новым id, остаются)"""
+    async with transaction():
+        async with _conn() as db:
+            for table in ("users", "subscriptions", "filters_rda", "filters_misc"):
+                await db.execute(
+                    f"UPDATE OR IGNORE {table} SET chat_id=? WHERE chat_id=?", (new, old)
+                )
+                await db.execute(f"DELETE FROM {table} WHERE chat_id=?", (old,))
+
+@_timed
+async def count_dormant() -> Dict[str, int]:
+    """Спящие чаты по причине"""
+    async with _conn() as db:
+        cur = await db.execute(
+            "SELECT dormant_why,COUNT(*) FROM users "
+            "WHERE dormant_at IS NOT NULL GROUP BY dormant_why"
+        )
+        return dict(await cur.fetchall())
+
 # ───── RDA FILTER ─────
+@_timed
 async def add_rda(cid: int, *codes: str) -> List[str]:
     if not codes:
         return []
@@ -115,6 +369,7 @@ async def add_rda(cid: int, *codes: str) -> List[str]:
         )
         return [r[0] for r in await cur.fetchall()]
 
+@_timed
 async def get_rda(cid: int) -> List[str]:
     async with _conn() as db:
         cur = await db.execute(
@@ -123,6 +378,7 @@ async def get_rda(cid: int) -> List[str]:
         )
         return [r[0] for r in await cur.fetchall()]
 
+@_timed
 async def clear_rda(cid: int):
     """Очищает все RDA-фильтры пользователя"""
     async with _conn() as db:
@@ -138,6 +394,7 @@ async def _ensure_misc(db, cid: int):
         (cid,)
     )
 
+@_timed
 async def set_mode(cid: int, mode: str | None):
     async with _conn() as db:
         await _ensure_misc(db, cid)
@@ -146,6 +403,7 @@ async def set_mode(cid: int, mode: str | None):
             ("ANY" if mode is None else mode, cid)
         )
 
+@_timed
 async def set_band(cid: int, lo: float | None, hi: float | None):
     async with _conn() as db:
         await _ensure_misc(db, cid)
@@ -158,6 +416,7 @@ async def set_band(cid: int, lo: float | None, hi: float | None):
             )
         )
 
+@_timed
 async def misc(cid: int) -> Tuple[str, float, float]:
     async with _conn() as db:
         cur = await db.execute(
@@ -167,28 +426,141 @@ async def misc(cid: int) -> Tuple[str, float, float]:
         row = await cur.fetchone()
         return ("ANY", 0.0, 99999.0) if row is None else row
 
-# ───── DE‑DUPLICATION ─────
-async def is_new(hsh: str) -> bool:
-    now = int(dt.datetime.utcnow().timestamp())
+# ───── ИНДЕКС ФИЛЬТРОВ ─────
+@_timed
+async def load_filters() -> Dict[int, Tuple[List[str], str, float, float]]:
+    """Все фильтры разом — для filters.SubscriberIndex при старте"""
+    out: Dict[int, Tuple[List[str], str, float, float]] = {}
+    async with _conn() as db:
+        cur = await db.execute("SELECT chat_id,mode,f_min,f_max FROM filters_misc")
+        for cid, mode, lo, hi in await cur.fetchall():
+            out[cid] = ([], mode, lo, hi)
+        cur = await db.execute("SELECT chat_id,rda FROM filters_rda")
+        for cid, code in await cur.fetchall():
+            out.setdefault(cid, ([], "ANY", 0.0, 99999.0))[0].append(code)
+    return out
+
+@_timed
+async def load_templates() -> Dict[int, str]:
+    """Нестандартные шаблоны; битые (сохранённые до проверки) пропускаются"""
     async with _conn() as db:
         cur = await db.execute(
-            "SELECT 1 FROM seen_spots WHERE hash=?",
-            (hsh,)
+            "SELECT chat_id,fmt FROM users WHERE fmt IS NOT NULL AND fmt<>?",
+            (config.DEFAULT_FMT,)
         )
-        if await cur.fetchone():
-            return False
-        await db.execute(
-            "INSERT INTO seen_spots(hash,ts) VALUES(?,?)",
-            (hsh, now)
-        )
-        # очищаем старое
-        cur = await db.execute("SELECT COUNT(*) FROM seen_spots")
-        cnt = (await cur.fetchone())[0]
-        if cnt > config.SEEN_LIMIT:
-            delta = cnt - config.SEEN_LIMIT
-            await db.execute(
-                "DELETE FROM seen_spots "
-                "WHERE hash IN (SELECT hash FROM seen_spots ORDER BY ts LIMIT ?)",
-                (delta,)
+        rows = await cur.fetchall()
+    out: Dict[int, str] = {}
+    for cid, fmt in rows:
+        try:
+            templates.compile_template(fmt)
+        except ValueError:
+            continue
+        out[cid] = fmt
+    return out
+
+# ───── ПОДБОР ПОДПИСЧИКОВ НА СПОТ ─────
+# То же, что allowed() по каждому чату, но одним запросом по всей базе:
+# кандидаты — чаты с подходящим RDA (индекс filters_rda_rda) плюс чаты
+# без RDA-фильтра; мода и диапазон — условиями по filters_misc.
+MATCH_SQL = """
+SELECT s.chat_id, u.fmt
+FROM subscriptions s
+LEFT JOIN filters_misc m ON m.chat_id = s.chat_id
+LEFT JOIN users u ON u.chat_id = s.chat_id
+WHERE s.kind = 'spot'
+  AND (m.mode IS NULL OR m.mode = 'ANY' OR m.mode = ?)
+  AND (m.f_min IS NULL OR m.f_min <= ?)
+  AND (m.f_max IS NULL OR m.f_max >= ?)
+  AND (
+    s.chat_id IN (SELECT chat_id FROM filters_rda WHERE rda IN ({codes}))
+    OR NOT EXISTS (SELECT 1 FROM filters_rda r WHERE r.chat_id = s.chat_id)
+  )
+"""
+
+@_timed
+async def match_spot(rda: str, mode: str, freq: float) -> List[Tuple[int, str]]:
+    """(chat_id, шаблон) подписчиков, чьи фильтры пропускают спот"""
+    codes = rda.split() or [""]
+    sql = MATCH_SQL.format(codes=",".join("?" * len(codes)))
+    async with _conn() as db:
+        cur = await db.execute(sql, (spots.norm_mode(mode), freq, freq, *codes))
+        return [(cid, fmt or config.DEFAULT_FMT) for cid, fmt in await cur.fetchall()]
+
+# ───── АНОНСЫ ─────
+@_timed
+async def ann_state() -> Dict[str, Tuple[str, str, List[str]]]:
+    """id анонса → (хэш карточки, позывной, RDA-коды)"""
+    async with _conn() as db:
+        cur = await db.execute("SELECT id,hash,callsign,rdas FROM ann_state")
+        return {
+            r[0]: (r[1], r[2], (r[3] or "").split())
+            for r in await cur.fetchall()
+        }
+
+@_timed
+async def save_ann_state(upsert: Dict[str, Tuple[str, str, List[str]]],
+                         removed: List[str]):
+    """Применяет дельту одной транзакцией"""
+    async with transaction():
+        async with _conn() as db:
+            await db.executemany(
+                "INSERT INTO ann_state(id,hash,callsign,rdas) VALUES(?,?,?,?) "
+                "ON CONFLICT(id) DO UPDATE SET hash=excluded.hash, "
+                "callsign=excluded.callsign, rdas=excluded.rdas",
+                [(i, h, c, " ".join(r)) for i, (h, c, r) in upsert.items()]
             )
-        return True
+            await db.executemany(
+                "DELETE FROM ann_state WHERE id=?", [(i,) for i in removed]
+            )
+
+# ───── DE‑DUPLICATION ─────
+# В памяти — точные SEEN_LIMIT последних хэшей, на диск — пачками.
+_seen = dedup.SeenCache(
+    config.SEEN_LIMIT, config.SEEN_FLUSH_BATCH, config.SEEN_FLUSH_SEC
+)
+_seen_task: asyncio.Task | None = None
+_seen_full = asyncio.Event()                     # пачка набралась
+
+async def is_new(hsh: int) -> bool:
+    global _seen_task
+    if not _seen.add(hsh, int(time.time())):
+        return False
+    if _seen.full():
+        _seen_full.set()
+    if _seen_task is None or _seen_task.done():
+        _seen_task = asyncio.create_task(_seen_writer())
+    return True
+
+def seen_size() -> int:
+    """Хэшей в dedup-кэше"""
+    return len(_seen)
+
+async def _seen_writer():
+    # пачка по заполнению (is_new будит) или раз в flush_sec; пока есть что писать
+    while _seen.backlog():
+        if not _seen.due():
+            try:
+                await asyncio.wait_for(_seen_full.wait(), _seen.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+        _seen_full.clear()
+        await flush_seen()
+
+@_timed
+async def flush_seen():
+    """Сбрасывает накопленные хэши одной транзакцией и обрезает хвост по ts"""
+    rows = _seen.drain()
+    if not rows:
+        return
+    try:
+        async with transaction():
+            async with _conn() as db:
+                await db.executemany(
+                    "INSERT OR IGNORE INTO seen_hashes(hash,ts) VALUES(?,?)", rows
+                )
+                oldest = _seen.oldest_ts()
+                if oldest is not None:
+                    await db.execute("DELETE FROM seen_hashes WHERE ts < ?", (oldest,))
+    except BaseException:
+        _seen.requeue(rows)                     # не записали — запишет следующий сброс
+        raise
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Шаблоны спотов: проверка при сохранении и однократная компиляция.
+Шаблон разбирается string.Formatter'ом один раз; render() только
+склеивает литералы и format(value, spec) — без повторного разбора строки.
+"""
+
+from functools import lru_cache
+from string import Formatter
+
+import config
+
+FIELDS = ("callsign", "mode", "freq", "rda", "text", "spotter", "time")
+
+# пробный спот: те же типы, что и в on_spot (freq — float, остальное str)
+_SAMPLE = {
+    "callsign": "R0BI", "mode": "CW", "freq": 14025.0, "rda": "AD-01",
+    "text": "tnx", "spotter": "UA0AAA", "time": "1200Z",
+}
+_CONV = {"r": repr, "s": str, "a": ascii}
+
+
+class Template:
+    __slots__ = ("fmt", "_parts")
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        parts = []
+        try:
+            parsed = list(Formatter().parse(fmt))
+        except ValueError as e:
+            raise ValueError(f"ошибка разбора: {e}") from None
+        for lit, name, spec, conv in parsed:
+            if name is not None:
+                if name not in FIELDS:
+                    raise ValueError(
+                        f"неизвестное поле {{{name}}}, доступны: "
+                        + ", ".join(f"{{{f}}}" for f in FIELDS)
+                    )
+                if "{" in spec:
+                    raise ValueError("вложенные поля в формате не поддерживаются")
+                if conv and conv not in _CONV:
+                    raise ValueError(f"неизвестное преобразование !{conv}, доступны: !r, !s, !a")
+            parts.append((lit, name, spec, _CONV[conv] if conv else None))
+        self._parts = tuple(parts)
+        try:
+            self.render(**_SAMPLE)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"ошибка формата: {e}") from None
+
+    def render(self, **fields) -> str:
+        out = []
+        for lit, name, spec, conv in self._parts:
+            out.append(lit)
+            if name is not None:
+                v = fields[name]
+                out.append(format(conv(v) if conv else v, spec))
+        return "".join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_template(fmt: str) -> Template:
+    """Компилирует (и кэширует) шаблон; ValueError — шаблон негодный"""
+    return Template(fmt)
+
+
+DEFAULT = compile_template(config.DEFAULT_FMT)
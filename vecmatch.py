@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Векторный подбор подписчиков (SPOT_MATCH = "vector", нужен NumPy).
+
+VectorIndex — тот же filters.SubscriberIndex, но фильтры подписанных
+чатов дополнительно лежат столбцами NumPy: мода (код), lo, hi и
+RDA-маска (биты rda_catalog, слова uint64 — строка на слово, чтобы
+столбец одного кода читался подряд). Столбцы меняются вместе с
+корзинами индекса: добавление в конец, удаление — перестановкой
+последней строки на место удалённой.
+
+match_batch() считает матрицу споты × подписчики целиком:
+    диапазон: lo <= f <= hi;   мода: ANY или совпадает;
+    RDA: фильтр пуст или есть бит хотя бы одного кода спота.
+Семантика — ровно allowed()/Filter.match (см. bench/vec_bench.py).
+
+MicroBatcher собирает споты, пришедшие в пределах окна (миллисекунды),
+в одну пачку: воркеры spot_queue ждут каждый свой результат.
+"""
+
+import asyncio
+from typing import Any, Callable
+
+import numpy as np
+
+import filters
+from rda_catalog import catalog
+from spots import norm_mode
+
+_ONE = np.uint64(1)
+
+
+class VectorIndex(filters.SubscriberIndex):
+    def __init__(self):
+        super().__init__()
+        self._row: dict[int, int] = {}              # chat_id → строка
+        self._n = 0
+        self._modes: dict[str, int] = {"ANY": 0}
+        self._alloc(64, 1)
+
+    def _alloc(self, cap: int, words: int):
+        """Новые столбцы ёмкости cap (words слов маски), старые данные — копией"""
+        n = self._n
+        cid = np.zeros(cap, np.int64)
+        mode = np.zeros(cap, np.int32)
+        lo = np.zeros(cap, np.float64)
+        hi = np.zeros(cap, np.float64)
+        any_rda = np.zeros(cap, np.bool_)
+        bits = np.zeros((words, cap), np.uint64)
+        if n:
+            cid[:n], mode[:n], lo[:n], hi[:n] = self._cid[:n], self._mode[:n], self._lo[:n], self._hi[:n]
+            any_rda[:n] = self._any_rda[:n]
+            bits[:self._bits.shape[0], :n] = self._bits[:, :n]
+        self._cid, self._mode, self._lo, self._hi = cid, mode, lo, hi
+        self._any_rda, self._bits = any_rda, bits
+
+    # ───── столбцы следуют за корзинами SubscriberIndex ─────
+    def _link(self, cid: int, f: filters.Filter):
+        super()._link(cid, f)
+        words, cap = self._bits.shape
+        need = max(words, (f.mask.bit_length() + 63) // 64)
+        if self._n == cap or need > words:
+            self._alloc(cap * 2 if self._n == cap else cap, need)
+            words = need
+        r = self._row[cid] = self._n
+        self._n += 1
+        self._cid[r] = cid
+        self._mode[r] = self._modes.setdefault(f.mode, len(self._modes))
+        self._lo[r] = f.lo
+        self._hi[r] = f.hi
+        self._any_rda[r] = not f.mask
+        self._bits[:, r] = np.frombuffer(f.mask.to_bytes(words * 8, "little"), "<u8")
+
+    def _unlink(self, cid: int, f: filters.Filter):
+        super()._unlink(cid, f)
+        r = self._row.pop(cid, None)
+        if r is None:
+            return
+        last = self._n - 1
+        if r != last:                               # последняя строка — на место r
+            for col in (self._cid, self._mode, self._lo, self._hi, self._any_rda):
+                col[r] = col[last]
+            self._bits[:, r] = self._bits[:, last]
+            self._row[int(self._cid[r])] = r
+        self._n = last
+
+    # ───── поиск ─────
+    def match_batch(self, spots: list[tuple[str, str, float]]) -> list[list[int]]:
+        """Для каждого (rda, mode, freq) — chat_id подходящих подписчиков"""
+        n = self._n
+        if not n or not spots:
+            return [[] for _ in spots]
+        freq = np.array([s[2] for s in spots], np.float64)[:, None]
+        mode = np.array([self._modes.get(norm_mode(s[1]), -1) for s in spots], np.int32)[:, None]
+        lo, hi, modes = self._lo[:n], self._hi[:n], self._mode[:n]
+        ok = (lo <= freq) & (freq <= hi) & ((modes == 0) | (modes == mode))
+        words = self._bits.shape[0]
+        hit = np.empty(n, np.bool_)
+        for row, (rda, _, _) in zip(ok, spots):
+            hit[:] = self._any_rda[:n]
+            for code in set(rda.split()):
+                i = catalog.ids.get(code)
+                if i is None or i >= words * 64:
+                    continue                        # такого кода нет ни в одном фильтре
+                hit |= ((self._bits[i >> 6, :n] >> np.uint64(i & 63)) & _ONE).astype(np.bool_)
+            row &= hit
+        cid = self._cid[:n]
+        return [cid[np.flatnonzero(row)].tolist() for row in ok]
+
+
+class MicroBatcher:
+    """Копит запросы window секунд (или до max_batch) и считает их одним
+    вызовом fn(список) → список результатов в том же порядке"""
+
+    def __init__(self, fn: Callable[[list], list], window: float = 0.003,
+                 max_batch: int = 64):
+        self.fn = fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[Any, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Приём апдейтов через webhook вместо long polling (config.WEBHOOK_URL).
+
+Встроенный aiohttp-сервер в том же процессе, что cluster_loop/ann_loop:
+  • POST WEBHOOK_PATH — апдейт от Telegram; заголовок
+    X-Telegram-Bot-Api-Secret-Token сверяется с секретом (иначе 401);
+  • ответ 200 — сразу после разбора, обработка (dp.feed_update) — в фоне,
+    одновременно не больше concurrency апдейтов;
+  • в работе больше max_pending — 503: Telegram повторит доставку позже,
+    очередь в памяти не растёт без предела;
+  • stop(grace) — перестать принимать, дождаться начатых апдейтов
+    (не дольше grace секунд), остальные отменить.
+"""
+
+import asyncio
+import hmac
+import logging
+import secrets
+import signal
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+import metrics
+
+log = logging.getLogger("RDA-bot.webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class Webhook:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str = "",
+                 concurrency: int = 32, max_pending: int = 1000):
+        self.dp = dp
+        self.bot = bot
+        # секрет из настроек или новый на каждый запуск (set_webhook передаёт его Telegram)
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.max_pending = max_pending
+        self._sem = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._runner: web.AppRunner | None = None
+        self._closed = asyncio.Event()
+        self._closing = False
+        self.accepted = self.rejected = self.invalid = self.overloaded = 0
+        self.handled = self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    # ───── приём ─────
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=401)
+        if self._closing or len(self._tasks) >= self.max_pending:
+            self.overloaded += 1
+            return web.Response(status=503)
+        t0 = time.perf_counter()
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:                      # не JSON или не апдейт (pydantic)
+            self.invalid += 1
+            return web.Response(status=400)
+        self.accepted += 1
+        task = asyncio.create_task(self._process(update, t0))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update, t0: float):
+        async with self._sem:
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.handled += 1
+            except Exception:
+                self.failed += 1
+                log.exception("update %s", update.update_id)
+            finally:
+                metrics.WEBHOOK_SEC.observe(time.perf_counter() - t0)
+
+    # ───── жизненный цикл ─────
+    async def start(self, host: str, port: int, path: str):
+        app = web.Application()
+        app.router.add_post(path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.close)
+            except (NotImplementedError, RuntimeError):  # Windows, не главный поток
+                pass
+        log.info("Webhook listening on %s:%s%s", host, port, path)
+
+    def close(self):
+        """Запросить остановку: wait_closed() вернётся"""
+        self._closed.set()
+
+    async def wait_closed(self):
+        await self._closed.wait()
+
+    async def stop(self, grace: float = 10.0):
+        self._closing = True
+        pending = set(self._tasks)
+        if pending:
+            log.info("Webhook: finishing %s updates", len(pending))
+            _, left = await asyncio.wait(pending, timeout=grace)
+            for t in left:
+                t.cancel()
+            await asyncio.gather(*left, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> dict:
+        return {"accepted": self.accepted, "rejected": self.rejected, "invalid": self.invalid,
+                "overloaded": self.overloaded, "handled": self.handled, "failed": self.failed}